@@ -8,10 +8,16 @@ import socket
 import subprocess
 import json
 import rancher
+import threading
 from sys import platform
 from .common import random_str, wait_for_template_to_be_created
+from .discovery import ResourceIndex
+from .pool import WarmPool
+from .teardown import TeardownQueue
+from .schema_cache import CachedSchemaClient
+from .waiter import pause, watch_client, watch_kubernetes
 from kubernetes.client import ApiClient, Configuration, CustomObjectsApi, \
-    ApiextensionsV1Api
+    RbacAuthorizationV1Api
 from kubernetes.client.rest import ApiException
 from kubernetes.config.kube_config import KubeConfigLoader
 from rancher import ApiError
@@ -45,6 +51,28 @@ AUTH_URL = BASE_URL + '-public/localproviders/local?action=login'
 DEFAULT_TIMEOUT = 120
 DEFAULT_CATALOG = "https://github.com/rancher/integration-test-charts"
 WAIT_HTTP_ERROR_CODES = [404, 405]
+# the schemas of the default admin are cached for this role, so the entries
+# are reused by the next runs; other clients are cached per token
+ADMIN_CACHE_ROLE = "admin"
+# lease standard users from a pool filled in the background instead of
+# creating and logging in a new user in every test
+USER_POOL = os.environ.get("RANCHER_USER_POOL", "true").lower() == "true"
+USER_POOL_SIZE = int(os.environ.get("RANCHER_USER_POOL_SIZE", "4"))
+# delete the resources of a test in the background after it finished,
+# off by default: a test may then run while resources of earlier tests
+# still exist
+ASYNC_TEARDOWN = os.environ.get("RANCHER_ASYNC_TEARDOWN",
+                                "false").lower() == "true"
+# seconds a cached kubernetes ApiClient is used before its token is checked
+K8S_CLIENT_CHECK_INTERVAL = 300
+# lease the projects of admin_pc_factory from a pool filled in the
+# background instead of creating a new project in every test
+PROJECT_POOL = os.environ.get("RANCHER_PROJECT_POOL",
+                              "true").lower() == "true"
+PROJECT_POOL_SIZE = int(os.environ.get("RANCHER_PROJECT_POOL_SIZE", "4"))
+# set through actions, so not among the updatable fields of the schema
+PROJECT_ACTION_FIELDS = ("podSecurityPolicyTemplateId",)
+USER_ACTION_FIELDS = ("enabled", "mustChangePassword", "principalIds")
 
 
 class ManagementContext:
@@ -116,50 +144,176 @@ def admin_mc():
 def admin_cc(admin_mc):
     """Returns a ClusterContext for the local cluster for the default global
     admin user."""
-    cluster, client = cluster_and_client('local', admin_mc.client)
+    cluster, client = cluster_and_client('local', admin_mc.client,
+                                         cache_role=ADMIN_CACHE_ROLE)
     return ClusterContext(admin_mc, cluster, client)
 
 
-def cluster_and_client(cluster_id, mgmt_client):
+def cluster_and_client(cluster_id, mgmt_client, cache_role=None):
     cluster = mgmt_client.by_id_cluster(cluster_id)
     url = cluster.links.self + '/schemas'
-    client = rancher.Client(url=url,
-                            verify=False,
-                            token=mgmt_client.token)
+    client = CachedSchemaClient(url=url,
+                                verify=False,
+                                token=mgmt_client.token,
+                                cache_role=cache_role)
     return cluster, client
 
 
 def user_project_client(user, project):
     """Returns a project level client for the user"""
-    return rancher.Client(url=project.links.self+'/schemas', verify=False,
-                          token=user.client.token)
+    return CachedSchemaClient(url=project.links.self+'/schemas',
+                              verify=False, token=user.client.token)
 
 
 def user_cluster_client(user, cluster):
     """Returns a cluster level client for the user"""
-    return rancher.Client(url=cluster.links.self+'/schemas', verify=False,
-                          token=user.client.token)
+    return CachedSchemaClient(url=cluster.links.self+'/schemas',
+                              verify=False, token=user.client.token)
+
+
+def _new_project(cc):
+    """Creates a project in the cluster of ClusterContext cc, returns its
+    ProjectContext and what the project looked like when it was new"""
+    admin = cc.management.client
+    p = admin.create_project(name='test-' + random_str(),
+                             clusterId=cc.cluster.id)
+    p = admin.wait_success(p)
+    wait_for_condition("BackingNamespaceCreated", "True",
+                       cc.management.client, p)
+    assert p.state == 'active'
+    p = admin.reload(p)
+    url = p.links.self + '/schemas'
+    baseline = {"state": _project_state(admin, p)}
+    prtbs = admin.list_project_role_template_binding(projectId=p.id).data
+    baseline["prtbs"] = {b.id for b in prtbs}
+    pc = ProjectContext(cc, p, CachedSchemaClient(
+        url=url, verify=False, token=admin.token,
+        cache_role=ADMIN_CACHE_ROLE))
+    baseline["types"] = _sweep_types(pc)
+    # objects rancher creates in every project stay
+    baseline["resources"] = {r.id for r in
+                             _project_resources(pc, baseline["types"])}
+    return pc, baseline
+
+
+def _project_state(admin, p):
+    """Everything a test may change on a project: the updatable fields,
+    labels and annotations included, and the fields set by actions"""
+    fields = admin.schema.types["project"].resourceFields
+    names = [n for n, f in fields.items() if getattr(f, "update", False)]
+    return {n: repr(getattr(p, n, None))
+            for n in names + list(PROJECT_ACTION_FIELDS)}
+
+
+def _delete_all(client, resources):
+    for resource in resources:
+        try:
+            client.delete(resource)
+        except ApiError as e:
+            code = e.error.status
+            if code == 409 and "namespace will automatically be purged " \
+                    in e.error.message:
+                pass
+            elif code not in WAIT_HTTP_ERROR_CODES:
+                raise e
+
+
+def _sweep_types(pc):
+    """The project schema types whose objects outlive the namespaces of
+    the project, those without a required namespaceId"""
+    types = []
+    for name, schema in pc.client.schema.types.items():
+        if "GET" not in getattr(schema, "collectionMethods", []) or \
+                "DELETE" not in getattr(schema, "resourceMethods", []):
+            continue
+        namespace = getattr(schema.resourceFields, "namespaceId", None)
+        if namespace is not None and getattr(namespace, "required", False):
+            continue
+        types.append(name)
+    return types
+
+
+def _project_resources(pc, types):
+    """Everything a test left in the project, for the given schema types"""
+    found = []
+    for name in types:
+        try:
+            found += pc.client.list(name).data
+        except ApiError:
+            continue
+    return found
+
+
+def _sweep_project(pooled):
+    """Deletes the namespaces, resources and role bindings a test added to
+    a pooled project. Returns a fresh entry for the pool, or None when the
+    project can't be reused."""
+    pc, baseline = pooled
+    cc = pc.cluster
+    admin = cc.management.client
+    p = admin.by_id_project(pc.project.id)
+    # a project the test changed is replaced instead of reset
+    if p is None or p.state != 'active' or \
+            _project_state(admin, p) != baseline["state"]:
+        return None
+    _delete_all(cc.client, cc.client.list_namespace(projectId=p.id).data)
+    wait_for(lambda: len(cc.client.list_namespace(projectId=p.id)) == 0,
+             fail_handler=lambda: "namespaces of {} not removed".format(p.id))
+
+    # namespaced objects went away with the namespaces
+    def added():
+        return [r for r in _project_resources(pc, baseline["types"])
+                if r.id not in baseline["resources"]]
+
+    _delete_all(pc.client, added())
+    wait_for(lambda: len(added()) == 0,
+             fail_handler=lambda: "resources of {} not removed".format(p.id))
+    prtbs = admin.list_project_role_template_binding(projectId=p.id).data
+    _delete_all(admin, [b for b in prtbs if b.id not in baseline["prtbs"]])
+    url = p.links.self + '/schemas'
+    return ProjectContext(cc, p, CachedSchemaClient(
+        url=url, verify=False, token=admin.token,
+        cache_role=ADMIN_CACHE_ROLE)), baseline
+
+
+@pytest.fixture(scope="session")
+def project_pool(admin_mc, request):
+    """Pool of ready projects per cluster id for the default global admin,
+    created in the background and swept when a test returns them.
+    RANCHER_PROJECT_POOL_SIZE projects are kept ready per cluster."""
+    admin = admin_mc.client
+
+    def _create(cluster_id):
+        cluster, client = cluster_and_client(cluster_id, admin,
+                                             cache_role=ADMIN_CACHE_ROLE)
+        return _new_project(ClusterContext(admin_mc, cluster, client))
+
+    pool = WarmPool(create=_create,
+                    recycle=lambda cluster_id, pooled: _sweep_project(pooled),
+                    destroy=lambda cluster_id, pooled: admin.delete(
+                        pooled[0].project),
+                    size=PROJECT_POOL_SIZE)
+    if PROJECT_POOL:
+        pool.warm('local')
+    request.addfinalizer(pool.close)
+    return pool
 
 
 @pytest.fixture
-def admin_pc_factory(admin_cc, remove_resource):
+def admin_pc_factory(admin_cc, remove_resource, project_pool, request):
     """Returns a ProjectContext for a newly created project in the local
     cluster for the default global admin user. The project will be deleted
-    when this fixture is cleaned up."""
+    when this fixture is cleaned up, or with RANCHER_PROJECT_POOL (the
+    default) leased from project_pool and swept after the test."""
     def _admin_pc():
-        admin = admin_cc.management.client
-        p = admin.create_project(name='test-' + random_str(),
-                                 clusterId=admin_cc.cluster.id)
-        p = admin.wait_success(p)
-        wait_for_condition("BackingNamespaceCreated", "True",
-                           admin_cc.management.client, p)
-        assert p.state == 'active'
-        remove_resource(p)
-        p = admin.reload(p)
-        url = p.links.self + '/schemas'
-        return ProjectContext(admin_cc, p, rancher.Client(url=url,
-                                                          verify=False,
-                                                          token=admin.token))
+        if not PROJECT_POOL:
+            pc, _ = _new_project(admin_cc)
+            remove_resource(pc.project)
+            return pc
+        pooled = project_pool.lease(admin_cc.cluster.id)
+        request.addfinalizer(
+            lambda: project_pool.release(admin_cc.cluster.id, pooled))
+        return pooled[0]
     return _admin_pc
 
 
@@ -177,9 +331,10 @@ def admin_system_pc(admin_mc):
     assert len(plist) == 1
     p = plist.data[0]
     url = p.links.self + '/schemas'
-    return ProjectContext(admin_cc, p, rancher.Client(url=url,
-                                                      verify=False,
-                                                      token=admin.token))
+    return ProjectContext(admin_cc, p,
+                          CachedSchemaClient(url=url, verify=False,
+                                             token=admin.token,
+                                             cache_role=ADMIN_CACHE_ROLE))
 
 
 @pytest.fixture
@@ -188,35 +343,162 @@ def user_mc(user_factory):
     return user_factory()
 
 
-@pytest.fixture
-def user_factory(admin_mc, remove_resource):
-    """Returns a factory for creating new users which a ManagementContext for
-    a newly created standard user is returned.
-
-    This user and globalRoleBinding will be cleaned up automatically by the
-    fixture remove_resource.
-    """
-    def _create_user(globalRoleId='user'):
-        admin = admin_mc.client
-        # User creation will fail if password < minimum (default: 12) or
-        # username == password. Since random_str concatenates a random number
-        # plus seconds since epoch, this ensures no collisions
-        username = random_str() + "username"
-        password = random_str() + "password"
-        user = admin.create_user(username=username, password=password)
-        remove_resource(user)
+def _new_user(admin, globalRoleId):
+    """Creates a user bound to globalRoleId and returns its
+    ManagementContext, the user's globalRoleBinding and what the user
+    looked like when it was new"""
+    # User creation will fail if password < minimum (default: 12) or
+    # username == password. Since random_str concatenates a random number
+    # plus seconds since epoch, this ensures no collisions
+    username = random_str() + "username"
+    password = random_str() + "password"
+    user = admin.create_user(username=username, password=password)
+    try:
         grb = admin.create_global_role_binding(
             userId=user.id, globalRoleId=globalRoleId)
-        remove_resource(grb)
         response = requests.post(AUTH_URL, json={
             'username': username,
             'password': password,
             'responseType': 'json',
         }, verify=False)
         protect_response(response)
-        client = rancher.Client(url=BASE_URL, token=response.json()['token'],
-                                verify=False)
-        return ManagementContext(client, user=user)
+    except Exception:
+        admin.delete(user)
+        raise
+    client = rancher.Client(url=BASE_URL, token=response.json()['token'],
+                            verify=False)
+    user = admin.reload(user)
+    return ManagementContext(client, user=user), grb, \
+        _user_state(admin, client, user)
+
+
+def _user_state(admin, client, user):
+    """Everything a test may change on a user besides its bindings: the
+    updatable fields, the fields set through actions, the group
+    memberships, the tokens and the preferences"""
+    fields = admin.schema.types["user"].resourceFields
+    names = [n for n, f in fields.items() if getattr(f, "update", False)]
+    state = {n: repr(getattr(user, n, None))
+             for n in names + list(USER_ACTION_FIELDS)}
+    if "groupMember" in admin.schema.types:
+        state["groups"] = sorted(
+            g.id for principal in user.principalIds or []
+            for g in admin.list_group_member(principalId=principal).data)
+    state["tokens"] = sorted(t.id for t in client.list_token().data)
+    state["preferences"] = sorted(
+        (p.name, p.value) for p in client.list_preference().data)
+    return state
+
+
+def _user_bindings(admin, user):
+    bindings = admin.list_global_role_binding(userId=user.id).data
+    for list_bindings in (admin.list_cluster_role_template_binding,
+                          admin.list_project_role_template_binding):
+        bindings += list_bindings(userId=user.id).data
+        for principal in user.principalIds or []:
+            bindings += list_bindings(userPrincipalId=principal).data
+    return bindings
+
+
+def _user_k8s_bindings(k8s_client, user, grb):
+    """The RoleBindings and ClusterRoleBindings of the local cluster that
+    grant something to user, except those owned by its globalRoleBinding"""
+    rbac = RbacAuthorizationV1Api(k8s_client)
+    bindings = rbac.list_cluster_role_binding().items + \
+        rbac.list_role_binding_for_all_namespaces().items
+    left = []
+    for binding in bindings:
+        if not any(s.kind == "User" and s.name == user.id
+                   for s in binding.subjects or []):
+            continue
+        if any(o.kind == "GlobalRoleBinding" and o.name == grb.id
+               for o in binding.metadata.owner_references or []):
+            continue
+        left.append("{}/{}".format(binding.metadata.namespace or "",
+                                   binding.metadata.name))
+    return left
+
+
+def _reset_user(admin, k8s_client, globalRoleId, pooled):
+    """Removes every binding a test added to a pooled user, and waits for
+    the k8s rbac they created to be removed. Returns a fresh entry for
+    the pool, or None when the user can't be reused."""
+    ctx, grb, baseline = pooled
+    user = admin.by_id_user(ctx.user.id)
+    if user is None:
+        return None
+    try:
+        # a user the test changed is replaced instead of reset
+        if _user_state(admin, ctx.client, user) != baseline:
+            return None
+    except ApiError:
+        # the token was deleted or the user logged out
+        return None
+    bindings = [b for b in _user_bindings(admin, user) if b.id != grb.id]
+    if not any(b.id == grb.id for b in
+               admin.list_global_role_binding(userId=user.id).data):
+        return None
+    for binding in bindings:
+        try:
+            admin.delete(binding)
+        except ApiError as e:
+            if e.error.status not in WAIT_HTTP_ERROR_CODES:
+                raise e
+    # the next test must not see the rbac of the previous one
+    wait_for(lambda: [b.id for b in _user_bindings(admin, user)] ==
+             [grb.id], fail_handler=lambda: "bindings of {} not removed"
+             .format(user.id))
+    # the rbac of the bindings is removed by controllers, asynchronously
+    rbac = RbacAuthorizationV1Api(k8s_client)
+    watch_kubernetes(rbac.list_cluster_role_binding)
+    watch_kubernetes(rbac.list_role_binding_for_all_namespaces)
+    wait_for(lambda: not _user_k8s_bindings(k8s_client, user, grb),
+             fail_handler=lambda: "k8s bindings of {} not removed: {}"
+             .format(user.id, _user_k8s_bindings(k8s_client, user, grb)))
+    client = rancher.Client(url=BASE_URL, token=ctx.client.token,
+                            verify=False)
+    return ManagementContext(client, user=user), grb, baseline
+
+
+@pytest.fixture(scope="session")
+def user_pool(admin_mc, request):
+    """Pool of standard users per globalRoleId, created in the background
+    and reset when a test returns them; users whose fields, tokens,
+    preferences or groups changed are replaced. RANCHER_USER_POOL_SIZE
+    users are kept ready per role."""
+    admin = admin_mc.client
+    pool = WarmPool(create=lambda role: _new_user(admin, role),
+                    recycle=lambda role, pooled: _reset_user(
+                        admin, admin_mc.k8s_client, role, pooled),
+                    destroy=lambda role, pooled: admin.delete(
+                        pooled[0].user),
+                    size=USER_POOL_SIZE)
+    if USER_POOL:
+        pool.warm('user')
+    request.addfinalizer(pool.close)
+    return pool
+
+
+@pytest.fixture
+def user_factory(admin_mc, remove_resource, user_pool, request):
+    """Returns a factory for creating new users which a ManagementContext for
+    a newly created standard user is returned.
+
+    With RANCHER_USER_POOL (the default) the user comes from user_pool and
+    goes back to it, without the bindings the test added, after the test.
+    Otherwise this user and globalRoleBinding will be cleaned up
+    automatically by the fixture remove_resource.
+    """
+    def _create_user(globalRoleId='user'):
+        if not USER_POOL:
+            ctx, grb, _ = _new_user(admin_mc.client, globalRoleId)
+            remove_resource(ctx.user)
+            remove_resource(grb)
+            return ctx
+        pooled = user_pool.lease(globalRoleId)
+        request.addfinalizer(
+            lambda: user_pool.release(globalRoleId, pooled))
+        return pooled[0]
 
     return _create_user
 
@@ -324,7 +606,7 @@ def wait_for(callback, timeout=DEFAULT_TIMEOUT, fail_handler=None):
     start = time.time()
     ret = callback()
     while ret is None or ret is False:
-        time.sleep(next(sleep_time))
+        pause(next(sleep_time))
         if time.time() - start > timeout:
             exception_msg = 'Timeout waiting for condition.'
             if fail_handler:
@@ -345,10 +627,11 @@ def _sleep_time():
 
 
 def wait_until_available(client, obj, timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     start = time.time()
     sleep = 0.01
     while True:
-        time.sleep(sleep)
+        pause(sleep)
         sleep *= 2
         if sleep > 2:
             sleep = 2
@@ -366,10 +649,41 @@ def wait_until_available(client, obj, timeout=DEFAULT_TIMEOUT):
             raise Exception(msg)
 
 
+@pytest.fixture(scope="session")
+def teardown_queue(admin_mc, request):
+    """Deletes the resources of finished tests in the background, fails
+    the session when it ends with resources left or deletions failed."""
+    queue = TeardownQueue(admin_mc.client, timeout=DEFAULT_TIMEOUT)
+
+    def fin():
+        queue.close()
+        assert queue.pending == 0, \
+            "{} teardown batches still running".format(queue.pending)
+        assert not queue.leaks, \
+            "Resources still present after teardown:\n" + \
+            "\n".join(queue.leaks)
+        assert not queue.errors, "Teardown failed for:\n" + "\n".join(
+            "{}: {}".format(r, e) for r, e in queue.errors)
+
+    request.addfinalizer(fin)
+    return queue
+
+
+def _queue_cleanup(request, teardown_queue, ordered=False):
+    """Collects the resources of a test and hands them to teardown_queue,
+    as one batch, when the test finishes"""
+    resources = []
+    request.addfinalizer(
+        lambda: teardown_queue.submit(reversed(resources), ordered))
+    return resources.append
+
+
 @pytest.fixture
-def remove_resource(admin_mc, request):
+def remove_resource(admin_mc, request, teardown_queue):
     """Remove a resource after a test finishes even if the test fails."""
     client = admin_mc.client
+    if ASYNC_TEARDOWN:
+        return _queue_cleanup(request, teardown_queue)
 
     def _cleanup(resource):
         def clean():
@@ -404,13 +718,19 @@ def remove_resouce_func(request):
     return _cleanup
 
 
+@pytest.fixture(scope="session")
+def k8s_resource_index(admin_mc):
+    """Plural resource names of the local cluster by group, version and
+    kind, read from API discovery once per group version"""
+    return ResourceIndex(admin_mc.k8s_client)
+
+
 @pytest.fixture
-def raw_remove_custom_resource(admin_mc, request):
+def raw_remove_custom_resource(admin_mc, request, k8s_resource_index):
     """Remove a custom resource, using the k8s client, after a test finishes
     even if the test fails. This should only be used if remove_resource, which
     exclusively uses the rancher api, cannot be used"""
     def _cleanup(resource):
-        k8s_v1_client = ApiextensionsV1Api(admin_mc.k8s_client)
         k8s_client = CustomObjectsApi(admin_mc.k8s_client)
 
         def clean():
@@ -426,20 +746,19 @@ def raw_remove_custom_resource(admin_mc, request):
             group = api_version_parts[0]
             version = api_version_parts[1]
 
-            crd_list = k8s_v1_client.\
-                list_custom_resource_definition().items
-
-            crd = list(filter(lambda x: x.spec.names.kind == kind and
-                              x.spec.group == group and
-                              x.spec.versions[0].name == version,
-                              crd_list))[0]
+            plural, namespaced = k8s_resource_index.lookup(group, version,
+                                                           kind)
             try:
-                k8s_client.delete_namespaced_custom_object(
-                    group,
-                    version,
-                    metadata["namespace"],
-                    crd.spec.names.plural,
-                    metadata["name"])
+                if namespaced:
+                    k8s_client.delete_namespaced_custom_object(
+                        group,
+                        version,
+                        metadata["namespace"],
+                        plural,
+                        metadata["name"])
+                else:
+                    k8s_client.delete_cluster_custom_object(
+                        group, version, plural, metadata["name"])
             except ApiException as e:
                 body = json.loads(e.body)
                 if body["code"] not in WAIT_HTTP_ERROR_CODES:
@@ -469,7 +788,9 @@ def remove_resource_session(admin_mc, request):
 @pytest.fixture()
 def wait_remove_resource(admin_mc, request, timeout=DEFAULT_TIMEOUT):
     """Remove a resource after a test finishes even if the test fails and
-    wait until deletion is confirmed."""
+    wait until deletion is confirmed. This stays synchronous with
+    RANCHER_ASYNC_TEARDOWN, tests rely on the resource being gone, and on
+    the deletion order, before the next finalizer or test runs."""
     client = admin_mc.client
 
     def _cleanup(resource):
@@ -489,11 +810,17 @@ def wait_remove_resource(admin_mc, request, timeout=DEFAULT_TIMEOUT):
 
 
 @pytest.fixture()
-def list_remove_resource(admin_mc, request):
+def list_remove_resource(admin_mc, request, teardown_queue):
     """Takes list of resources to remove & supports reordering of the list """
     client = admin_mc.client
 
     def _cleanup(resource):
+        if ASYNC_TEARDOWN:
+            # the list may still be reordered until the test finishes
+            request.addfinalizer(
+                lambda: teardown_queue.submit(resource, ordered=True))
+            return
+
         def clean():
             for item in resource:
                 try:
@@ -507,11 +834,12 @@ def list_remove_resource(admin_mc, request):
 
 
 def wait_for_condition(condition_type, status, client, obj, timeout=45):
+    watch_client(client)
     start = time.time()
     obj = client.reload(obj)
     sleep = 0.01
     while not find_condition(condition_type, status, obj):
-        time.sleep(sleep)
+        pause(sleep)
         sleep *= 2
         if sleep > 2:
             sleep = 2
@@ -532,7 +860,7 @@ def wait_until(cb, timeout=DEFAULT_TIMEOUT, backoff=True):
     while time.time() < start_time + timeout and cb() is False:
         if backoff:
             interval *= 2
-        time.sleep(interval)
+        pause(interval)
 
 
 def find_condition(condition_type, status, obj):
@@ -548,13 +876,53 @@ def find_condition(condition_type, status, obj):
     return False
 
 
+_k8s_clients = {}
+_k8s_pool_managers = {}
+_k8s_lock = threading.Lock()
+
+
+def _k8s_token_valid(rancher_client, entry):
+    if time.time() - entry["checked"] < K8S_CLIENT_CHECK_INTERVAL:
+        return True
+    try:
+        token = rancher_client.by_id_token(entry["token"])
+    except ApiError:
+        return False
+    if token is None or token.expired:
+        return False
+    entry["checked"] = time.time()
+    return True
+
+
 def kubernetes_api_client(rancher_client, cluster_name):
+    """Returns an ApiClient for the cluster, authenticated with a
+    kubeconfig generated for the token of rancher_client. Clients are kept
+    per (token, cluster) until their kubeconfig token expires, and the
+    clients of a cluster share their connection pool."""
+    key = (rancher_client.token, cluster_name)
+    with _k8s_lock:
+        entry = _k8s_clients.get(key)
+    if entry is not None and _k8s_token_valid(rancher_client, entry):
+        return entry["client"]
     c = rancher_client.by_id_cluster(cluster_name)
     kc = c.generateKubeconfig()
-    loader = KubeConfigLoader(config_dict=yaml.full_load(kc.config))
+    config = yaml.full_load(kc.config)
+    loader = KubeConfigLoader(config_dict=config)
     client_configuration = type.__call__(Configuration)
     loader.load_and_set(client_configuration)
     k8s_client = ApiClient(configuration=client_configuration)
+    # the token is sent per request, so connections can be shared
+    pool_key = (client_configuration.host, client_configuration.ssl_ca_cert,
+                client_configuration.verify_ssl)
+    with _k8s_lock:
+        pool_manager = _k8s_pool_managers.setdefault(
+            pool_key, k8s_client.rest_client.pool_manager)
+        k8s_client.rest_client.pool_manager = pool_manager
+        _k8s_clients[key] = {
+            "client": k8s_client,
+            "token": config['users'][0]['user']['token'].split(':')[0],
+            "checked": time.time(),
+        }
     return k8s_client
 
 
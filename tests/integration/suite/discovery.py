@@ -0,0 +1,51 @@
+import threading
+
+
+class ResourceIndex:
+    """Maps group, version and kind to the plural resource name, from the
+    discovery document of the group version. Each group version is read
+    once; a lookup that misses reads it again, in case the resource was
+    added since, e.g. by a CRD installed during the session.
+    """
+
+    def __init__(self, api_client):
+        self.api_client = api_client
+        # (group, version) -> {kind: (plural, namespaced)}
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def _discover(self, group, version):
+        path = "/apis/{}/{}".format(group, version) if group \
+            else "/api/{}".format(version)
+        data = self.api_client.call_api(
+            path, "GET", auth_settings=["BearerToken"],
+            response_type="object", _return_http_data_only=True)
+        kinds = {}
+        for resource in data.get("resources", []):
+            # subresources such as status share the kind of their parent
+            if "/" in resource["name"]:
+                continue
+            kinds[resource["kind"]] = (resource["name"],
+                                       resource["namespaced"])
+        with self._lock:
+            self._index[(group, version)] = kinds
+        return kinds
+
+    def lookup(self, group, version, kind):
+        """Returns (plural, namespaced) of a kind, raises KeyError if the
+        server does not serve it"""
+        with self._lock:
+            kinds = self._index.get((group, version))
+        if kinds is None or kind not in kinds:
+            kinds = self._discover(group, version)
+        if kind not in kinds:
+            raise KeyError("{} is not served by {}/{}".format(
+                kind, group, version))
+        return kinds[kind]
+
+    def plural(self, group, version, kind):
+        return self.lookup(group, version, kind)[0]
+
+    def clear(self):
+        with self._lock:
+            self._index = {}
@@ -0,0 +1,105 @@
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WarmPool:
+    """Keeps ready made objects per key, so tests lease one instead of
+    waiting for it to be created. Objects are created in the background,
+    and returned objects are recycled in the background: recycle(key, obj)
+    returns the object to put back in the pool, or None to destroy it.
+    """
+
+    def __init__(self, create, recycle, destroy, size=4, max_workers=8):
+        self._create = create
+        self._recycle = recycle
+        self._destroy = destroy
+        self.size = size
+        self._idle = defaultdict(list)
+        # objects being created or recycled per key
+        self._pending = defaultdict(int)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def warm(self, key):
+        """Start creating objects for key up to the pool size"""
+        with self._lock:
+            if self._closed:
+                return
+            missing = self.size - len(self._idle[key]) - self._pending[key]
+            self._pending[key] += max(0, missing)
+        for _ in range(missing):
+            self._executor.submit(self._fill, key)
+
+    def _fill(self, key):
+        try:
+            obj = self._create(key)
+        except Exception as e:
+            print("Unable to create a pooled object for {}: {}".format(
+                key, e))
+            with self._lock:
+                self._pending[key] -= 1
+            return
+        self._put(key, obj)
+
+    def _put(self, key, obj):
+        with self._lock:
+            self._pending[key] -= 1
+            if not self._closed:
+                self._idle[key].append(obj)
+                return
+        self._safe_destroy(key, obj)
+
+    def _safe_destroy(self, key, obj):
+        try:
+            self._destroy(key, obj)
+        except Exception as e:
+            print("Unable to destroy a pooled object for {}: {}".format(
+                key, e))
+
+    def lease(self, key):
+        """An idle object for key, or a new one when none is ready"""
+        with self._lock:
+            obj = self._idle[key].pop() if self._idle[key] else None
+        if obj is None:
+            obj = self._create(key)
+        self.warm(key)
+        return obj
+
+    def release(self, key, obj):
+        """Give a leased object back, it is recycled in the background"""
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._pending[key] += 1
+        if closed:
+            self._safe_destroy(key, obj)
+            return
+        self._executor.submit(self._return, key, obj)
+
+    def _return(self, key, obj):
+        try:
+            recycled = self._recycle(key, obj)
+        except Exception as e:
+            print("Unable to recycle a pooled object for {}: {}".format(
+                key, e))
+            recycled = None
+        if recycled is not None:
+            self._put(key, recycled)
+            return
+        with self._lock:
+            self._pending[key] -= 1
+        self._safe_destroy(key, obj)
+        self.warm(key)
+
+    def close(self):
+        """Destroy the idle objects, once the background work finished"""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            idle = [(k, o) for k, objs in self._idle.items() for o in objs]
+            self._idle.clear()
+        for key, obj in idle:
+            self._safe_destroy(key, obj)
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import rancher
+import requests
+
+SCHEMA_CACHE = os.environ.get("RANCHER_SCHEMA_CACHE", "true").lower() == "true"
+CACHE_DIR = os.environ.get(
+    "RANCHER_SCHEMA_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "rancher-schema-cache"))
+# entries younger than this are used without asking the server, older ones
+# are revalidated with If-None-Match or downloaded again
+MAX_AGE = int(os.environ.get("RANCHER_SCHEMA_CACHE_MAX_AGE", "60"))
+SCOPE_PLACEHOLDER = "__SCOPE_ID__"
+SCOPE_URL = re.compile(r"/projects/[^/:]+:([^/]+)/schemas/?$")
+
+_entries = {}
+_versions = {}
+_lock = threading.Lock()
+
+
+def server_version(url):
+    """Version of the rancher server behind url, looked up once per run"""
+    root = url.split("/v3")[0]
+    with _lock:
+        if root in _versions:
+            return _versions[root]
+    try:
+        r = requests.get(root + "/rancherversion", verify=False, timeout=10)
+        version = "{Version}-{GitCommit}".format(**r.json())
+    except Exception:
+        version = "unknown"
+    with _lock:
+        _versions[root] = version
+    return version
+
+
+def scope_id(url):
+    """
+    Project part of the <cluster>:<project> id of a project schema url.
+    Schemas of the projects of a cluster only differ in it, so they share
+    one cache entry.
+    """
+    match = SCOPE_URL.search(url)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def _scope_pattern(id):
+    return re.compile(r"(?<=[/:])" + re.escape(id) + r"(?=[/\"?])")
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+class CachedSchemaClient(rancher.Client):
+    """
+    rancher.Client that keeps its schema in an on-disk cache keyed by
+    server version, url and cache_role, or the token when no role is
+    given. The schema depends on the rights of the caller, so clients may
+    only share a cache_role when they have the same rights. Fresh entries
+    are used as is, stale ones are revalidated with a conditional GET when
+    the server sent an ETag for the same url. reload_schema() always
+    downloads the schema again.
+    """
+
+    def __init__(self, *args, cache_role=None, **kw):
+        self._force_reload = False
+        self._etag = None
+        self.cache_role = cache_role
+        super().__init__(*args, **kw)
+
+    def reload_schema(self):
+        self._force_reload = True
+        try:
+            super().reload_schema()
+        finally:
+            self._force_reload = False
+
+    def __getattr__(self, name):
+        # a shared project entry may come from a project where the token
+        # had fewer rights, refresh once before reporting a missing method
+        if name.startswith("_") or self.__dict__.get("schema") is None or \
+                self.__dict__.get("_refreshed_for_missing", True) is not False:
+            raise AttributeError(name)
+        self._refreshed_for_missing = True
+        self.reload_schema()
+        return getattr(self, name)
+
+    def _get_response(self, url, data=None):
+        r = super()._get_response(url, data)
+        self._etag = r.headers.get("ETag")
+        return r
+
+    def _cache_key(self):
+        url = self._url
+        id = scope_id(url)
+        if id is not None:
+            url = _scope_pattern(id).sub(SCOPE_PLACEHOLDER, url)
+        if self.cache_role is not None:
+            owner = "role:" + self.cache_role
+        else:
+            owner = "token:" + (getattr(self, "token", None) or "")
+        h = hashlib.sha1()
+        for part in (server_version(self._url), url, owner):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _cache_file(self, key):
+        return os.path.join(CACHE_DIR, "schema-" + key + ".json")
+
+    def _read_entry(self, key):
+        with _lock:
+            if key in _entries:
+                return _entries[key]
+        try:
+            with open(self._cache_file(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with _lock:
+            _entries[key] = entry
+        return entry
+
+    def _write_entry(self, key, entry):
+        with _lock:
+            _entries[key] = entry
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=CACHE_DIR)
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp, self._cache_file(key))
+        except OSError as e:
+            print("Unable to write schema cache: {}".format(e))
+
+    def _to_entry_text(self, text):
+        id = scope_id(self._url)
+        if id is None:
+            return text
+        return _scope_pattern(id).sub(SCOPE_PLACEHOLDER, text)
+
+    def _from_entry_text(self, text):
+        id = scope_id(self._url)
+        if id is None:
+            return text
+        return text.replace(SCOPE_PLACEHOLDER, id)
+
+    def _revalidate(self, key, entry):
+        headers = dict(self._headers)
+        headers["If-None-Match"] = entry["etag"]
+        r = self._session.get(self._url, auth=self._auth, headers=headers)
+        if r.status_code == 304:
+            entry = dict(entry, checked=time.time())
+            self._write_entry(key, entry)
+            return entry["text"]
+        schema_url = r.headers.get("X-API-Schemas")
+        if r.status_code != 200 or \
+                (schema_url is not None and schema_url != self._url):
+            return None
+        self._etag = r.headers.get("ETag")
+        self._cache_schema(r.text)
+        return self._to_entry_text(r.text)
+
+    def _get_cached_schema(self):
+        if not SCHEMA_CACHE or self._force_reload:
+            return None
+        key = self._cache_key()
+        entry = self._read_entry(key)
+        if entry is None:
+            return None
+        text = None
+        if time.time() - entry["checked"] < MAX_AGE:
+            text = entry["text"]
+        elif entry.get("etag") and entry.get("url") == self._url:
+            # the ETag of a schema shared by the projects of a cluster
+            # only matches for the project it was downloaded from
+            text = self._revalidate(key, entry)
+        if text is None:
+            return None
+        self._refreshed_for_missing = False
+        return self._from_entry_text(text)
+
+    def _cache_schema(self, text):
+        if not SCHEMA_CACHE:
+            return
+        self._write_entry(self._cache_key(), {
+            "url": self._url,
+            "etag": self._etag,
+            "checked": time.time(),
+            "text": self._to_entry_text(text),
+        })
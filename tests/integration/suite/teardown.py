@@ -0,0 +1,151 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rancher import ApiError
+
+WAIT_HTTP_ERROR_CODES = [404, 405]
+# resources are deleted in this order, lower first; anything not listed
+# goes between bindings and namespaces
+DELETE_ORDER = {
+    "globalRoleBinding": 0,
+    "clusterRoleTemplateBinding": 0,
+    "projectRoleTemplateBinding": 0,
+    "groupRoleBinding": 0,
+    "app": 1,
+    "multiClusterApp": 1,
+    "namespace": 3,
+    "project": 4,
+    "cluster": 5,
+    "user": 6,
+    "globalRole": 6,
+    "roleTemplate": 6,
+}
+DEFAULT_ORDER = 2
+IN_USE = "in use"
+
+
+def _describe(resource):
+    return "{} {} ({})".format(getattr(resource, "type", "?"),
+                               getattr(resource, "id", "?"),
+                               getattr(resource, "name", None) or "")
+
+
+class TeardownQueue:
+    """Deletes the resources of finished tests in the background. The
+    resources a test registered form a batch; a batch is deleted in
+    DELETE_ORDER phases, each phase waits until the deletions of the
+    previous one are confirmed, batches run concurrently. close() waits
+    for every batch; leaks and errors list what could not be deleted.
+    """
+
+    def __init__(self, client, timeout=120, max_workers=8):
+        self.client = client
+        self.timeout = timeout
+        self.leaks = []
+        self.errors = []
+        self._lock = threading.Lock()
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, resources, ordered=False):
+        """Queue resources for deletion. ordered deletes them one after
+        the other in the given order instead of by DELETE_ORDER."""
+        resources = list(resources)
+        if not resources:
+            return
+        future = self._executor.submit(self._delete_batch, resources,
+                                       ordered)
+        with self._lock:
+            self._futures.append(future)
+
+    def _phases(self, resources, ordered):
+        if ordered:
+            return [[r] for r in resources]
+        phases = {}
+        for resource in resources:
+            order = DELETE_ORDER.get(getattr(resource, "type", None),
+                                     DEFAULT_ORDER)
+            phases.setdefault(order, []).append(resource)
+        return [phases[k] for k in sorted(phases)]
+
+    def _delete_batch(self, resources, ordered):
+        for phase in self._phases(resources, ordered):
+            while phase:
+                pending, in_use = [], []
+                for resource in phase:
+                    result = self._delete(resource)
+                    if result == IN_USE:
+                        in_use.append(resource)
+                    elif result:
+                        pending.append(resource)
+                self._confirm(pending)
+                # a resource still used by another one of the phase, e.g.
+                # a node template by its node pool, is deleted again once
+                # the others are gone
+                if in_use and not pending:
+                    with self._lock:
+                        self.errors.extend(
+                            (_describe(r), "still in use (405)")
+                            for r in in_use)
+                    break
+                phase = in_use
+
+    def _delete(self, resource):
+        """Returns whether the deletion has to be confirmed, or IN_USE
+        when the server refused to delete a resource that is in use"""
+        try:
+            self.client.delete(resource)
+        except ApiError as e:
+            code = e.error.status
+            if code == 409 and "namespace will automatically be purged " \
+                    in e.error.message:
+                return False
+            if code == 405:
+                return IN_USE
+            if code != 404:
+                with self._lock:
+                    self.errors.append((_describe(resource), e))
+            return False
+        except Exception as e:
+            with self._lock:
+                self.errors.append((_describe(resource), e))
+            return False
+        return True
+
+    def _gone(self, resource):
+        try:
+            return self.client.reload(resource) is None
+        except ApiError as e:
+            return e.error.status in WAIT_HTTP_ERROR_CODES
+
+    def _confirm(self, pending):
+        start = time.time()
+        interval = .5
+        while pending:
+            pending = [r for r in pending if not self._gone(r)]
+            if not pending:
+                return
+            if time.time() - start > self.timeout:
+                with self._lock:
+                    self.leaks.extend(_describe(r) for r in pending)
+                return
+            time.sleep(interval)
+            interval = min(interval * 2, 5)
+
+    @property
+    def pending(self):
+        """The number of batches not deleted yet"""
+        with self._lock:
+            return len([f for f in self._futures if not f.done()])
+
+    def wait(self):
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """Wait for every queued deletion and stop the workers"""
+        self.wait()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1 @@
+../../validation/lib/waiter.py
\ No newline at end of file
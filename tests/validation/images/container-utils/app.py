@@ -1,13 +1,17 @@
-from flask import Flask, request
+from flask import Flask, jsonify, request
+from multiprocessing.pool import ThreadPool
 import os
 import random
 import requests
 import socket
+import time
 from string import ascii_letters, digits
-from subprocess import call
+from subprocess import PIPE, Popen, call
 
 
 TEMP_DIR = os.path.dirname(os.path.realpath(__file__)) + '/temp'
+# probes of one /probe batch running at the same time
+PROBE_WORKERS = 16
 app = Flask(__name__)
 
 
@@ -106,7 +110,80 @@ def health_check():
     return 'ping'
 
 
+def run_process(args):
+    process = Popen(args, stdout=PIPE, stderr=PIPE)
+    out, err = process.communicate()
+    return process.returncode, out.decode('utf-8'), err.decode('utf-8')
+
+
+def probe_dns(probe):
+    code, out, err = run_process(['dig', probe['host'], '+short'])
+    return {'ok': code == 0, 'output': out, 'error': err,
+            'answers': out.split()}
+
+
+def probe_http(probe):
+    # a new connection per probe, so a service or load balancer picks a
+    # backend for every request
+    try:
+        response = requests.get(probe['url'],
+                                timeout=probe.get('timeout', 10),
+                                verify=probe.get('verify', True),
+                                headers=probe.get('headers'))
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+    return {'ok': response.ok, 'status': response.status_code,
+            'output': response.text}
+
+
+def probe_ping(probe):
+    code, out, err = run_process(
+        ['ping', '-c', str(probe.get('count', 2)),
+         '-W', str(probe.get('timeout', 2)), probe['host']])
+    return {'ok': code == 0, 'output': out, 'error': err}
+
+
+PROBES = {'dns': probe_dns, 'http': probe_http, 'ping': probe_ping}
+
+
+def run_probe(probe):
+    start = time.time()
+    if probe.get('type') not in PROBES:
+        result = {'ok': False,
+                  'error': "Unknown probe type '{0}'".format(
+                      probe.get('type'))}
+    else:
+        try:
+            result = PROBES[probe['type']](probe)
+        except Exception as e:
+            result = {'ok': False, 'error': "Error: {0}".format(e)}
+    result['probe'] = probe
+    result['duration'] = time.time() - start
+    return result
+
+
+@app.route('/probe', methods=['POST'])
+def probe():
+    """
+    Runs a batch of probes concurrently, e.g.
+    [{"type": "dns", "host": "svc.ns"}, {"type": "ping", "host": "10.1.1.1"},
+     {"type": "http", "url": "http://svc.ns/name.html"}]
+    and returns their results in the same order.
+    """
+    probes = request.get_json(force=True)
+    if not isinstance(probes, list):
+        return "Expected a list of probes", 400
+    if not probes:
+        return jsonify(results=[])
+    pool = ThreadPool(min(PROBE_WORKERS, len(probes)))
+    try:
+        results = pool.map(run_probe, probes)
+    finally:
+        pool.close()
+    return jsonify(results=results)
+
+
 if __name__ == '__main__':
     if not os.path.isdir(TEMP_DIR):
         os.makedirs(TEMP_DIR)
-    app.run(debug=True, host='0.0.0.0')
+    app.run(debug=True, host='0.0.0.0', threaded=True)
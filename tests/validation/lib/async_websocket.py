@@ -0,0 +1,319 @@
+import asyncio
+import base64
+import codecs
+import hashlib
+import os
+import ssl
+import struct
+import threading
+from urllib.parse import urlparse
+
+from websocket import ABNF
+
+from lib.stream_buffer import MAX_LINES, StreamBuffer
+
+CHANNEL_PROTOCOL = "base64.channel.k8s.io"
+BINARY_PROTOCOL = "base64.binary.k8s.io"
+# channels of base64.channel.k8s.io
+STDIN, STDOUT, STDERR, ERROR, RESIZE = range(5)
+CONNECT_TIMEOUT = 20
+MESSAGE_TIMEOUT = 30
+# magic value of RFC 6455 for the Sec-WebSocket-Accept header
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class WebsocketError(Exception):
+    pass
+
+
+def encode_channel(channel, data):
+    """A base64.channel.k8s.io message writing data to a channel"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return str(channel) + base64.b64encode(data).decode("ascii")
+
+
+def decode_channel(message):
+    """The channel and the data of a base64.channel.k8s.io message"""
+    if isinstance(message, bytes):
+        message = message.decode("ascii")
+    return int(message[0]), base64.b64decode(message[1:])
+
+
+def decode_binary(message):
+    """The data of a base64.binary.k8s.io message"""
+    return base64.b64decode(message)
+
+
+def accept_key(key):
+    """The Sec-WebSocket-Accept answering a Sec-WebSocket-Key"""
+    return base64.b64encode(hashlib.sha1(
+        (key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+
+
+async def read_frame(reader):
+    """Read a frame from an asyncio stream, returns fin, opcode, payload"""
+    head = await reader.readexactly(2)
+    fin = head[0] & 0x80
+    opcode = head[0] & 0x0f
+    length = head[1] & 0x7f
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if head[1] & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return fin, opcode, payload
+
+
+class WebsocketSession(object):
+    """
+    A websocket on asyncio streams, so many exec, log and shell sessions
+    share one event loop instead of a thread each. Messages are decoded
+    according to the negotiated k8s subprotocol: stdout and stderr go to
+    self.buffer, the error channel to self.errors.
+    """
+
+    def __init__(self, url, subprotocols=None, cookie=None, headers=None,
+                 verify=False, max_lines=MAX_LINES):
+        self.url = url
+        self.subprotocols = subprotocols or []
+        self.cookie = cookie
+        self.headers = headers or {}
+        self.verify = verify
+        self.subprotocol = None
+        self.buffer = StreamBuffer(max_lines)
+        self.errors = StreamBuffer(max_lines)
+        self.connected = False
+        self.close_code = None
+        self._reader = None
+        self._writer = None
+        self._task = None
+        self._waiters = []
+        self._decoders = {}
+
+    def _ssl_context(self):
+        context = ssl.create_default_context()
+        if not self.verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def _request(self, parsed, key):
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        scheme = "https" if parsed.scheme == "wss" else "http"
+        lines = ["GET {} HTTP/1.1".format(path),
+                 "Host: {}".format(parsed.netloc),
+                 "Origin: {}://{}".format(scheme, parsed.netloc),
+                 "Upgrade: websocket",
+                 "Connection: Upgrade",
+                 "Sec-WebSocket-Key: {}".format(key),
+                 "Sec-WebSocket-Version: 13"]
+        if self.subprotocols:
+            lines.append("Sec-WebSocket-Protocol: {}".format(
+                ", ".join(self.subprotocols)))
+        if self.cookie:
+            lines.append("Cookie: {}".format(self.cookie))
+        for name, value in self.headers.items():
+            lines.append("{}: {}".format(name, value))
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+    async def connect(self, timeout=CONNECT_TIMEOUT):
+        parsed = urlparse(self.url)
+        secure = parsed.scheme == "wss"
+        port = parsed.port or (443 if secure else 80)
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                parsed.hostname, port,
+                ssl=self._ssl_context() if secure else None),
+            timeout)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        self._writer.write(self._request(parsed, key))
+        response = await asyncio.wait_for(
+            self._reader.readuntil(b"\r\n\r\n"), timeout)
+        lines = response.decode("latin-1").split("\r\n")
+        status = lines[0].split(" ", 2)
+        if len(status) < 2 or status[1] != "101":
+            self._writer.close()
+            raise WebsocketError("handshake with {} failed: {}".format(
+                self.url, lines[0]))
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        if headers.get("sec-websocket-accept") != accept_key(key):
+            self._writer.close()
+            raise WebsocketError("invalid Sec-WebSocket-Accept from {}"
+                                 .format(self.url))
+        self.subprotocol = headers.get("sec-websocket-protocol")
+        self.connected = True
+        self._task = asyncio.ensure_future(self._receive())
+        return self
+
+    async def _send_frame(self, data, opcode=ABNF.OPCODE_TEXT):
+        if not self.connected:
+            raise WebsocketError("websocket {} is closed".format(self.url))
+        self._writer.write(ABNF.create_frame(data, opcode).format())
+        await self._writer.drain()
+
+    async def send(self, message):
+        """Send a raw text message"""
+        await self._send_frame(message)
+
+    async def write(self, data, channel=STDIN):
+        """Write data to a channel of the session"""
+        if self.subprotocol == CHANNEL_PROTOCOL:
+            message = encode_channel(channel, data)
+        elif self.subprotocol == BINARY_PROTOCOL:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            message = base64.b64encode(data).decode("ascii")
+        else:
+            message = data
+        await self._send_frame(message)
+
+    async def _messages(self):
+        fragments = []
+        while True:
+            fin, opcode, payload = await read_frame(self._reader)
+            if opcode == ABNF.OPCODE_PING:
+                await self._send_frame(payload, ABNF.OPCODE_PONG)
+                continue
+            if opcode == ABNF.OPCODE_PONG:
+                continue
+            if opcode == ABNF.OPCODE_CLOSE:
+                if len(payload) >= 2:
+                    self.close_code = struct.unpack("!H", payload[:2])[0]
+                return
+            fragments.append(payload)
+            if fin:
+                yield b"".join(fragments)
+                fragments = []
+
+    def _decode(self, channel, data):
+        if channel not in self._decoders:
+            self._decoders[channel] = codecs.getincrementaldecoder(
+                "utf-8")(errors="replace")
+        return self._decoders[channel].decode(data)
+
+    def _handle(self, message):
+        if self.subprotocol == CHANNEL_PROTOCOL:
+            channel, data = decode_channel(message)
+        elif self.subprotocol == BINARY_PROTOCOL:
+            channel, data = STDOUT, decode_binary(message)
+        else:
+            channel, data = STDOUT, message
+        # an empty message only announces the channel
+        if not data:
+            return
+        if channel == ERROR:
+            self.errors.feed(self._decode(channel, data))
+        elif channel in (STDOUT, STDERR):
+            self.buffer.feed(self._decode(channel, data))
+
+    async def _receive(self):
+        try:
+            async for message in self._messages():
+                self._handle(message)
+                self._wake()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connected = False
+            self.buffer.close()
+            self.errors.close()
+            self._wake()
+            self._writer.close()
+
+    def _wake(self):
+        for watch, future in self._waiters:
+            if watch.event.is_set() and not future.done():
+                future.set_result(None)
+
+    async def _wait(self, watch, timeout, require_all):
+        if not watch.event.is_set():
+            waiter = (watch, asyncio.get_event_loop().create_future())
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter[1], timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiters.remove(waiter)
+        return watch.missing if require_all or not watch.found else []
+
+    async def wait_for(self, patterns, timeout=MESSAGE_TIMEOUT,
+                       require_all=True, include_buffered=True):
+        """
+        Wait until the patterns were received, returns the missing ones
+        :param require_all: if False any one of the patterns is enough
+        :param include_buffered: also match the output received earlier
+        """
+        watch = self.buffer.watch(patterns, require_all, include_buffered)
+        return await self._wait(watch, timeout, require_all)
+
+    async def run_command(self, command, checks, timeout=MESSAGE_TIMEOUT,
+                          terminator="\r"):
+        """
+        Type a command in a shell session, returns the missing checks
+        :param terminator: ends the line, a tty turns the carriage return
+        of the enter key into a newline; without a tty send "\n"
+        """
+        self.buffer.clear()
+        watch = self.buffer.watch(checks, include_buffered=False)
+        await self.write(command + terminator)
+        return await self._wait(watch, timeout, True)
+
+    async def close(self):
+        if self.connected:
+            try:
+                await self._send_frame(struct.pack("!H", 1000),
+                                       ABNF.OPCODE_CLOSE)
+            except (WebsocketError, ConnectionError):
+                pass
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+        elif self._writer is not None:
+            self._writer.close()
+
+
+class WebsocketLoop(object):
+    """
+    An event loop in a background thread for the websocket sessions of
+    synchronous tests: run() and gather() block until the coroutines
+    finished on the loop.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(
+            coroutine, self.loop).result(timeout)
+
+    def gather(self, *coroutines, **kwargs):
+        """Run coroutines concurrently, returns their results in order;
+        kwargs: timeout, return_exceptions"""
+
+        async def _gather():
+            return await asyncio.gather(
+                *coroutines,
+                return_exceptions=kwargs.get("return_exceptions", False))
+
+        return self.run(_gather(), kwargs.get("timeout"))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
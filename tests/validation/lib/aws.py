@@ -1,3 +1,4 @@
+import ast
 import base64
 import boto3
 import logging
@@ -5,7 +6,8 @@ import os
 import rsa
 import time
 from boto3.exceptions import Boto3Error
-from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError, WaiterError
 from .cloud_provider import CloudProviderBase
 from .node import Node
 
@@ -33,9 +35,20 @@ AWS_USER = os.environ.get("AWS_USER", AWS_DEFAULT_USER)
 AWS_VOLUME_SIZE = os.environ.get("AWS_VOLUME_SIZE", "50")
 AWS_INSTANCE_TYPE = os.environ.get("AWS_INSTANCE_TYPE", 't3a.medium')
 AWS_BASTION_INSTANCE_TYPE = os.environ.get("AWS_INSTANCE_TYPE", 'c5.2xlarge')
+# launch the nodes of create_multiple_nodes with a single run_instances call,
+# they share the name "<prefix>-batch" instead of "<prefix>-<index>"
+AWS_BATCH_CREATE = ast.literal_eval(
+    os.environ.get("AWS_BATCH_CREATE", "True"))
 
 AWS_WINDOWS_VOLUME_SIZE = os.environ.get("AWS_WINDOWS_VOLUME_SIZE", "100")
 AWS_WINDOWS_INSTANCE_TYPE = 't3.xlarge'
+# AWS publishes the password data within 15 minutes of the launch
+WINDOWS_PASSWORD_TIMEOUT = 15 * 60
+READY_NODE_WORKERS = 32
+# nodes without a public IP are the airgap and proxy nodes, only reachable
+# through a bastion, so Node.wait_for_port can't probe them from here;
+# they get this long to boot before the bastion connects to them
+PRIVATE_NODE_BOOT_WAIT = 60
 
 EKS_VERSION = os.environ.get("RANCHER_EKS_K8S_VERSION")
 EKS_ROLE_ARN = os.environ.get("RANCHER_EKS_ROLE_ARN")
@@ -98,14 +111,8 @@ class AmazonWebServices(CloudProviderBase):
         self.created_node = []
         self.created_keys = []
 
-    def create_node(self, node_name, ami=AWS_AMI, ssh_user=AWS_USER,
-                    key_name=None, wait_for_ready=True, public_ip=True, for_bastion=False):
-        volume_size = AWS_VOLUME_SIZE
-        instance_type = AWS_BASTION_INSTANCE_TYPE if for_bastion else AWS_INSTANCE_TYPE
-        if ssh_user == "Administrator":
-            volume_size = AWS_WINDOWS_VOLUME_SIZE
-            instance_type = AWS_WINDOWS_INSTANCE_TYPE
-
+    def _ssh_key_info(self, key_name):
+        """:return: key pair name, private key name, key and key path"""
         if key_name:
             # if cert private key
             if key_name.endswith('.pem'):
@@ -123,11 +130,21 @@ class AmazonWebServices(CloudProviderBase):
             ssh_private_key_name = key_name
             ssh_private_key = self.master_ssh_key
             ssh_private_key_path = self.master_ssh_key_path
+        return (key_name, ssh_private_key_name, ssh_private_key,
+                ssh_private_key_path)
+
+    def _run_instances_args(self, node_name, ami, ssh_user, key_name,
+                            public_ip, for_bastion=False, count=1):
+        volume_size = AWS_VOLUME_SIZE
+        instance_type = AWS_BASTION_INSTANCE_TYPE if for_bastion else AWS_INSTANCE_TYPE
+        if ssh_user == "Administrator":
+            volume_size = AWS_WINDOWS_VOLUME_SIZE
+            instance_type = AWS_WINDOWS_INSTANCE_TYPE
 
         args = {"ImageId": ami,
                 "InstanceType": instance_type,
-                "MinCount": 1,
-                "MaxCount": 1,
+                "MinCount": count,
+                "MaxCount": count,
                 "TagSpecifications": [
                     {'ResourceType': 'instance',
                      'Tags': [
@@ -159,57 +176,107 @@ class AmazonWebServices(CloudProviderBase):
             args["TagSpecifications"][0]["Tags"].append(
                 {'Key': 'kubernetes.io/cluster/c-abcde', 'Value': "owned"}
             )
+        return args
+
+    def _launch(self, node_name, ami, ssh_user, key_name, public_ip,
+                for_bastion=False, count=1):
+        """
+        Start count instances with a single run_instances call
+        :return: list of Nodes, in launch order
+        """
+        key_name, ssh_private_key_name, ssh_private_key, \
+            ssh_private_key_path = self._ssh_key_info(key_name)
+        args = self._run_instances_args(node_name, ami, ssh_user, key_name,
+                                        public_ip, for_bastion, count)
+        response = self._client.run_instances(**args)
+        nodes = []
+        for instance in sorted(response['Instances'],
+                               key=lambda i: i.get('AmiLaunchIndex', 0)):
+            node = Node(
+                provider_node_id=instance['InstanceId'],
+                state=instance['State']['Name'],
+                ssh_user=ssh_user,
+                ssh_key_name=ssh_private_key_name,
+                ssh_key_path=ssh_private_key_path,
+                ssh_key=ssh_private_key,
+                docker_version=self.DOCKER_VERSION,
+                docker_installed=self.DOCKER_INSTALLED)
+
+            # mark for clean up at the end
+            self.created_node.append(node.provider_node_id)
+            nodes.append(node)
+        return nodes
 
-        instance = self._client.run_instances(**args)
-        node = Node(
-            provider_node_id=instance['Instances'][0]['InstanceId'],
-            state=instance['Instances'][0]['State']['Name'],
-            ssh_user=ssh_user,
-            ssh_key_name=ssh_private_key_name,
-            ssh_key_path=ssh_private_key_path,
-            ssh_key=ssh_private_key,
-            docker_version=self.DOCKER_VERSION,
-            docker_installed=self.DOCKER_INSTALLED)
-
-        # mark for clean up at the end
-        self.created_node.append(node.provider_node_id)
+    def create_node(self, node_name, ami=AWS_AMI, ssh_user=AWS_USER,
+                    key_name=None, wait_for_ready=True, public_ip=True, for_bastion=False):
+        node = self._launch(node_name, ami, ssh_user, key_name, public_ip,
+                            for_bastion)[0]
 
         if wait_for_ready:
             node = self.wait_for_node_state(node)
             if public_ip:
                 node.ready_node()
             else:
-                time.sleep(60)
+                time.sleep(PRIVATE_NODE_BOOT_WAIT)
         return node
 
     def create_multiple_nodes(self, number_of_nodes, node_name_prefix,
                               ami=AWS_AMI, ssh_user=AWS_USER,
                               key_name=None, wait_for_ready=True,
                               public_ip=True):
-        nodes = []
-        for i in range(number_of_nodes):
-            node_name = "{}-{}".format(node_name_prefix, i)
-            nodes.append(self.create_node(node_name,
-                                          ami=ami, ssh_user=ssh_user,
-                                          key_name=key_name,
-                                          wait_for_ready=False,
-                                          public_ip=public_ip))
+        if AWS_BATCH_CREATE and number_of_nodes > 0:
+            # one run_instances call tags all nodes with the same name, a
+            # name per node would take a create_tags call per node; the
+            # name still matches the "<prefix>-*" filters of the cleanups
+            nodes = self._launch("{}-batch".format(node_name_prefix), ami,
+                                 ssh_user, key_name, public_ip,
+                                 count=number_of_nodes)
+        else:
+            nodes = []
+            for i in range(number_of_nodes):
+                node_name = "{}-{}".format(node_name_prefix, i)
+                nodes.append(self.create_node(node_name,
+                                              ami=ami, ssh_user=ssh_user,
+                                              key_name=key_name,
+                                              wait_for_ready=False,
+                                              public_ip=public_ip))
 
         if wait_for_ready:
+            start_time = time.time()
             nodes = self.wait_for_nodes_state(nodes)
-            # wait for window nodes to come up so we can decrypt the password
-            if ssh_user == "Administrator":
-                time.sleep(60 * 6)
-                for node in nodes:
-                    node.ssh_password = \
-                        self.decrypt_windows_password(node.provider_node_id)
+            for node in nodes:
+                node.timings["state"] = time.time() - start_time
+            nodes = self.ready_nodes(nodes, public_ip)
+
+        return nodes
 
+    def ready_nodes(self, nodes, public_ip=True):
+        """
+        Take running nodes through password retrieval (Windows), SSH and
+        docker install concurrently, each node at its own pace.
+        """
+        def ready(node):
+            # the password data shows up once Windows finished booting
+            if node.ssh_user == "Administrator":
+                start_time = time.time()
+                node.ssh_password = \
+                    self.wait_for_windows_password(node.provider_node_id)
+                node.timings["password"] = time.time() - start_time
             if public_ip:
-                for node in nodes:
-                    node.ready_node()
-            else:
-                time.sleep(60)
+                node.ready_node()
+            return node
 
+        if nodes:
+            workers = min(len(nodes), READY_NODE_WORKERS)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                nodes = list(executor.map(ready, nodes))
+        if not public_ip:
+            time.sleep(PRIVATE_NODE_BOOT_WAIT)
+        for node in nodes:
+            print("Node {} ready, seconds per stage: {}".format(
+                node.provider_node_id,
+                ", ".join("{} {:.0f}".format(k, v)
+                          for k, v in node.timings.items())))
         return nodes
 
     def get_node(self, provider_id, ssh_access=False):
@@ -312,23 +379,39 @@ class AmazonWebServices(CloudProviderBase):
                 return node
             time.sleep(5)
 
+    def _update_nodes(self, nodes):
+        """Refresh state and addresses of nodes with one describe call"""
+        by_id = {node.provider_node_id: node for node in nodes}
+        paginator = self._client.get_paginator('describe_instances')
+        for page in paginator.paginate(InstanceIds=list(by_id)):
+            for reservation in page.get('Reservations', []):
+                for aws_node in reservation['Instances']:
+                    node = by_id[aws_node['InstanceId']]
+                    node.state = aws_node['State']['Name']
+                    node.host_name = aws_node.get('PublicDnsName')
+                    node.public_ip_address = aws_node.get('PublicIpAddress')
+                    node.private_ip_address = \
+                        aws_node.get('PrivateIpAddress')
+        return nodes
+
     def wait_for_nodes_state(self, nodes, state='running'):
         # 'running', 'stopped', 'terminated'
-        timeout = 300
+        if not nodes:
+            return nodes
         start_time = time.time()
-        completed_nodes = []
-        while time.time() - start_time < timeout:
-            for node in nodes:
-                if len(completed_nodes) == len(nodes):
-                    time.sleep(20)  # Give the node some extra time
-                    return completed_nodes
-                if node in completed_nodes:
-                    continue
-                node = self.update_node(node)
-                if node.state == state:
-                    completed_nodes.append(node)
-                time.sleep(1)
-            time.sleep(4)
+        waiter = self._client.get_waiter('instance_' + state)
+        try:
+            waiter.wait(
+                InstanceIds=[node.provider_node_id for node in nodes],
+                WaiterConfig={'Delay': 5, 'MaxAttempts': 60})
+        except WaiterError as e:
+            msg = "Failed while waiting for instances to be {}: {}".format(
+                state, str(e))
+            raise RuntimeError(msg)
+        nodes = self._update_nodes(nodes)
+        print("{} instances {} after {:.0f} seconds".format(
+            len(nodes), state, time.time() - start_time))
+        return nodes
 
     def import_ssh_key(self, ssh_key_name, public_ssh_key):
         self._client.delete_key_pair(KeyName=ssh_key_name)
@@ -542,6 +625,18 @@ class AmazonWebServices(CloudProviderBase):
                 }
             )
 
+    def wait_for_windows_password(self, instance_id,
+                                  timeout=WINDOWS_PASSWORD_TIMEOUT):
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            password = self.decrypt_windows_password(instance_id)
+            if password:
+                return password
+            time.sleep(10)
+        raise RuntimeError(
+            "No password data for instance '{}' after {} seconds".format(
+                instance_id, timeout))
+
     def decrypt_windows_password(self, instance_id):
         password = ""
         password_data = self._client. \
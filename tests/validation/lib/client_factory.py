@@ -0,0 +1,93 @@
+import ast
+import os
+import threading
+
+import rancher
+import requests
+from requests.adapters import HTTPAdapter
+
+CLIENT_CACHE = ast.literal_eval(
+    os.environ.get('RANCHER_CLIENT_CACHE', "True"))
+# connections kept open per host, enough for the concurrent helpers
+POOL_SIZE = 32
+# prefixes of the methods rancher.Client binds from the schema
+SCHEMA_METHODS = ("list_", "create_", "by_id_", "update_", "delete_",
+                  "action_")
+
+
+def _new_session(verify):
+    session = requests.Session()
+    session.verify = verify
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PooledClient(rancher.Client):
+    """
+    rancher.Client that talks over a shared keep-alive session instead of
+    opening its own. The schema is loaded once per instance; when a schema
+    method is missing, e.g. because the token was granted access after the
+    client was built, the schema is reloaded once before giving up.
+    """
+
+    def __init__(self, session, **kw):
+        self._shared_session = session
+        # no reload while the schema is being bound
+        self._reloaded = True
+        super().__init__(**kw)
+        self._reloaded = False
+
+    def _load_schemas(self, force=False):
+        # rancher.Client creates a private session right before loading
+        # the schema, swap in the shared one
+        self._session = self._shared_session
+        super()._load_schemas(force=force)
+
+    def __getattr__(self, name):
+        if not name.startswith(SCHEMA_METHODS) or \
+                self.__dict__.get("_reloaded", True):
+            raise AttributeError(name)
+        self._reloaded = True
+        self.reload_schema()
+        return getattr(self, name)
+
+
+class ClientFactory(object):
+    """Hands out one client per (url, token), built on shared sessions"""
+
+    def __init__(self):
+        self._clients = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session(self, verify):
+        with self._lock:
+            if verify not in self._sessions:
+                self._sessions[verify] = _new_session(verify)
+            return self._sessions[verify]
+
+    def get(self, url, token, verify=False):
+        if not CLIENT_CACHE:
+            return rancher.Client(url=url, token=token, verify=verify)
+        key = (url, token, verify)
+        with self._lock:
+            client = self._clients.get(key)
+        if client is not None:
+            return client
+        client = PooledClient(self._session(verify), url=url, token=token,
+                              verify=verify)
+        with self._lock:
+            return self._clients.setdefault(key, client)
+
+    def clear(self):
+        with self._lock:
+            self._clients = {}
+
+
+default_factory = ClientFactory()
+
+
+def get_client(url, token, verify=False):
+    return default_factory.get(url, token, verify)
@@ -0,0 +1,129 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# enough to register a stress sized cluster in one wave
+MAX_WORKERS = 32
+
+
+class CommandResult(object):
+    """Outcome of the commands run on one node"""
+
+    def __init__(self, node, commands):
+        self.node = node
+        self.commands = commands
+        # [stdout, stderr] per command that ran
+        self.outputs = []
+        # exit status per command that ran
+        self.statuses = []
+        self.error = None
+        self.duration = None
+
+    @property
+    def failed_commands(self):
+        """(command, exit status, stderr) of the commands exiting non-zero"""
+        return [(c, s, o[1]) for c, s, o in
+                zip(self.commands, self.statuses, self.outputs) if s != 0]
+
+    @property
+    def ok(self):
+        return self.error is None and not self.failed_commands
+
+    @property
+    def stdout(self):
+        return self.outputs[-1][0] if self.outputs else None
+
+    @property
+    def stderr(self):
+        return self.outputs[-1][1] if self.outputs else None
+
+    def __repr__(self):
+        if self.error is not None:
+            status = "failed: {}".format(self.error)
+        elif self.failed_commands:
+            status = "failed: " + "; ".join(
+                "'{}' exited with {}: {}".format(c, s, e.strip())
+                for c, s, e in self.failed_commands)
+        else:
+            status = "ok"
+        return "{} ({} commands, {:.1f}s) {}".format(
+            self.node.public_ip_address or self.node.private_ip_address,
+            len(self.commands), self.duration or 0, status)
+
+
+class ShellResults(list):
+    """CommandResults of a ClusterShell run, in task order"""
+
+    @property
+    def failed(self):
+        return [r for r in self if not r.ok]
+
+    def raise_on_failure(self):
+        if self.failed:
+            raise Exception(
+                "Commands failed on {} of {} nodes:\n{}".format(
+                    len(self.failed), len(self),
+                    "\n".join(repr(r) for r in self.failed)))
+        return self
+
+
+class ClusterShell(object):
+    """
+    Runs commands on many nodes at once over a bounded thread pool. The
+    commands of a node run in order on its SSH connection, nodes run
+    concurrently, so a fan out over N nodes takes about as long as the
+    slowest node instead of the sum. A node failed when its SSH session
+    failed or any of its commands exited with a non-zero status.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _execute(node, commands):
+        result = CommandResult(node, commands)
+        start = time.time()
+        try:
+            for command in commands:
+                stdout, stderr, status = node.execute_command(
+                    command, exit_status=True)
+                result.outputs.append([stdout, stderr])
+                result.statuses.append(status)
+        except Exception as e:
+            result.error = e
+        result.duration = time.time() - start
+        return result
+
+    def run_tasks(self, tasks):
+        """
+        :param tasks: (node, command or list of commands) pairs; the same
+        node may appear more than once, e.g. a bastion host
+        :return: ShellResults
+        """
+        tasks = [(node, [commands] if isinstance(commands, str)
+                  else list(commands)) for node, commands in tasks]
+        if not tasks:
+            return ShellResults()
+        start = time.time()
+        workers = min(self.max_workers, len(tasks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._execute, node, commands)
+                       for node, commands in tasks]
+            results = ShellResults(f.result() for f in futures)
+        print("Ran commands on {} nodes in {:.1f}s, {} failed".format(
+            len(results), time.time() - start, len(results.failed)))
+        for result in results:
+            print(result)
+        return results
+
+    def run(self, nodes, commands):
+        """
+        Run the same command(s) on every node. commands may also be a
+        callable returning the command(s) of a given node.
+        """
+        if callable(commands):
+            return self.run_tasks((node, commands(node)) for node in nodes)
+        return self.run_tasks((node, commands) for node in nodes)
+
+
+def run_on_nodes(nodes, commands, max_workers=MAX_WORKERS):
+    return ClusterShell(max_workers).run(nodes, commands)
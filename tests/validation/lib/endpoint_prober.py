@@ -0,0 +1,130 @@
+import heapq
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+
+import requests
+
+BASE_DELAY = .5
+MAX_DELAY = 10
+REQUEST_TIMEOUT = 10
+MAX_WORKERS = 16
+
+
+class Endpoint(object):
+    """
+    A url to wait for. expected_code is the status to wait for, None
+    means any answer at all, i.e. the server accepts connections.
+    """
+
+    def __init__(self, url, expected_code=200, method="GET", headers=None,
+                 verify=False):
+        self.url = url
+        self.expected_code = expected_code
+        self.method = method
+        self.headers = headers
+        self.verify = verify
+        self.attempts = 0
+        # status code or exception of the last attempt
+        self.last = None
+        self.ready = False
+        self.elapsed = None
+
+    def check(self, session):
+        self.attempts += 1
+        try:
+            r = session.request(self.method, self.url, headers=self.headers,
+                                verify=self.verify, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            self.last = e
+            return False
+        self.last = r.status_code
+        return self.expected_code is None or \
+            r.status_code == self.expected_code
+
+    def __repr__(self):
+        expected = "any status" if self.expected_code is None \
+            else self.expected_code
+        return "{} {} (expected {}, last {}, {} attempts)".format(
+            self.method, self.url, expected, self.last, self.attempts)
+
+
+class EndpointProber(object):
+    """
+    Waits for many endpoints at once. Each endpoint is polled on its own
+    keep-alive session with jittered exponential backoff, so endpoints
+    that come up together are not hit in lockstep and a slow one does not
+    delay the others; the checks run on a pool of max_workers threads and
+    the wait ends when all are ready.
+    """
+
+    def __init__(self, timeout=120, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY, max_workers=MAX_WORKERS):
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_workers = max_workers
+
+    def _delay(self, attempt):
+        cap = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(self.base_delay / 2, cap)
+
+    def _poll(self, endpoints, sessions, executor):
+        start = time.time()
+        deadline = start + self.timeout
+        # (time of the next check, index of the endpoint)
+        due = [(start, i) for i in range(len(endpoints))]
+        running = {}
+        while due or running:
+            now = time.time()
+            while due and due[0][0] <= now:
+                _, i = heapq.heappop(due)
+                future = executor.submit(endpoints[i].check, sessions[i])
+                running[future] = i
+            wait = max(0, due[0][0] - now) if due else None
+            if not running:
+                time.sleep(wait)
+                continue
+            done, _ = wait_futures(list(running), timeout=wait,
+                                   return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                endpoint = endpoints[i]
+                if future.result():
+                    endpoint.ready = True
+                    endpoint.elapsed = time.time() - start
+                    continue
+                print("Waiting for {}".format(endpoint))
+                next_check = time.time() + self._delay(endpoint.attempts - 1)
+                if next_check <= deadline:
+                    heapq.heappush(due, (next_check, i))
+
+    def wait(self, endpoints):
+        """
+        :return: the endpoints, once all are ready
+        :raise Exception: listing the endpoints still not ready at timeout
+        """
+        endpoints = list(endpoints)
+        if not endpoints:
+            return endpoints
+        sessions = [requests.Session() for _ in endpoints]
+        workers = max(1, min(self.max_workers, len(endpoints)))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                self._poll(endpoints, sessions, executor)
+        finally:
+            for session in sessions:
+                session.close()
+        pending = [e for e in endpoints if not e.ready]
+        if pending:
+            raise Exception("Timed out waiting for endpoints:\n{}".format(
+                "\n".join(repr(e) for e in pending)))
+        for endpoint in endpoints:
+            print("{} ready after {:.1f}s".format(endpoint.url,
+                                                  endpoint.elapsed))
+        return endpoints
+
+
+def wait_for_endpoints(endpoints, timeout=120):
+    return EndpointProber(timeout=timeout).wait(endpoints)
@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONCURRENCY = 8
+# requests allowed per expected backend before giving up on coverage
+REQUESTS_PER_TARGET = 50
+REQUEST_TIMEOUT = 10
+RETRY_INTERVAL = .5
+
+
+class BackendReport(object):
+    """What a RoundRobinVerifier saw behind one url"""
+
+    def __init__(self, url, targets):
+        self.url = url
+        self.targets = list(targets)
+        self.distribution = Counter()
+        self.latencies = []
+        # (status or exception, body) of failed requests
+        self.errors = []
+        # bodies that are not one of the targets
+        self.unexpected = []
+        self.duration = None
+
+    @property
+    def requests(self):
+        return len(self.latencies) + len(self.errors)
+
+    @property
+    def missing(self):
+        return [t for t in self.targets if t not in self.distribution]
+
+    @property
+    def covered(self):
+        return not self.missing
+
+    def percentile(self, p):
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        index = max(0, int(round(p / 100.0 * len(latencies))) - 1)
+        return latencies[min(index, len(latencies) - 1)]
+
+    def summary(self):
+        lines = ["{}: {} requests in {:.1f}s, {} errors".format(
+            self.url, self.requests, self.duration or 0, len(self.errors))]
+        for target in self.targets:
+            lines.append("  {}: {}".format(target, self.distribution[target]))
+        for body in set(self.unexpected):
+            lines.append("  unexpected response: {}".format(body[:100]))
+        if self.latencies:
+            lines.append("  latency p50 {:.0f}ms p90 {:.0f}ms p99 {:.0f}ms "
+                         "max {:.0f}ms".format(
+                             self.percentile(50) * 1000,
+                             self.percentile(90) * 1000,
+                             self.percentile(99) * 1000,
+                             max(self.latencies) * 1000))
+        if self.missing:
+            lines.append("  not reached: {}".format(self.missing))
+        return "\n".join(lines)
+
+
+class RoundRobinVerifier(object):
+    """
+    Sends concurrent requests to a load balanced url until every expected
+    backend answered, then stops. Each worker keeps its connection alive,
+    which is what an ingress controller balances per request; L4 balancers
+    such as kube-proxy pick a backend per connection, so for them use
+    reuse_connections=False to open a new connection per request.
+    """
+
+    def __init__(self, concurrency=CONCURRENCY, max_requests=None,
+                 timeout=300, reuse_connections=True):
+        self.concurrency = concurrency
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.reuse_connections = reuse_connections
+
+    @staticmethod
+    def _session(verify):
+        session = requests.Session()
+        session.verify = verify
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def verify(self, url, targets, headers=None, verify=False,
+               allow_redirects=False):
+        """
+        :return: BackendReport; covered is False when the request budget
+        or timeout ran out, or a response was not one of the targets
+        """
+        report = BackendReport(url, targets)
+        max_requests = self.max_requests or \
+            REQUESTS_PER_TARGET * max(1, len(report.targets))
+        done = threading.Event()
+        lock = threading.Lock()
+        sent = [0]
+        start = time.time()
+
+        def worker():
+            session = self._session(verify)
+            try:
+                while not done.is_set():
+                    with lock:
+                        if sent[0] >= max_requests or \
+                                time.time() - start > self.timeout:
+                            done.set()
+                            return
+                        sent[0] += 1
+                    if not self.reuse_connections:
+                        session.close()
+                    self._request(session, url, headers, allow_redirects,
+                                  report, lock, done)
+            finally:
+                session.close()
+
+        workers = max(1, self.concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(worker) for _ in range(workers)]:
+                future.result()
+        report.duration = time.time() - start
+        return report
+
+    @staticmethod
+    def _request(session, url, headers, allow_redirects, report, lock,
+                 done):
+        begin = time.time()
+        try:
+            r = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT,
+                            allow_redirects=allow_redirects)
+        except requests.RequestException as e:
+            with lock:
+                report.errors.append((e, None))
+            time.sleep(RETRY_INTERVAL)
+            return
+        latency = time.time() - begin
+        body = r.text.rstrip()
+        with lock:
+            if not r.ok:
+                # e.g. the ingress controller still syncing its backends
+                report.errors.append((r.status_code, body))
+            elif body in report.targets:
+                report.latencies.append(latency)
+                report.distribution[body] += 1
+                if report.covered:
+                    done.set()
+            else:
+                report.latencies.append(latency)
+                report.unexpected.append(body)
+                done.set()
+        if not r.ok:
+            time.sleep(RETRY_INTERVAL)
+
+
+def verify_backends(url, targets, headers=None, verify=False,
+                    allow_redirects=False, **kw):
+    report = RoundRobinVerifier(**kw).verify(
+        url, targets, headers=headers, verify=verify,
+        allow_redirects=allow_redirects)
+    print(report.summary())
+    return report
@@ -3,6 +3,8 @@ import json
 import time
 import subprocess
 
+from .kubectl_native import KubectlError, run_kubectl
+
 DEBUG = os.environ.get('DEBUG', 'false')
 CONFORMANCE_YAML = ("tests/kubernetes_conformance/resources/k8s_ymls/"
                     "sonobuoy-conformance.yaml")
@@ -69,7 +71,9 @@ class KubectlClient(object):
             command += ' -o json'
         print("Running kubectl command: {}".format(command))
         start_time = time.time()
-        result = self.run_command(command)
+        # fails with a CalledProcessError whichever backend ran it
+        result = run_kubectl(command, self.kube_config_path,
+                             self.run_command)
         end_time = time.time()
         print('Run time for command {0}: {1} seconds'.format(
             command, end_time - start_time))
@@ -82,7 +86,17 @@ class KubectlClient(object):
             cmd, self._cli_options(**cli_options))
         print("Running kubectl command: {}".format(command))
         start_time = time.time()
-        result = self.run_command_with_stderr(command)
+        try:
+            result = run_kubectl(command, self.kube_config_path,
+                                 self.run_command_with_stderr)
+        except KubectlError as e:
+            # report it the way run_command_with_stderr does
+            print(e.output)
+            print(e.stderr)
+            print(e.returncode)
+            result = None
+        if isinstance(result, str):
+            result = result.encode()
         end_time = time.time()
         print('Run time for command {0}: {1} seconds'.format(
             command, end_time - start_time))
@@ -0,0 +1,332 @@
+import json
+import os
+import shlex
+import subprocess
+import threading
+
+try:
+    from kubernetes import client as k8s_client
+    from kubernetes import config as k8s_config
+    from kubernetes.client.rest import ApiException
+    from kubernetes.dynamic import DynamicClient
+    from kubernetes.stream import stream
+except ImportError:
+    DynamicClient = None
+
+# "native" runs the commands it understands through the kubernetes python
+# client, "subprocess" always forks kubectl
+KUBECTL_BACKEND = os.environ.get('RANCHER_KUBECTL_BACKEND', "native")
+EXEC_TIMEOUT = 300
+# commands using these need a shell around kubectl
+SHELL_SYNTAX = ("|", ">", "<", ";", "&", "$(", "`")
+
+
+class UnsupportedCommand(Exception):
+    """The command has to go through the kubectl binary"""
+
+
+class KubectlError(subprocess.CalledProcessError):
+    """
+    A command the in-process backend ran and kubectl would have failed,
+    with the status and message of the API server when it answered
+    """
+
+    def __init__(self, command, message, status=None, reason=None):
+        super().__init__(1, command, output="", stderr=message)
+        self.status = status
+        self.reason = reason
+
+    def __str__(self):
+        return "Command '{}' failed: {}".format(self.cmd, self.stderr)
+
+
+class _Args(object):
+    """Parsed kubectl command line, for the subset of flags we support"""
+
+    def __init__(self, command):
+        if any(c in command for c in SHELL_SYNTAX):
+            raise UnsupportedCommand("shell syntax in " + command)
+        words = shlex.split(command)
+        if words and words[0] == "kubectl":
+            words = words[1:]
+        self.command = command
+        self.kubeconfig = None
+        self.namespace = None
+        self.all_namespaces = False
+        self.selector = None
+        self.output = None
+        self.container = None
+        self.overwrite = False
+        self.positional = []
+        self.exec_command = []
+        while words:
+            word = words.pop(0)
+            if word == "--":
+                self.exec_command = words
+                break
+            if not word.startswith("-"):
+                self.positional.append(word)
+                continue
+            name, _, value = word.partition("=")
+            if name in ("-A", "--all-namespaces"):
+                self.all_namespaces = value in ("", "true")
+                continue
+            if name == "--overwrite":
+                self.overwrite = value in ("", "true")
+                continue
+            if name not in ("--kubeconfig", "-n", "--namespace", "-l",
+                            "--selector", "-o", "--output", "-c",
+                            "--container"):
+                raise UnsupportedCommand(word)
+            if not value:
+                if not words:
+                    raise UnsupportedCommand(word)
+                value = words.pop(0)
+            if name == "--kubeconfig":
+                self.kubeconfig = value
+            elif name in ("-n", "--namespace"):
+                self.namespace = value
+            elif name in ("-l", "--selector"):
+                self.selector = value
+            elif name in ("-o", "--output"):
+                self.output = value
+            else:
+                self.container = value
+        if not self.positional:
+            raise UnsupportedCommand(command)
+        self.verb = self.positional.pop(0)
+
+
+class NativeKubectl(object):
+    """
+    Runs common kubectl commands (get, label, annotate, exec) in process
+    and returns the same output kubectl would print. API clients and their
+    discovery data are kept per kubeconfig, so repeated commands reuse
+    connections instead of paying for a process, a kubeconfig parse,
+    discovery and a TLS handshake each. Like kubectl, commands without a
+    namespace use the one of the current context of the kubeconfig.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        # kubernetes.stream swaps the request method of its api client
+        self._exec_lock = threading.Lock()
+
+    def _client(self, kubeconfig):
+        """The dynamic client, the core client for exec and the default
+        namespace of a kubeconfig"""
+        # the validation tests rewrite the same kubeconfig file per
+        # cluster, a changed file replaces the clients of its path
+        mtime = os.path.getmtime(kubeconfig)
+        with self._lock:
+            cached = self._clients.get(kubeconfig)
+            if cached is None or cached[0] != mtime:
+                api = k8s_config.new_client_from_config(
+                    config_file=kubeconfig)
+                exec_api = k8s_config.new_client_from_config(
+                    config_file=kubeconfig)
+                _, context = k8s_config.list_kube_config_contexts(
+                    config_file=kubeconfig)
+                namespace = context["context"].get("namespace") or \
+                    "default"
+                cached = (mtime, (DynamicClient(api),
+                                  k8s_client.CoreV1Api(exec_api),
+                                  namespace))
+                self._clients[kubeconfig] = cached
+            return cached[1]
+
+    def api_client(self, kubeconfig):
+        return self._client(kubeconfig)[0].client
+
+    def resource(self, kubeconfig, name):
+        """API resource for a kubectl resource name such as po, pods or
+        podmonitors.monitoring.coreos.com"""
+        return self._resource(self._client(kubeconfig)[0], name)
+
+    @staticmethod
+    def _resource(dynamic, name):
+        name, _, group = name.partition(".")
+        name = name.lower()
+        found = []
+        for resource in dynamic.resources.search():
+            if not hasattr(resource, "short_names") or \
+                    "/" in resource.name:
+                continue
+            if group and resource.group != group:
+                continue
+            names = [resource.name, resource.singular_name,
+                     resource.kind.lower()] + list(resource.short_names)
+            if name in names:
+                found.append(resource)
+        if not found:
+            raise UnsupportedCommand("unknown resource type " + name)
+        preferred = [r for r in found if r.preferred]
+        return (preferred or found)[0]
+
+    @staticmethod
+    def _resource_names(args):
+        """Split 'type name...' and 'type/name' into type and names"""
+        if "/" in args.positional[0]:
+            type, _, name = args.positional[0].partition("/")
+            return type, [name] + args.positional[1:]
+        return args.positional[0], args.positional[1:]
+
+    def _namespace(self, args, resource):
+        if not resource.namespaced:
+            return None
+        if args.all_namespaces:
+            return None
+        return args.namespace
+
+    @staticmethod
+    def _as_list(items):
+        return {"apiVersion": "v1", "items": items, "kind": "List",
+                "metadata": {"resourceVersion": "", "selfLink": ""}}
+
+    def _get(self, dynamic, args):
+        if args.output != "json":
+            raise UnsupportedCommand("output " + str(args.output))
+        type, names = self._resource_names(args)
+        if "," in type:
+            raise UnsupportedCommand("multiple resource types")
+        resource = self._resource(dynamic, type)
+        namespace = self._namespace(args, resource)
+        if not names:
+            result = resource.get(namespace=namespace,
+                                  label_selector=args.selector).to_dict()
+            items = []
+            for item in result["items"]:
+                item.setdefault("apiVersion", resource.group_version)
+                item.setdefault("kind", resource.kind)
+                items.append(item)
+            return self._as_list(items)
+        objects = [resource.get(name=name, namespace=namespace).to_dict()
+                   for name in names]
+        if len(objects) == 1:
+            return objects[0]
+        return self._as_list(objects)
+
+    def _set_metadata(self, dynamic, args, field, action):
+        type, names = self._resource_names(args)
+        changes = [n for n in names if "=" in n or n.endswith("-")]
+        names = [n for n in names if n not in changes]
+        if len(names) != 1 or not changes or args.selector:
+            raise UnsupportedCommand("{} needs one named object".format(
+                args.verb))
+        resource = self._resource(dynamic, type)
+        namespace = self._namespace(args, resource)
+        current = resource.get(name=names[0], namespace=namespace).to_dict()
+        current = current["metadata"].get(field) or {}
+        patch = {}
+        for change in changes:
+            if "=" in change:
+                key, _, value = change.partition("=")
+                if key in current and current[key] != value and \
+                        not args.overwrite:
+                    raise KubectlError(
+                        args.command, "error: '{}' already has a value "
+                        "({}), and --overwrite is false".format(
+                            key, current[key]))
+                patch[key] = value
+            else:
+                patch[change[:-1]] = None
+        obj = resource.patch(
+            name=names[0], namespace=namespace,
+            body={"metadata": {field: patch}},
+            content_type="application/merge-patch+json").to_dict()
+        if args.output == "json":
+            return obj
+        if args.output is not None:
+            raise UnsupportedCommand("output " + args.output)
+        kind = resource.kind.lower()
+        if resource.group:
+            kind += "." + resource.group
+        return "{}/{} {}\n".format(kind, names[0], action)
+
+    def _exec(self, core, args):
+        if len(args.positional) != 1 or "/" in args.positional[0] or \
+                not args.exec_command:
+            raise UnsupportedCommand("exec needs a pod name and a command")
+        kwargs = {}
+        if args.container:
+            kwargs["container"] = args.container
+        with self._exec_lock:
+            resp = stream(core.connect_get_namespaced_pod_exec,
+                          args.positional[0], args.namespace,
+                          command=args.exec_command, stderr=True,
+                          stdin=False, stdout=True, tty=False,
+                          _preload_content=False, **kwargs)
+        resp.run_forever(timeout=EXEC_TIMEOUT)
+        stdout = resp.read_stdout() or ""
+        stderr = resp.read_stderr() or ""
+        if resp.returncode != 0:
+            error = KubectlError(args.command, stderr)
+            error.returncode = resp.returncode
+            error.output = stdout
+            raise error
+        if stderr:
+            print(stderr)
+        return stdout
+
+    def run(self, command, kubeconfig=None):
+        """
+        :return: what kubectl would print on stdout
+        :raise UnsupportedCommand: if the command needs the kubectl binary
+        :raise KubectlError: if kubectl would have failed
+        """
+        args = _Args(command)
+        kubeconfig = args.kubeconfig or kubeconfig
+        if kubeconfig is None:
+            raise UnsupportedCommand("no kubeconfig")
+        dynamic, core, namespace = self._client(kubeconfig)
+        if args.namespace is None:
+            args.namespace = namespace
+        try:
+            if args.verb == "get":
+                result = self._get(dynamic, args)
+            elif args.verb == "label":
+                result = self._set_metadata(dynamic, args, "labels",
+                                            "labeled")
+            elif args.verb == "annotate":
+                result = self._set_metadata(dynamic, args, "annotations",
+                                            "annotated")
+            elif args.verb == "exec":
+                return self._exec(core, args)
+            else:
+                raise UnsupportedCommand(args.verb)
+        except ApiException as e:
+            raise KubectlError(command, "Error from server ({}): {}".format(
+                e.reason, _api_message(e)), e.status, e.reason)
+        if isinstance(result, dict):
+            return json.dumps(result, indent=4)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._clients = {}
+
+
+def _api_message(error):
+    """The message of the Status an ApiException carries"""
+    try:
+        return json.loads(error.body)["message"]
+    except (TypeError, ValueError, KeyError):
+        return error.body
+
+
+default_native = NativeKubectl()
+
+
+def run_kubectl(command, kubeconfig, fallback):
+    """
+    Run a kubectl command line in process when possible, otherwise with
+    fallback(command), which forks the kubectl binary. A command failing
+    in process raises KubectlError, a CalledProcessError.
+    """
+    if KUBECTL_BACKEND == "native" and DynamicClient is not None:
+        try:
+            return default_native.run(command, kubeconfig)
+        except UnsupportedCommand as e:
+            print("kubectl binary needed: {}".format(e))
+    return fallback(command)
@@ -1,8 +1,10 @@
 import json
 import logging
-import paramiko
+import socket
 import time
 
+from .ssh_pool import default_pool
+
 
 logging.getLogger("paramiko").setLevel(logging.CRITICAL)
 DOCKER_INSTALL_CMD = (
@@ -35,10 +37,10 @@ class Node(object):
         self._roles = []
         self.labels = labels or {}
         self.state = state
-        self._ssh_client = paramiko.SSHClient()
-        self._ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.ssh_port = '22'
         self._ssh_password = None
+        # seconds spent in each readiness stage, see ready_node
+        self.timings = {}
 
     @property
     def ssh_password(self):
@@ -56,22 +58,32 @@ class Node(object):
     def roles(self, r):
         self._roles = r
 
+    def wait_for_port(self, port=None, timeout=300):
+        """Wait until a TCP port of the node accepts connections"""
+        port = int(port or self.ssh_port)
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            try:
+                socket.create_connection(
+                    (self.public_ip_address, port), timeout=3).close()
+                return True
+            except (socket.error, socket.timeout):
+                time.sleep(1)
+        raise Exception(
+            "Port {0} of node '{1}' not reachable after {2} seconds".format(
+                port, self.public_ip_address, timeout))
+
     def wait_for_ssh_ready(self):
         command = 'whoami'
         start_time = int(time.time())
         logs_while_waiting = ''
         while int(time.time()) - start_time < 100:
             try:
-                self._ssh_client.connect(
-                    self.public_ip_address, username=self.ssh_user,
-                    key_filename=self.ssh_key_path, port=int(self.ssh_port))
-                result = self._ssh_client.exec_command(command)
-                if result and len(result) == 3 and result[1].readable():
-                    result = [result[1].read(), result[2].read()]
-                    self._ssh_client.close()
-                    return True
+                # the connection stays in the pool for the next commands
+                default_pool.execute(self, command)
+                return True
             except Exception as e:
-                self._ssh_client.close()
+                default_pool.discard(self)
                 time.sleep(3)
                 logs_while_waiting += str(e) + '\n'
                 continue
@@ -79,25 +91,16 @@ class Node(object):
             "Unable to connect to node '{0}' by SSH: {1}".format(
                 self.public_ip_address, logs_while_waiting))
 
-    def execute_command(self, command):
-        result = None
-        try:
-            if self.ssh_password is not None:
-                self._ssh_client.connect(
-                    self.public_ip_address, username=self.ssh_user,
-                    password=self.ssh_password, port=int(self.ssh_port))
-            else:
-                self._ssh_client.connect(
-                    self.public_ip_address, username=self.ssh_user,
-                    key_filename=self.ssh_key_path, port=int(self.ssh_port))
-
-            result = self._ssh_client.exec_command(command)
-            if result and len(result) == 3 and result[1].readable():
-                result = [str(result[1].read(), 'utf-8'),
-                          str(result[2].read(), 'utf-8')]
-        finally:
-            self._ssh_client.close()
-        return result
+    def execute_command(self, command, exit_status=False):
+        """
+        :return: [stdout, stderr] of command, plus its exit status when
+        exit_status is set
+        """
+        return default_pool.execute(self, command, exit_status)
+
+    def reset_ssh(self):
+        """Reconnect on the next command, e.g. after a reboot"""
+        default_pool.discard(self)
 
     def install_docker(self):
         # TODO: Fix to install native on RHEL 7.4
@@ -106,16 +109,26 @@ class Node(object):
             .format(
                 DOCKER_INSTALL_CMD.format(self.docker_version),
                 self.ssh_user))
-        return self.execute_command(command)
+        result = self.execute_command(command)
+        # the docker group only applies to new logins
+        self.reset_ssh()
+        return result
 
     def ready_node(self):
         # ignore Windows node
         if self.ssh_user == "Administrator":
             return
 
+        start_time = time.time()
+        self.wait_for_port()
+        self.timings["tcp"] = time.time() - start_time
+        start_time = time.time()
         self.wait_for_ssh_ready()
+        self.timings["ssh"] = time.time() - start_time
         if self.docker_installed.lower() == 'false':
+            start_time = time.time()
             self.install_docker()
+            self.timings["docker"] = time.time() - start_time
 
     def docker_ps(self, all=False, includeall=False):
         result = self.execute_command(
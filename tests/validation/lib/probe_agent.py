@@ -0,0 +1,177 @@
+import ast
+import atexit
+import os
+import re
+import subprocess
+import threading
+import time
+
+import requests
+
+# off by default, the agent needs the container-utils image with /probe
+PROBE_AGENT = ast.literal_eval(os.environ.get('RANCHER_PROBE_AGENT', "False"))
+PROBE_AGENT_IMAGE = os.environ.get('RANCHER_PROBE_AGENT_IMAGE',
+                                   "ranchertest/container-utils")
+AGENT_NAME = "rancher-probe-agent"
+AGENT_PORT = 5000
+READY_TIMEOUT = 300
+FORWARD_TIMEOUT = 30
+FORWARDING = re.compile(r"Forwarding from 127\.0\.0\.1:(\d+) ")
+
+
+class ProbeAgent(object):
+    """
+    container-utils pod in a namespace that runs dig, ping and http probes
+    for the tests. The pod is created once and reached over one kubectl
+    port-forward, each batch of probes is a single POST to /probe and runs
+    concurrently inside the pod, instead of a kubectl exec per command.
+    close() stops the port-forward and deletes the pod.
+    """
+
+    def __init__(self, kubeconfig, namespace):
+        self.kubeconfig = kubeconfig
+        self.namespace = namespace
+        self._forward = None
+        self._url = None
+        self._deployed = False
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+
+    def _kubectl(self, *args):
+        command = ["kubectl", "--kubeconfig", self.kubeconfig,
+                   "-n", self.namespace] + list(args)
+        return subprocess.run(command, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, text=True)
+
+    def _deploy(self):
+        result = self._kubectl(
+            "run", AGENT_NAME, "--image=" + PROBE_AGENT_IMAGE,
+            "--restart=Never", "--port={}".format(AGENT_PORT),
+            "--labels=app=" + AGENT_NAME)
+        if result.returncode != 0 and "AlreadyExists" not in result.stdout:
+            raise Exception("Unable to create the probe agent in {}: {}"
+                            "".format(self.namespace, result.stdout))
+        self._deployed = True
+        result = self._kubectl(
+            "wait", "--for=condition=Ready", "pod/" + AGENT_NAME,
+            "--timeout={}s".format(READY_TIMEOUT))
+        if result.returncode != 0:
+            raise Exception("Probe agent in {} is not ready: {}".format(
+                self.namespace, result.stdout))
+
+    def _port_forward(self):
+        self._forward = subprocess.Popen(
+            ["kubectl", "--kubeconfig", self.kubeconfig,
+             "-n", self.namespace, "port-forward", "pod/" + AGENT_NAME,
+             ":{}".format(AGENT_PORT)],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        start = time.time()
+        while time.time() - start < FORWARD_TIMEOUT:
+            line = self._forward.stdout.readline()
+            if not line:
+                break
+            match = FORWARDING.search(line)
+            if match is not None:
+                self._url = "http://127.0.0.1:{}/probe".format(
+                    match.group(1))
+                # kubectl logs every connection, keep reading so the pipe
+                # never fills up and blocks the port-forward
+                drain = threading.Thread(target=self._drain,
+                                         args=(self._forward.stdout,))
+                drain.daemon = True
+                drain.start()
+                return
+        self._stop_forward()
+        raise Exception("Unable to port-forward to the probe agent in "
+                        "{}".format(self.namespace))
+
+    @staticmethod
+    def _drain(stream):
+        for _ in iter(stream.readline, ""):
+            pass
+
+    def _connect(self):
+        with self._lock:
+            if self._forward is not None and self._forward.poll() is None:
+                return self._url
+            self._deploy()
+            self._port_forward()
+            return self._url
+
+    def probe(self, probes, timeout=120):
+        """
+        :param probes: list of dicts such as {"type": "dns", "host": h},
+        {"type": "ping", "host": h, "count": 2} or
+        {"type": "http", "url": u}
+        :return: a result dict per probe, in order, with ok, output and
+        error, plus answers for dns and status for http
+        """
+        url = self._connect()
+        try:
+            response = self._session.post(url, json=probes, timeout=timeout)
+        except requests.ConnectionError:
+            # the port-forward dies with the pod or the api connection
+            self._stop_forward()
+            url = self._connect()
+            response = self._session.post(url, json=probes, timeout=timeout)
+        response.raise_for_status()
+        return response.json()["results"]
+
+    def dig(self, host):
+        return self.probe([{"type": "dns", "host": host}])[0]
+
+    def ping(self, host, count=2):
+        return self.probe([{"type": "ping", "host": host,
+                            "count": count}])[0]
+
+    def http(self, url, count=1):
+        return self.probe([{"type": "http", "url": url}] * count)
+
+    def _stop_forward(self):
+        if self._forward is not None:
+            self._forward.terminate()
+            self._forward.wait()
+            self._forward = None
+
+    def close(self):
+        with self._lock:
+            self._stop_forward()
+            if not self._deployed:
+                return
+            self._deployed = False
+            # the namespace may be gone already, which removed the pod
+            result = self._kubectl("delete", "pod", AGENT_NAME,
+                                   "--ignore-not-found", "--wait=false")
+            if result.returncode != 0:
+                print("Unable to delete the probe agent in {}: {}".format(
+                    self.namespace, result.stdout))
+
+
+class ProbeAgents(object):
+    """One ProbeAgent per (kubeconfig, namespace)"""
+
+    def __init__(self):
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def get(self, kubeconfig, namespace):
+        with self._lock:
+            key = (kubeconfig, namespace)
+            if key not in self._agents:
+                self._agents[key] = ProbeAgent(kubeconfig, namespace)
+            return self._agents[key]
+
+    def close_all(self):
+        with self._lock:
+            agents = list(self._agents.values())
+            self._agents = {}
+        for agent in agents:
+            agent.close()
+
+
+default_agents = ProbeAgents()
+atexit.register(default_agents.close_all)
+
+
+def probe_agent(kubeconfig, namespace):
+    return default_agents.get(kubeconfig, namespace)
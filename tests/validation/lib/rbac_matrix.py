@@ -0,0 +1,216 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from .kubectl_native import DynamicClient, UnsupportedCommand, \
+    default_native
+
+try:
+    from kubernetes import client as k8s_client
+except ImportError:
+    k8s_client = None
+
+# "kubectl" runs the commands as the service account, "access_review"
+# (opt-in) asks the api server whether each check is allowed with a
+# SubjectAccessReview instead
+RBAC_CHECK_MODE = os.environ.get('RANCHER_RBAC_CHECK_MODE', "kubectl")
+MAX_WORKERS = 16
+SA_NAMESPACE = "default"
+# kubectl apply reads the object before patching it
+FILE_VERBS = {"create": ["create"], "apply": ["get", "patch"],
+              "delete": ["delete"]}
+
+
+class AccessCheck(object):
+    """One command of a role, and whether the role may run it"""
+
+    def __init__(self, role, service_account, command, expected):
+        self.role = role
+        self.service_account = service_account
+        self.command = command
+        self.expected = expected
+        self.allowed = None
+        # how allowed was decided: access_review or kubectl
+        self.method = None
+        self.error = None
+
+    @property
+    def passed(self):
+        return self.error is None and self.allowed == self.expected
+
+    def __repr__(self):
+        status = "PASS" if self.passed else "FAIL"
+        if self.error is not None:
+            actual = "error: {}".format(self.error)
+        else:
+            actual = "allowed" if self.allowed else "denied"
+        return "{}  {:<8} {:<8} {} ({})".format(
+            status, "allowed" if self.expected else "denied", actual,
+            self.command, self.method)
+
+
+class RBACMatrix(object):
+    """
+    Evaluates the checks of a role all at once, the first time a result
+    of the role is asked for. In access_review mode every command is
+    mapped to the resource attributes it needs, and the service account
+    is allowed when SubjectAccessReviews allow all of them; the reviews
+    run concurrently. Commands that cannot be mapped, and every command
+    in kubectl mode, go through kubectl_check(service_account, command),
+    which returns whether the command was allowed.
+    """
+
+    def __init__(self, kubeconfig, kubectl_check, mode=RBAC_CHECK_MODE,
+                 max_workers=MAX_WORKERS):
+        self.kubeconfig = kubeconfig
+        self.kubectl_check = kubectl_check
+        if DynamicClient is None:
+            mode = "kubectl"
+        self.mode = mode
+        self.max_workers = max_workers
+        self._checks = {}
+        # role -> Event set once its checks are evaluated
+        self._evaluated = {}
+        self._lock = threading.Lock()
+
+    def add(self, role, service_account, command, expected):
+        with self._lock:
+            self._checks.setdefault(role, []).append(
+                AccessCheck(role, service_account, command, expected))
+
+    def _resource_attributes(self, resource, verb, name=None,
+                             namespace=None):
+        attributes = {"verb": verb, "group": resource.group,
+                      "resource": resource.name}
+        if name:
+            attributes["name"] = name
+        if resource.namespaced:
+            attributes["namespace"] = namespace or SA_NAMESPACE
+        return attributes
+
+    def attributes(self, command):
+        """
+        :return: the resource attributes command needs
+        :raise UnsupportedCommand: if they cannot be worked out
+        """
+        words = command.split()
+        verb = words[0]
+        if verb == "get" and len(words) in (2, 3) and "/" not in words[1]:
+            resource = default_native.resource(self.kubeconfig, words[1])
+            if len(words) == 3:
+                return [self._resource_attributes(resource, "get",
+                                                  words[2])]
+            return [self._resource_attributes(resource, "list")]
+        if verb in FILE_VERBS and len(words) == 3 and words[1] == "-f":
+            attributes = []
+            with open(words[2]) as f:
+                documents = [d for d in yaml.safe_load_all(f) if d]
+            for document in documents:
+                group = document["apiVersion"].rpartition("/")[0]
+                kind = document["kind"].lower()
+                if group:
+                    kind += "." + group
+                resource = default_native.resource(self.kubeconfig, kind)
+                metadata = document.get("metadata", {})
+                for file_verb in FILE_VERBS[verb]:
+                    attributes.append(self._resource_attributes(
+                        resource, file_verb, metadata.get("name"),
+                        metadata.get("namespace")))
+            return attributes
+        raise UnsupportedCommand(command)
+
+    def _review(self, service_account, attributes):
+        api = k8s_client.AuthorizationV1Api(
+            default_native.api_client(self.kubeconfig))
+        user = "system:serviceaccount:{}:{}".format(
+            SA_NAMESPACE, service_account)
+        body = {
+            "apiVersion": "authorization.k8s.io/v1",
+            "kind": "SubjectAccessReview",
+            "spec": {
+                "user": user,
+                "groups": ["system:serviceaccounts",
+                           "system:serviceaccounts:" + SA_NAMESPACE,
+                           "system:authenticated"],
+                "resourceAttributes": attributes,
+            },
+        }
+        return api.create_subject_access_review(body).status.allowed
+
+    def _evaluate_access_review(self, check):
+        try:
+            attributes = self.attributes(check.command)
+        except (UnsupportedCommand, OSError, KeyError, yaml.YAMLError) as e:
+            print("Checking '{}' with kubectl: {}".format(check.command, e))
+            self._evaluate_kubectl(check)
+            return
+        check.method = "access_review"
+        try:
+            check.allowed = all(self._review(check.service_account, a)
+                                for a in attributes)
+        except Exception as e:
+            check.error = e
+
+    def _evaluate_kubectl(self, check):
+        check.method = "kubectl"
+        try:
+            check.allowed = self.kubectl_check(check.service_account,
+                                               check.command)
+        except Exception as e:
+            check.error = e
+
+    def _evaluate_role(self, checks):
+        if self.mode == "kubectl":
+            # commands of a role depend on each other, e.g. create then
+            # apply then delete the same object
+            for check in checks:
+                self._evaluate_kubectl(check)
+            return
+        workers = max(1, min(self.max_workers, len(checks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(self._evaluate_access_review, checks))
+
+    def evaluate(self, roles=None):
+        """Evaluate the checks of roles not evaluated yet"""
+        with self._lock:
+            roles = roles or list(self._checks)
+            todo = [r for r in roles if r not in self._evaluated]
+            for role in todo:
+                self._evaluated[role] = threading.Event()
+            events = [self._evaluated[r] for r in roles]
+        if todo:
+            # in kubectl mode roles create and delete the same objects, so
+            # only access reviews run roles concurrently
+            workers = 1 if self.mode == "kubectl" else len(todo)
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(
+                        lambda r: self._evaluate_role(self._checks.get(r, [])),
+                        todo))
+            finally:
+                for role in todo:
+                    self._evaluated[role].set()
+            for role in todo:
+                print(self.table(role))
+        for event in events:
+            event.wait()
+
+    def table(self, role):
+        checks = self._checks.get(role, [])
+        passed = len([c for c in checks if c.passed])
+        lines = ["{}: {}/{} checks passed".format(role, passed, len(checks))]
+        lines.extend("  {}".format(c) for c in checks)
+        return "\n".join(lines)
+
+    def result(self, role, service_account, command, expected):
+        """The AccessCheck of a command of role, evaluating the role first"""
+        self.evaluate([role])
+        for check in self._checks.get(role, []):
+            if check.command == command and check.expected == expected:
+                return check
+        # not added before the role was evaluated, check it on its own
+        check = AccessCheck(role, service_account, command, expected)
+        self._evaluate_role([check])
+        return check
@@ -0,0 +1,177 @@
+import ast
+import atexit
+import os
+import socket
+import threading
+import time
+
+import paramiko
+
+SSH_POOL = ast.literal_eval(os.environ.get('RANCHER_SSH_POOL', "True"))
+KEEPALIVE_INTERVAL = 30
+# connections unused for this long are closed
+IDLE_TIMEOUT = 300
+# sshd allows 10 sessions per connection by default (MaxSessions)
+MAX_CHANNELS = 8
+CONNECTION_ERRORS = (paramiko.SSHException, EOFError, socket.error)
+
+
+class SSHConnection(object):
+    """One authenticated transport to a node, shared by all its commands"""
+
+    def __init__(self, node):
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        if node.ssh_password is not None:
+            self.client.connect(
+                node.public_ip_address, username=node.ssh_user,
+                password=node.ssh_password, port=int(node.ssh_port))
+        else:
+            self.client.connect(
+                node.public_ip_address, username=node.ssh_user,
+                key_filename=node.ssh_key_path, port=int(node.ssh_port))
+        self.client.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+        self.channels = threading.BoundedSemaphore(MAX_CHANNELS)
+        self.busy = 0
+        self.last_used = time.time()
+        self._retired = False
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def open(self, command):
+        """Start command on a new channel, returns its stdin/out/err"""
+        self.channels.acquire()
+        with self._lock:
+            self.busy += 1
+        try:
+            return self.client.exec_command(command)
+        except Exception:
+            self._done()
+            raise
+
+    def read(self, result, exit_status=False):
+        try:
+            if result and len(result) == 3 and result[1].readable():
+                channel = result[1].channel
+                result = [str(result[1].read(), 'utf-8'),
+                          str(result[2].read(), 'utf-8')]
+                if exit_status:
+                    result.append(channel.recv_exit_status())
+            return result
+        finally:
+            self._done()
+
+    def _done(self):
+        with self._lock:
+            self.busy -= 1
+            self.last_used = time.time()
+            close = self._retired and not self.busy
+        self.channels.release()
+        if close:
+            self.client.close()
+
+    def retire(self):
+        """Close once the commands running on the connection finished"""
+        with self._lock:
+            self._retired = True
+            close = not self.busy
+        if close:
+            self.client.close()
+
+    def close(self):
+        self.client.close()
+
+
+class SSHPool(object):
+    """
+    Keeps one SSH connection per node and opens a channel per command on
+    it, instead of a TCP connection and SSH handshake per command. Dead
+    connections are replaced and the command retried once; idle ones are
+    closed on the next use of the pool.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(node):
+        return (node.public_ip_address, str(node.ssh_port), node.ssh_user,
+                node.ssh_key_path, node.ssh_password)
+
+    def _evict_idle(self):
+        now = time.time()
+        with self._lock:
+            idle = [k for k, c in self._connections.items()
+                    if not c.busy and now - c.last_used > self.idle_timeout]
+            idle = [self._connections.pop(k) for k in idle]
+        for connection in idle:
+            connection.close()
+
+    def connection(self, node):
+        self._evict_idle()
+        key = self._key(node)
+        with self._lock:
+            connection = self._connections.get(key)
+        if connection is not None:
+            if connection.active:
+                return connection
+            self._drop(key, connection)
+        connection = SSHConnection(node)
+        with self._lock:
+            old = self._connections.get(key)
+            if old is not None and old.active:
+                # another thread connected first
+                connection.close()
+                return old
+            self._connections[key] = connection
+        return connection
+
+    def _drop(self, key, connection):
+        with self._lock:
+            if self._connections.get(key) is connection:
+                del self._connections[key]
+        connection.retire()
+
+    def discard(self, node):
+        """Stop reusing the connection of a node, e.g. after a reboot"""
+        with self._lock:
+            connection = self._connections.pop(self._key(node), None)
+        if connection is not None:
+            connection.retire()
+
+    def execute(self, node, command, exit_status=False):
+        """
+        :return: [stdout, stderr] of command, plus its exit status when
+        exit_status is set
+        """
+        connection = self.connection(node)
+        try:
+            streams = connection.open(command)
+        except CONNECTION_ERRORS as e:
+            # the command did not start, so it is safe to run it again
+            print("SSH connection to {} failed, reconnecting: {}".format(
+                node.public_ip_address, e))
+            self._drop(self._key(node), connection)
+            connection = self.connection(node)
+            streams = connection.open(command)
+        result = connection.read(streams, exit_status)
+        if not SSH_POOL:
+            self._drop(self._key(node), connection)
+        return result
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections = {}
+        for connection in connections:
+            connection.close()
+
+
+default_pool = SSHPool()
+atexit.register(default_pool.close_all)
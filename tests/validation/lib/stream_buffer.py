@@ -0,0 +1,106 @@
+import threading
+from collections import deque
+
+# lines kept for printing and for new watches, older ones are dropped
+MAX_LINES = 2000
+
+
+class Watch(object):
+    """Patterns waited for in a stream; event is set once they appeared"""
+
+    def __init__(self, patterns, require_all=True):
+        self.patterns = list(patterns)
+        self.require_all = require_all
+        self.found = set()
+        self.event = threading.Event()
+
+    def check(self, text):
+        for pattern in self.patterns:
+            if pattern not in self.found and pattern in text:
+                self.found.add(pattern)
+        if self.found and (not self.require_all or
+                           len(self.found) == len(self.patterns)):
+            self.event.set()
+
+    @property
+    def missing(self):
+        return [p for p in self.patterns if p not in self.found]
+
+
+class StreamBuffer(object):
+    """
+    Keeps the tail of a text stream, such as the output of a websocket
+    session, as a ring buffer of lines. Watches are matched against each
+    new chunk only, plus the end of the previous chunk for patterns split
+    across chunks, so a match is seen as soon as it arrives and the cost
+    does not grow with the length of the session.
+    """
+
+    def __init__(self, max_lines=MAX_LINES):
+        self._lines = deque(maxlen=max_lines)
+        self._partial = ''
+        self._carry = ''
+        self._watches = []
+        self._lock = threading.Lock()
+        self.closed = threading.Event()
+
+    def feed(self, data):
+        with self._lock:
+            lines = (self._partial + data).split('\n')
+            self._partial = lines.pop()
+            self._lines.extend(lines)
+            window = self._carry + data
+            for watch in self._watches:
+                watch.check(window)
+            self._watches = [w for w in self._watches
+                             if not w.event.is_set()]
+            longest = max([len(p) for w in self._watches
+                           for p in w.patterns] or [0])
+            self._carry = window[-(longest - 1):] if longest > 1 else ''
+
+    def close(self):
+        """The stream ended, wake up the waiters"""
+        self.closed.set()
+        with self._lock:
+            for watch in self._watches:
+                watch.event.set()
+
+    @property
+    def text(self):
+        with self._lock:
+            return '\n'.join(list(self._lines) + [self._partial])
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+            self._partial = ''
+            self._carry = ''
+
+    def watch(self, patterns, require_all=True, include_buffered=True):
+        """
+        :param patterns: strings to wait for
+        :param require_all: wait for all patterns instead of any
+        :param include_buffered: also match the text already buffered
+        """
+        watch = Watch(patterns, require_all)
+        with self._lock:
+            if include_buffered:
+                watch.check('\n'.join(list(self._lines) + [self._partial]))
+            if not watch.event.is_set():
+                if self.closed.is_set():
+                    watch.event.set()
+                else:
+                    self._watches.append(watch)
+            longest = max([len(p) for p in watch.patterns] or [0])
+            tail = '\n'.join(list(self._lines)[-1:] + [self._partial])
+            if len(self._carry) < longest - 1:
+                self._carry = tail[-(longest - 1):]
+        return watch
+
+    def wait_for(self, patterns, timeout, require_all=True,
+                 include_buffered=True):
+        """Blocks until the patterns appeared, returns the Watch; check
+        watch.missing to know whether it timed out or the stream ended"""
+        watch = self.watch(patterns, require_all, include_buffered)
+        watch.event.wait(timeout)
+        return watch
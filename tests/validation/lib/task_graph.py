@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+MAX_WORKERS = 16
+
+
+class TaskGraph(object):
+    """
+    Steps with dependencies between them. run() starts every step as soon
+    as the steps it depends on finished, so independent steps run
+    concurrently. A step is called with the results of its dependencies,
+    in the order they were declared.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._steps = {}
+
+    def add(self, name, function, *depends_on):
+        if name in self._steps:
+            raise ValueError("Step {} is already defined".format(name))
+        self._steps[name] = (function, depends_on)
+        return name
+
+    def _check(self):
+        for name, (_, depends_on) in self._steps.items():
+            for dependency in depends_on:
+                if dependency not in self._steps:
+                    raise ValueError("Step {} depends on unknown step {}"
+                                     "".format(name, dependency))
+
+    def run(self):
+        """
+        :return: dict of step name to its result
+        :raise: the error of the first failed step, once the steps already
+        running finished; steps not started yet are skipped
+        """
+        self._check()
+        results = {}
+        timings = {}
+        pending = dict(self._steps)
+        running = {}
+        error = None
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if error is None:
+                    ready = [n for n, (_, deps) in pending.items()
+                             if all(d in results for d in deps)]
+                    for name in ready:
+                        function, depends_on = pending.pop(name)
+                        args = [results[d] for d in depends_on]
+                        running[executor.submit(
+                            self._timed, function, args)] = name
+                if not running:
+                    if error is None and pending:
+                        raise ValueError("Dependency cycle between {}".format(
+                            sorted(pending)))
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name], timings[name] = future.result()
+                    except Exception as e:
+                        print("Step {} failed: {}".format(name, e))
+                        if error is None:
+                            error = e
+        print("Ran {} steps in {:.1f}s".format(len(results),
+                                               time.time() - start))
+        for name in sorted(timings, key=timings.get, reverse=True):
+            print("  {}: {:.1f}s".format(name, timings[name]))
+        if error is not None:
+            raise error
+        return results
+
+    @staticmethod
+    def _timed(function, args):
+        start = time.time()
+        result = function(*args)
+        return result, time.time() - start
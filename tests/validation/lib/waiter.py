@@ -0,0 +1,362 @@
+# tests/integration/suite/waiter.py is a symlink to this module, so it
+# must not import anything from lib or from the integration suite.
+import atexit
+import json
+import os
+import ssl
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+EVENT_WAIT = os.environ.get("RANCHER_EVENT_WAIT", "true").lower() == "true"
+POLL_INTERVAL = .5
+# a pause woken up by an event still lasts this long, so a burst of events
+# on a busy server does not turn every poll into a re-list per event
+MIN_PAUSE = .25
+CONNECT_TIMEOUT = 5
+RECONNECT_INTERVAL = 2
+# consecutive failed reconnects after which a dropped stream is given up
+MAX_RECONNECTS = 5
+# live streams per Waiter, the least recently watched one is closed to
+# make room for a new one
+MAX_SOURCES = 16
+# a handshake failing with these means the token or the scope is gone
+GONE_STATUSES = (401, 403, 404)
+
+
+class EventSource(object):
+    """
+    Base class for a change stream that wakes up a Waiter. Subclasses
+    implement connect() and stream(); the stream runs on a daemon thread
+    and reconnects until stop() is called.
+    """
+
+    def __init__(self, waiter):
+        self._waiter = waiter
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def stream(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def gone(self, error):
+        """Whether a connect error means the stream can't come back"""
+        return False
+
+    def start(self):
+        """
+        Open the stream synchronously so callers know whether events are
+        available, then keep consuming it in the background.
+        :return: True if the stream is connected, False otherwise
+        """
+        try:
+            self.connect()
+        except Exception as e:
+            print("Event stream unavailable, polling instead: {}".format(e))
+            return False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        self.close()
+
+    def _run(self):
+        failures = 0
+        while not self._stopped.is_set():
+            if not failures:
+                try:
+                    self.stream()
+                except Exception as e:
+                    if self._stopped.is_set():
+                        break
+                    print("Event stream dropped: {}".format(e))
+                # wake everybody up so nothing waits on a dead stream
+                self._waiter.notify()
+            self._stopped.wait(RECONNECT_INTERVAL)
+            if self._stopped.is_set():
+                break
+            try:
+                self.connect()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if self.gone(e) or failures >= MAX_RECONNECTS:
+                    print("Event stream given up, polling instead: "
+                          "{}".format(e))
+                    self._waiter.discard(self)
+                    break
+
+
+class RancherSubscribeSource(EventSource):
+    """Listens on a Rancher /subscribe websocket"""
+
+    def __init__(self, waiter, url, token, resource_types=None,
+                 handler=None):
+        super().__init__(waiter)
+        self.url = url
+        self.token = token
+        self.resource_types = resource_types or []
+        # called with every resource event before waiters are woken up
+        self.handler = handler
+        self._ws = None
+
+    def connect(self):
+        url = self.url
+        if self.resource_types:
+            url += "?" + "&".join(
+                "resourceType=" + t for t in self.resource_types)
+        self._ws = websocket.create_connection(
+            url=url,
+            sslopt={"cert_reqs": ssl.CERT_NONE},
+            header=["Authorization: Bearer " + self.token],
+            timeout=CONNECT_TIMEOUT)
+        # block on recv from now on, the server pings periodically
+        self._ws.settimeout(None)
+
+    def gone(self, error):
+        return getattr(error, "status_code", None) in GONE_STATUSES
+
+    def stream(self):
+        while not self._stopped.is_set():
+            message = self._ws.recv()
+            if not message:
+                raise websocket.WebSocketConnectionClosedException(
+                    "subscribe socket closed")
+            event = json.loads(message)
+            if event.get("name") in ("resource.change", "resource.create",
+                                     "resource.remove"):
+                if self.handler is not None:
+                    self.handler(event)
+                self._waiter.notify(event)
+
+    def close(self):
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+
+
+class KubernetesWatchSource(EventSource):
+    """Listens on a Kubernetes watch, e.g. CoreV1Api().list_namespaced_pod"""
+
+    def __init__(self, waiter, list_func, *args, **kwargs):
+        super().__init__(waiter)
+        self.list_func = list_func
+        self.args = args
+        self.kwargs = kwargs
+        self._watch = None
+
+    def connect(self):
+        from kubernetes import watch
+        # a cheap list proves the endpoint is reachable before streaming
+        self.list_func(*self.args, limit=1, **self.kwargs)
+        self._watch = watch.Watch()
+
+    def stream(self):
+        for event in self._watch.stream(self.list_func, *self.args,
+                                        **self.kwargs):
+            if self._stopped.is_set():
+                break
+            self._waiter.notify(event)
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.stop()
+
+    def gone(self, error):
+        return getattr(error, "status", None) in GONE_STATUSES
+
+
+class Waiter(object):
+    """
+    Waits for conditions to hold. Every registered EventSource bumps a
+    generation counter on each event, and sleeping waiters return as soon
+    as the generation moves, so a condition is re-checked the moment
+    something changes instead of after a fixed sleep. Without sources
+    this degrades to plain polling every `interval` seconds. At most
+    max_sources streams are kept open.
+    """
+
+    def __init__(self, interval=POLL_INTERVAL, max_sources=MAX_SOURCES):
+        self.interval = interval
+        self.max_sources = max_sources
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._sources = OrderedDict()
+        self._listeners = []
+        self._seen = threading.local()
+
+    def notify(self, event=None):
+        if event is not None:
+            for listener in list(self._listeners):
+                listener(event)
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def add_source(self, key, factory):
+        """
+        Register an event source once per key. Failed sources are
+        remembered as well so they are not retried on every wait.
+        :return: True if a live source exists for the key
+        """
+        with self._condition:
+            if key in self._sources:
+                self._sources.move_to_end(key)
+                return self._sources[key] is not None
+            self._sources[key] = None
+        source = factory(self)
+        if not source.start():
+            return False
+        with self._condition:
+            self._sources[key] = source
+            live = [k for k, s in self._sources.items() if s is not None]
+            # forget the evicted keys, they may be watched again later
+            evicted = [self._sources.pop(k)
+                       for k in live[:max(0, len(live) - self.max_sources)]]
+        for old in evicted:
+            old.stop()
+        return True
+
+    def watching(self, key):
+        """Whether the source of key is live, counts as a use of it"""
+        with self._condition:
+            if self._sources.get(key) is None:
+                return False
+            self._sources.move_to_end(key)
+            return True
+
+    def discard(self, source):
+        """Close a source for good, its key is not retried"""
+        with self._condition:
+            for key, value in list(self._sources.items()):
+                if value is source:
+                    self._sources[key] = None
+        source.stop()
+        self.notify()
+
+    def has_sources(self):
+        return any(s is not None for s in list(self._sources.values()))
+
+    def stop(self):
+        with self._condition:
+            sources = list(self._sources.values())
+            self._sources = OrderedDict()
+        for source in sources:
+            if source is not None:
+                source.stop()
+
+    def pause(self, interval=None):
+        """
+        Drop-in replacement for time.sleep(interval) inside polling loops:
+        returns early when an event arrived since the last pause of the
+        calling thread, but not before MIN_PAUSE.
+        """
+        if interval is None:
+            interval = self.interval
+        if not self.has_sources():
+            time.sleep(interval)
+            return
+        start = time.time()
+        with self._condition:
+            seen = getattr(self._seen, "generation", self._generation)
+            self._condition.wait_for(
+                lambda: self._generation != seen, interval)
+        remaining = min(interval, MIN_PAUSE) - (time.time() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+        with self._condition:
+            self._seen.generation = self._generation
+
+    def wait_for(self, callback, timeout, timeout_message=None,
+                 interval=None, exception=Exception):
+        start = time.time()
+        ret = callback()
+        while ret is None or ret is False:
+            self.pause(interval)
+            if time.time() - start > timeout:
+                if timeout_message:
+                    raise exception(timeout_message)
+                raise exception('Timeout waiting for condition')
+            ret = callback()
+        return ret
+
+
+default_waiter = Waiter()
+# close the event streams when the test run ends
+atexit.register(default_waiter.stop)
+
+
+def subscribe_url(client):
+    """Build the /subscribe websocket url for a rancher client"""
+    url = client._url
+    if url.endswith("/schemas"):
+        url = url[:-len("/schemas")]
+    url = url.rstrip("/") + "/subscribe"
+    if url.startswith("https://"):
+        return "wss://" + url[len("https://"):]
+    if url.startswith("http://"):
+        return "ws://" + url[len("http://"):]
+    return url
+
+
+def watch_client(client, waiter=default_waiter):
+    """
+    Subscribe to change events of the scope a rancher client talks to
+    (management, cluster or project). Safe to call repeatedly.
+    :return: True if events are streamed, False if waits will poll
+    """
+    if not EVENT_WAIT or websocket is None:
+        return False
+    token = getattr(client, "token", None)
+    if token is None or getattr(client, "_url", None) is None:
+        return False
+    url = subscribe_url(client)
+    return waiter.add_source(
+        (url, token),
+        lambda w: RancherSubscribeSource(w, url, token))
+
+
+def watch_kubernetes(list_func, *args, waiter=default_waiter, **kwargs):
+    """
+    Wake waiters on the events of a Kubernetes watch, e.g.
+    watch_kubernetes(RbacAuthorizationV1Api(k8s_client)
+                     .list_cluster_role_binding)
+    :return: True if events are streamed, False if waits will poll
+    """
+    if not EVENT_WAIT:
+        return False
+    key = (getattr(list_func, "__qualname__", repr(list_func)),
+           id(getattr(list_func, "__self__", None)), args,
+           tuple(sorted(kwargs.items())))
+    return waiter.add_source(
+        key,
+        lambda w: KubernetesWatchSource(w, list_func, *args, **kwargs))
+
+
+def pause(interval=POLL_INTERVAL):
+    default_waiter.pause(interval)
+
+
+def wait_for(callback, timeout, timeout_message=None, interval=None,
+             exception=Exception):
+    return default_waiter.wait_for(callback, timeout, timeout_message,
+                                   interval, exception)
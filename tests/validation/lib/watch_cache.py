@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+
+from .waiter import (EVENT_WAIT, RancherSubscribeSource, default_waiter,
+                     subscribe_url, websocket)
+
+WATCH_CACHE = os.environ.get("RANCHER_WATCH_CACHE", "true").lower() == "true"
+# objects are re-listed this often to recover from missed events
+RESYNC_INTERVAL = 30
+# objects a waiter keeps reading that did not change for this long are
+# read again from the API, in case their events were missed
+REFRESH_INTERVAL = 3
+# filters that identify a single object; a miss on them goes to the API
+IDENTITY_FILTERS = ("id", "uuid")
+
+
+def _version(obj):
+    try:
+        return int(getattr(obj, "resourceVersion", None))
+    except (TypeError, ValueError):
+        return None
+
+
+def _newer(obj, current):
+    """Whether obj may replace current, i.e. it is not an older version"""
+    if current is None:
+        return True
+    version, current_version = _version(obj), _version(current)
+    return version is None or current_version is None or \
+        version >= current_version
+
+
+class _Store(object):
+    """Local copy of all objects of one type in one scope"""
+
+    def __init__(self, client, type):
+        self.client = client
+        self.type = type
+        self.synced_at = 0
+        self._objects = {}
+        # when each object was last updated from an event or the API
+        self._changed_at = {}
+        # when a filter was last read from the API
+        self._read_at = {}
+        self._lock = threading.Lock()
+
+    def _put(self, obj, now):
+        if _newer(obj, self._objects.get(obj.id)):
+            self._objects[obj.id] = obj
+            self._changed_at[obj.id] = now
+
+    def on_event(self, event):
+        data = event.get("data") or {}
+        # aggregated types (workloads) carry the kind in type and the
+        # listed type in baseType
+        types = (event.get("resourceType"), data.get("type"),
+                 data.get("baseType"))
+        if self.type not in types or "id" not in data:
+            return
+        obj = self.client.object_hook(data)
+        with self._lock:
+            if event.get("name") == "resource.remove":
+                self._objects.pop(obj.id, None)
+                self._changed_at.pop(obj.id, None)
+            else:
+                self._put(obj, time.time())
+
+    def resync(self):
+        objects = self.client.list(self.type, limit=-1).data
+        now = time.time()
+        with self._lock:
+            listed = {obj.id for obj in objects}
+            for id in list(self._objects):
+                if id not in listed:
+                    self._objects.pop(id)
+                    self._changed_at.pop(id, None)
+            # events received while listing may be newer than the list
+            for obj in objects:
+                self._put(obj, now)
+            self.synced_at = now
+
+    def update(self, objects, filters=None):
+        now = time.time()
+        with self._lock:
+            for obj in objects:
+                self._put(obj, now)
+            if filters is not None:
+                # what the API no longer returns for the filters is gone
+                ids = {obj.id for obj in objects}
+                for id, obj in list(self._objects.items()):
+                    if id not in ids and _matches(obj, filters):
+                        self._objects.pop(id)
+                        self._changed_at.pop(id, None)
+                self._read_at[_key(filters)] = now
+
+    def stale(self, objects, filters, after):
+        """Whether none of the objects matching filters changed, and the
+        filters were not read from the API, in the last after seconds"""
+        now = time.time()
+        with self._lock:
+            if now - self._read_at.get(_key(filters), 0) <= after:
+                return False
+            return all(now - self._changed_at.get(obj.id, 0) > after
+                       for obj in objects)
+
+    def objects(self):
+        with self._lock:
+            return list(self._objects.values())
+
+
+class WatchCache(object):
+    """
+    Informer style cache of rancher objects shared by all waiters of a
+    test session. There is one store per (scope, token, type), fed by one
+    /subscribe websocket filtered on that type and seeded by one list call.
+    Waiters read from memory, so the API sees a list per type every
+    RESYNC_INTERVAL seconds instead of one per wait and per poll.
+    """
+
+    def __init__(self, waiter=default_waiter, resync=RESYNC_INTERVAL):
+        self._waiter = waiter
+        self.resync = resync
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def _store(self, client, type):
+        token = getattr(client, "token", None)
+        if token is None or getattr(client, "_url", None) is None:
+            return None
+        url = subscribe_url(client)
+        key = (url, token, type)
+        with self._lock:
+            if key in self._stores:
+                store = self._stores[key]
+                if store is None or self._waiter.watching(key):
+                    return store
+            # a store whose stream was closed misses events from then on
+            self._stores[key] = None
+
+        store = _Store(client, type)
+        watching = self._waiter.add_source(
+            key,
+            lambda w: RancherSubscribeSource(w, url, token,
+                                             resource_types=[type],
+                                             handler=store.on_event))
+        if not watching:
+            return None
+        store.resync()
+        with self._lock:
+            self._stores[key] = store
+        return store
+
+    def list(self, client, type, **filters):
+        """
+        Same result as client.list(type, **filters).data, served from the
+        local store when a watch for the type could be established.
+        """
+        store = None
+        if WATCH_CACHE and EVENT_WAIT and websocket is not None:
+            store = self._store(client, type)
+        if store is None:
+            return client.list(type, **filters).data
+
+        if time.time() - store.synced_at > self.resync:
+            store.resync()
+        found = [obj for obj in store.objects() if _matches(obj, filters)]
+        if not found and any(k in filters for k in IDENTITY_FILTERS):
+            # the object may be newer than the last event we have seen
+            found = client.list(type, **filters).data
+            store.update(found, filters)
+        elif found and store.stale(found, filters, REFRESH_INTERVAL):
+            # a missed or filtered out event must not keep a waiter on
+            # stale state until the next resync
+            store.update(client.list(type, **filters).data, filters)
+            found = [obj for obj in store.objects()
+                     if _matches(obj, filters)]
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._stores = {}
+
+
+def _key(filters):
+    return tuple(sorted(filters.items()))
+
+
+def _matches(obj, filters):
+    for k, v in filters.items():
+        if getattr(obj, k, None) != v:
+            return False
+    return True
+
+
+default_cache = WatchCache()
+
+
+def cached_list(client, type, **filters):
+    return default_cache.list(client, type, **filters)
@@ -0,0 +1,309 @@
+import asyncio
+import random
+import time
+from threading import Event, Thread
+
+from websocket import ABNF
+
+from lib.async_websocket import CHANNEL_PROTOCOL, STDIN, STDOUT, STDERR, \
+    ERROR, WebsocketError, WebsocketSession, accept_key, decode_channel, \
+    encode_channel, read_frame
+
+SESSIONS = 20
+# commands per second typed in each session
+RATE = 1
+DURATION = 30
+ECHO_TIMEOUT = 10
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, int(round(p / 100.0 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+class LoadReport(object):
+    """What a WebsocketLoadTest measured"""
+
+    def __init__(self, url, sessions):
+        self.url = url
+        self.sessions = sessions
+        self.connect_latencies = []
+        self.connect_errors = []
+        self.round_trips = []
+        self.sent = 0
+        # commands whose output did not come back in time
+        self.lost = 0
+        # sessions closed by the server before the end of the test
+        self.dropped = 0
+        self.duration = None
+
+    @property
+    def connected(self):
+        return len(self.connect_latencies)
+
+    @property
+    def connect_failure_rate(self):
+        return len(self.connect_errors) / float(self.sessions or 1)
+
+    @property
+    def drop_rate(self):
+        return self.dropped / float(self.connected or 1)
+
+    @property
+    def loss_rate(self):
+        return self.lost / float(self.sent or 1)
+
+    @staticmethod
+    def _latency(name, values):
+        if not values:
+            return "  {}: none".format(name)
+        return "  {}: p50 {:.0f}ms p90 {:.0f}ms p99 {:.0f}ms " \
+               "max {:.0f}ms".format(name,
+                                     percentile(values, 50) * 1000,
+                                     percentile(values, 90) * 1000,
+                                     percentile(values, 99) * 1000,
+                                     max(values) * 1000)
+
+    def summary(self):
+        lines = ["{}: {} of {} sessions connected, {} dropped, "
+                 "{} commands in {:.1f}s, {} lost".format(
+                     self.url, self.connected, self.sessions, self.dropped,
+                     self.sent, self.duration or 0, self.lost),
+                 self._latency("connect", self.connect_latencies),
+                 self._latency("echo round trip", self.round_trips)]
+        for error in sorted(set(self.connect_errors)):
+            lines.append("  connect error: {}".format(error))
+        return "\n".join(lines)
+
+
+class WebsocketLoadTest(object):
+    """
+    Opens many exec sessions running /bin/sh without a tty on one event
+    loop and types "echo <token>" in each, rate times per second for
+    duration seconds, timing the connection and the round trip of every
+    token. Sessions connect spread over ramp_up seconds; a session only
+    types its next command once the previous one answered or timed out.
+    create_session(url) returns an unconnected WebsocketSession.
+    """
+
+    def __init__(self, url, create_session=None, sessions=SESSIONS,
+                 rate=RATE, duration=DURATION, timeout=ECHO_TIMEOUT,
+                 ramp_up=0):
+        self.url = url
+        self.create_session = create_session or \
+            (lambda u: WebsocketSession(u, [CHANNEL_PROTOCOL]))
+        self.sessions = sessions
+        self.rate = rate
+        self.duration = duration
+        self.timeout = timeout
+        self.ramp_up = ramp_up
+
+    async def _drive(self, index, report, connect_at, deadline):
+        await asyncio.sleep(max(0, connect_at - time.time()))
+        session = self.create_session(self.url)
+        start = time.time()
+        try:
+            await session.connect(self.timeout)
+        except (WebsocketError, OSError, EOFError,
+                asyncio.TimeoutError) as e:
+            report.connect_errors.append(repr(e))
+            return
+        report.connect_latencies.append(time.time() - start)
+        interval = 1.0 / self.rate
+        next_at = time.time() + random.uniform(0, interval)
+        sequence = 0
+        try:
+            while True:
+                await asyncio.sleep(max(0, next_at - time.time()))
+                if time.time() >= deadline:
+                    break
+                if not session.connected:
+                    report.dropped += 1
+                    break
+                token = "ws-load-{}-{}".format(index, sequence)
+                sequence += 1
+                sent = time.time()
+                report.sent += 1
+                # no tty, so no line discipline turning \r into \n
+                missing = await session.run_command("echo " + token,
+                                                    [token], self.timeout,
+                                                    terminator="\n")
+                if not missing:
+                    report.round_trips.append(time.time() - sent)
+                elif session.connected:
+                    report.lost += 1
+                next_at = max(next_at + interval, time.time())
+        except (WebsocketError, ConnectionError):
+            report.dropped += 1
+        finally:
+            await session.close()
+
+    async def _run(self, report):
+        start = time.time()
+        deadline = start + self.ramp_up + self.duration
+        await asyncio.gather(*[
+            self._drive(i, report,
+                        start + self.ramp_up * i / float(self.sessions),
+                        deadline)
+            for i in range(self.sessions)])
+        report.duration = time.time() - start
+
+    def run(self):
+        report = LoadReport(self.url, self.sessions)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._run(report))
+        finally:
+            loop.close()
+        print(report.summary())
+        return report
+
+
+class MockExecServer(Thread):
+    """
+    A websocket server answering like the exec endpoint of a pod running
+    /bin/sh without a tty, so the load test runs in CI without a cluster:
+    an "echo x" line written to stdin is answered with x on stdout after
+    delay seconds, any other line with an error on stderr; like sh, only
+    a newline ends a line, a carriage return does not. Handshakes
+    above max_sessions concurrent sessions are refused with a 503, and
+    each session is closed after drop_after commands, if set.
+    """
+
+    def __init__(self, port=0, delay=0, max_sessions=None, drop_after=None):
+        super().__init__()
+        self.daemon = True
+        self.port = port
+        self.delay = delay
+        self.max_sessions = max_sessions
+        self.drop_after = drop_after
+        self.sessions = 0
+        self.accepted = 0
+        self.refused = 0
+        self.loop = asyncio.new_event_loop()
+        self._server = None
+        self._writers = set()
+        self._ready = Event()
+
+    @property
+    def url(self):
+        return "ws://127.0.0.1:%s" % self.port
+
+    def start(self):
+        super().start()
+        self._ready.wait()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self._server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle, "127.0.0.1", self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _shutdown(self):
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+        # let the handlers see their connection closed
+        await asyncio.sleep(.1)
+        self.loop.stop()
+
+    def shutdown_server(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        self.join()
+
+    @staticmethod
+    def _send(writer, data, opcode=ABNF.OPCODE_TEXT):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        writer.write(ABNF(1, 0, 0, 0, opcode, 0, data).format())
+
+    async def _handshake(self, reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        headers = {}
+        for line in request.decode("latin-1").split("\r\n")[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        protocols = [p.strip() for p in
+                     headers.get("sec-websocket-protocol", "").split(",")]
+        if self.max_sessions is not None and \
+                self.sessions >= self.max_sessions:
+            self.refused += 1
+            writer.write(b"HTTP/1.1 503 Service Unavailable\r\n"
+                         b"Content-Length: 0\r\n\r\n")
+            return False
+        if CHANNEL_PROTOCOL not in protocols or \
+                "sec-websocket-key" not in headers:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\n"
+                         b"Content-Length: 0\r\n\r\n")
+            return False
+        accept = accept_key(headers["sec-websocket-key"])
+        writer.write("\r\n".join([
+            "HTTP/1.1 101 Switching Protocols",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            "Sec-WebSocket-Accept: " + accept,
+            "Sec-WebSocket-Protocol: " + CHANNEL_PROTOCOL,
+            "", ""]).encode("latin-1"))
+        return True
+
+    async def _answer(self, writer, line):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if line.startswith(b"echo "):
+            self._send(writer, encode_channel(STDOUT, line[5:] + b"\n"))
+        else:
+            self._send(writer, encode_channel(
+                STDERR, b"sh: " + line.split()[0] + b": not found\n"))
+
+    async def _handle(self, reader, writer):
+        try:
+            if not await self._handshake(reader, writer):
+                writer.close()
+                return
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError):
+            writer.close()
+            return
+        self.sessions += 1
+        self.accepted += 1
+        self._writers.add(writer)
+        # the kubelet announces each channel with an empty message
+        for channel in (STDOUT, STDERR, ERROR):
+            self._send(writer, str(channel))
+        pending = b""
+        answered = 0
+        try:
+            while self.drop_after is None or answered < self.drop_after:
+                _, opcode, payload = await read_frame(reader)
+                if opcode == ABNF.OPCODE_CLOSE:
+                    self._send(writer, payload, ABNF.OPCODE_CLOSE)
+                    break
+                if opcode == ABNF.OPCODE_PING:
+                    self._send(writer, payload, ABNF.OPCODE_PONG)
+                    continue
+                if opcode != ABNF.OPCODE_TEXT:
+                    continue
+                channel, data = decode_channel(payload)
+                if channel != STDIN:
+                    continue
+                # like sh without a tty, only a newline ends a line
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        await self._answer(writer, line.strip())
+                        answered += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions -= 1
+            self._writers.discard(writer)
+            writer.close()
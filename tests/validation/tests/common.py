@@ -1,6 +1,7 @@
 import os
 import random
 import time
+from lib.waiter import wait_for as _wait_for
 
 CATTLE_TEST_URL = os.environ.get('CATTLE_TEST_URL', "")
 ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', "None")
@@ -30,14 +31,9 @@ def random_name():
 
 
 def wait_for(callback, timeout=DEFAULT_TIMEOUT, timeout_message=None):
-    start = time.time()
-    ret = callback()
-    while ret is None or ret is False:
-        time.sleep(.5)
-        if time.time() - start > timeout:
-            if timeout_message:
-                raise Exception(timeout_message)
-            else:
-                raise Exception('Timeout waiting for condition')
-        ret = callback()
-    return ret
+    """
+    Wait until callback returns something other than None or False.
+    The callback is re-evaluated as soon as any subscribed event stream
+    (see lib.waiter) reports a change, or every .5 seconds otherwise.
+    """
+    return _wait_for(callback, timeout, timeout_message)
@@ -1,7 +1,10 @@
 import time
 import os
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 from packaging import version
+from lib.probe_agent import PROBE_AGENT, probe_agent
 
 k8s_resource_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                "resources/k8s_ymls/")
@@ -9,6 +12,8 @@ k8s_rancher_version = str(os.environ.get("RANCHER_K8S_VERSION").split("-")[0][1:
 k8s_rancher_version = version.parse(k8s_rancher_version)
 k8s_rancher_version = version.parse(f"{str(k8s_rancher_version.major)}.{str(k8s_rancher_version.minor)}")
 k8s_fixed_version = version.parse("1.21")
+# packets sent from every pod to every other pod in network validation
+PING_COUNT = 10
 
 # Global expectedimagesdict declared to store the images for a specific
 # k8s Version
@@ -383,6 +388,49 @@ def validation_node_roles(nodes, k8s_nodes, etcd_private_ip=False):
                     assert 'is healthy' in result, result
 
 
+def parse_ping_output(output, pod_ips):
+    """
+    Split the output of concurrent pings, each introduced by '== <ip>'
+    :return: {ip: {'transmitted', 'received', 'avg_ms'}}, unseen ips
+    count as fully lost
+    """
+    results = {ip: {'transmitted': PING_COUNT, 'received': 0,
+                    'avg_ms': None} for ip in pod_ips}
+    ip = None
+    for line in (output or '').splitlines():
+        if line.startswith('== '):
+            ip = line[3:].strip()
+            continue
+        if ip not in results:
+            continue
+        # iputils and busybox summaries
+        match = re.search(
+            r'(\d+) packets transmitted, (\d+) (?:packets )?received', line)
+        if match:
+            results[ip]['transmitted'] = int(match.group(1))
+            results[ip]['received'] = int(match.group(2))
+        match = re.search(r'= [\d.]+/([\d.]+)/', line)
+        if match:
+            results[ip]['avg_ms'] = float(match.group(1))
+    return results
+
+
+def print_connectivity_matrix(matrix, pod_ips):
+    """Rows are source pods, cells are 'loss% avg-rtt' per target ip"""
+    print("Pod connectivity (packet loss, avg rtt):")
+    print("\t".join(["source"] + list(pod_ips)))
+    for pod_name, results in matrix.items():
+        cells = []
+        for pod_ip in pod_ips:
+            result = results[pod_ip]
+            loss = 100 - 100 * result['received'] // max(
+                result['transmitted'], 1)
+            avg = result['avg_ms']
+            cells.append("{0}% {1}".format(
+                loss, "-" if avg is None else "{0:.2f}ms".format(avg)))
+        print("\t".join([pod_name] + cells))
+
+
 class PodIntercommunicationValidation(object):
     def __init__(self, kubectl, base_namespace):
         self.kubectl = kubectl
@@ -449,17 +497,38 @@ class PodIntercommunicationValidation(object):
 
         # From each pod of daemonset in namespace ns_out, ping all pods
         # in from second daemonset in ns_in
-        expect_result = \
-            '1 packets transmitted, 1 received, 0% packet loss'
-        for pod_name in pod_names_to_ping_from:
-            for pod_ip in pod_ips_to_ping:
-                cmd = 'ping -c 1 {0}'.format(pod_ip)
-                for _ in range(10):
-                    result = self.kubectl.exec_cmd(pod_name, cmd, self.ns_out)
-                    assert expect_result in result, (
-                        "Could not ping pod with ip {0} from pod {1}:\n"
-                        "stdout: {2}\n".format(
-                            pod_ip, pod_name, result))
+        matrix = self.connectivity_matrix(
+            pod_names_to_ping_from, pod_ips_to_ping)
+        print_connectivity_matrix(matrix, pod_ips_to_ping)
+        failed = [
+            "{0} -> {1}: {2}".format(pod_name, pod_ip, result)
+            for pod_name, results in matrix.items()
+            for pod_ip, result in results.items()
+            if result['received'] != PING_COUNT]
+        assert not failed, (
+            "Could not ping all pods:\n{0}".format("\n".join(failed)))
+
+    def connectivity_matrix(self, pod_names, pod_ips):
+        """
+        Pings every ip from every pod. Each source pod pings all targets
+        in parallel within a single exec, and source pods run
+        concurrently.
+        :return: {pod name: {pod ip: ping result}}, see parse_ping_output
+        """
+        script = (
+            "for ip in {0}; do "
+            "(out=$(ping -c {1} -i 0.2 -W 2 $ip 2>&1); "
+            "printf '== %s\\n%s\\n' \"$ip\" \"$out\") & "
+            "done; wait").format(" ".join(pod_ips), PING_COUNT)
+        cmd = 'sh -c "{0}"'.format(script.replace('"', '\\"').replace(
+            '$', '\\$'))
+
+        def probe(pod_name):
+            output = self.kubectl.exec_cmd(pod_name, cmd, self.ns_out)
+            return pod_name, parse_ping_output(output, pod_ips)
+
+        with ThreadPoolExecutor(max_workers=len(pod_names) or 1) as executor:
+            return dict(executor.map(probe, pod_names))
 
     def teardown(self):
         """
@@ -529,6 +598,10 @@ class DNSServiceDiscoveryValidation(object):
                 'pods': [p['metadata']['name'] for p in service_pods['items']]
             }
 
+        if PROBE_AGENT:
+            self.validate_with_agent(dns_records)
+            return
+
         for dns_record, dns_info in dns_records.items():
             # Check dns resolution
             expected_ip = dns_info['ip']
@@ -548,6 +621,25 @@ class DNSServiceDiscoveryValidation(object):
                 "Service ClusterIP does not reach pods {0}".format(
                     dns_record))
 
+    def validate_with_agent(self, dns_records):
+        # all lookups and requests in one batch through the probe agent
+        agent = probe_agent(self.kubectl.kube_config_path, self.namespace)
+        probes = []
+        for dns_record in dns_records:
+            probes.append({'type': 'dns', 'host': dns_record})
+            probes.append({'type': 'http',
+                           'url': 'http://{0}/name.html'.format(dns_record)})
+        results = agent.probe(probes)
+        for i, (dns_record, dns_info) in enumerate(dns_records.items()):
+            dig, http = results[2 * i], results[2 * i + 1]
+            assert dns_info['ip'] in dig['answers'], (
+                "Unable to test DNS resolution for service {0}: {1}".format(
+                    dns_record, dig))
+            assert http['ok'] and \
+                http['output'].rstrip() in dns_info['pods'], (
+                    "Service ClusterIP does not reach pods {0}: {1}".format(
+                        dns_record, http))
+
     def teardown(self):
         self.kubectl.delete_resourse(
             'pod', 'pod-test-util', namespace=self.namespace)
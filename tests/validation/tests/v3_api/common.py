@@ -11,14 +11,27 @@ import ast
 import paramiko
 import rancher
 import pytest
-from urllib.parse import urlparse
+from urllib.parse import quote, urlencode, urlparse
 from rancher import ApiError
+from lib.async_websocket import WebsocketSession
 from lib.aws import AmazonWebServices
+from lib.client_factory import get_client
+from lib.cluster_shell import ClusterShell
+from lib.endpoint_prober import Endpoint, wait_for_endpoints
+from lib.http_verifier import verify_backends
+from lib.kubectl_native import KubectlError, run_kubectl
+from lib.task_graph import TaskGraph
+from lib.probe_agent import PROBE_AGENT, probe_agent
+from lib.rbac_matrix import RBACMatrix
+from lib.stream_buffer import MAX_LINES, StreamBuffer
+from lib.waiter import pause, watch_client
+from lib.watch_cache import cached_list
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-from threading import Lock
 from threading import Thread
 import websocket
 import base64
+import codecs
 
 DEFAULT_CATALOG_TIMEOUT = 15
 DEFAULT_MONITORING_TIMEOUT = 180
@@ -48,6 +61,14 @@ TEST_IMAGE = os.environ.get(
 TEST_IMAGE_PORT = os.environ.get('RANCHER_TEST_IMAGE_PORT', "80")
 TEST_IMAGE_NGINX = os.environ.get('RANCHER_TEST_IMAGE_NGINX', "nginx")
 TEST_IMAGE_OS_BASE = os.environ.get('RANCHER_TEST_IMAGE_OS_BASE', "ubuntu")
+# the command the UI runs when opening a shell in a container
+POD_SHELL_COMMAND = [
+    '/bin/sh',
+    '-c',
+    'TERM=xterm-256color; export TERM; [ -x /bin/bash ] && ([ -x '
+    '/usr/bin/script ] && /usr/bin/script -q -c "/bin/bash" '
+    '/dev/null || exec /bin/bash) || exec /bin/sh '
+]
 if TEST_OS == "windows":
     DEFAULT_TIMEOUT = 300
 skip_test_windows_os = pytest.mark.skipif(
@@ -81,6 +102,18 @@ LINODE_ACCESSKEY = os.environ.get('RANCHER_LINODE_ACCESSKEY', "None")
 NFS_SERVER_MOUNT_PATH = "/nfs"
 
 TEST_RBAC = ast.literal_eval(os.environ.get('RANCHER_TEST_RBAC', "False"))
+# keep the RBAC users, projects and kubeconfigs after the run and reuse them
+# on the next run against the same server
+RBAC_REUSE = ast.literal_eval(os.environ.get('RANCHER_RBAC_REUSE', "False"))
+# set on the last run of a series: reuse the fixtures, then remove them
+RBAC_REUSE_CLEANUP = ast.literal_eval(
+    os.environ.get('RANCHER_RBAC_REUSE_CLEANUP', "False"))
+# the fixtures hold user tokens, keep them outside of the checkout and
+# readable by the owner only
+RBAC_FIXTURES_DIR = os.environ.get(
+    'RANCHER_RBAC_FIXTURES_DIR',
+    os.path.join(os.path.expanduser("~"), ".rancher-validation"))
+RBAC_FIXTURES_FILE = os.path.join(RBAC_FIXTURES_DIR, "rbac_fixtures.json")
 if_test_rbac = pytest.mark.skipif(TEST_RBAC is False,
                                   reason='rbac tests are skipped')
 
@@ -118,6 +151,9 @@ rbac_data = {
     }
 }
 
+# checks of the RBAC v2 tests, see rbac_test_file_reader
+rbac_matrix = None
+
 auth_rbac_data = {
     "project": None,
     "namespace": None,
@@ -224,42 +260,44 @@ def get_cluster_client_for_token_v1(cluster_id, token):
 
 
 def get_admin_client():
-    return rancher.Client(url=CATTLE_API_URL, token=ADMIN_TOKEN, verify=False)
+    return get_client(CATTLE_API_URL, ADMIN_TOKEN)
 
 
 def get_user_client():
-    return rancher.Client(url=CATTLE_API_URL, token=USER_TOKEN, verify=False)
+    return get_client(CATTLE_API_URL, USER_TOKEN)
 
 
 def get_client_for_token(token, url=CATTLE_API_URL):
-    return rancher.Client(url=url, token=token, verify=False)
+    return get_client(url, token)
 
 
 def get_project_client_for_token(project, token):
     p_url = project.links['self'] + '/schemas'
-    p_client = rancher.Client(url=p_url, token=token, verify=False)
+    p_client = get_client(p_url, token)
     return p_client
 
 
 def get_cluster_client_for_token(cluster, token):
     c_url = cluster.links['self'] + '/schemas'
-    c_client = rancher.Client(url=c_url, token=token, verify=False)
+    c_client = get_client(c_url, token)
     return c_client
 
 
 def up(cluster, token):
     c_url = cluster.links['self'] + '/schemas'
-    c_client = rancher.Client(url=c_url, token=token, verify=False)
+    c_client = get_client(c_url, token)
     return c_client
 
 
 def wait_state(client, obj, state, timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     wait_for(lambda: client.reload(obj).state == state, timeout)
     return client.reload(obj)
 
 
 def wait_for_condition(client, resource, check_function, fail_handler=None,
                        timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     start = time.time()
     resource = client.reload(resource)
     while not check_function(resource):
@@ -270,11 +308,63 @@ def wait_for_condition(client, resource, check_function, fail_handler=None,
             if fail_handler:
                 exceptionMsg = exceptionMsg + fail_handler(resource)
             raise Exception(exceptionMsg)
-        time.sleep(.5)
+        pause(.5)
         resource = client.reload(resource)
     return resource
 
 
+def wait_for_all(client, objects, predicate, timeout=DEFAULT_TIMEOUT,
+                 interval=.5, missing_ok=False, **filters):
+    """
+    Wait until predicate holds for every object, fetching all of them with
+    one list call per iteration instead of one wait loop per object.
+    The list is filtered by `filters`, e.g. workloadId for the pods of a
+    workload or clusterId for the nodes of a cluster.
+    :param missing_ok: treat objects that disappeared as done
+    :return: the latest version of each object, in order, None for objects
+    that disappeared
+    """
+    if not objects:
+        return []
+    watch_client(client)
+    type = objects[0].type
+    pending = {obj.uuid: obj for obj in objects}
+    results = {}
+    start = time.time()
+    while True:
+        current = {obj.uuid: obj
+                   for obj in cached_list(client, type, **filters)}
+        if any(uuid not in current for uuid in pending):
+            # make sure a missing object is gone and not just unseen yet
+            current = {obj.uuid: obj
+                       for obj in client.list(type, **filters).data}
+        for uuid in list(pending):
+            obj = current.get(uuid)
+            if obj is None:
+                if missing_ok:
+                    print("{} does not exist anymore - {}".format(type, uuid))
+                    results[uuid] = None
+                    del pending[uuid]
+                continue
+            pending[uuid] = obj
+            if predicate(obj):
+                results[uuid] = obj
+                del pending[uuid]
+        if not pending:
+            return [results[obj.uuid] for obj in objects]
+        if time.time() - start > timeout:
+            report = []
+            for uuid, obj in pending.items():
+                state = getattr(obj, "state", None) \
+                    if uuid in current else "not found"
+                report.append("  {} {} ({}): {}".format(
+                    type, getattr(obj, "name", None) or obj.id, uuid, state))
+            raise AssertionError(
+                "Timed out waiting for {} of {} {}s:\n{}".format(
+                    len(pending), len(objects), type, "\n".join(report)))
+        pause(interval)
+
+
 def get_setting_value_by_name(name):
     settings_url = CATTLE_API_URL + "/settings/" + name
     head = {'Authorization': 'Bearer ' + ADMIN_TOKEN}
@@ -465,14 +555,16 @@ def validate_workload(p_client, workload, type, ns_name, pod_count=1,
         assert len(pods) == pod_count
         pods = p_client.list_pod(workloadId=workload.id).data
         assert len(pods) == pod_count
-    for pod in pods:
-        if type == "job":
-            job_type = True
-            expected_status = "Succeeded"
-        else:
-            job_type = False
-            expected_status = "Running"
-        p = wait_for_pod_to_running(p_client, pod, job_type=job_type)
+    if type == "job":
+        expected_state = "succeeded"
+        expected_status = "Succeeded"
+    else:
+        expected_state = "running"
+        expected_status = "Running"
+    running = wait_for_all(p_client, pods,
+                           lambda p: p.state == expected_state,
+                           workloadId=workload.id)
+    for p in running:
         assert p["status"]["phase"] == expected_status
 
     wl_result = execute_kubectl_cmd(
@@ -557,7 +649,12 @@ def execute_kubectl_cmd(cmd, json_out=True, stderr=False,
     if stderr:
         result = run_command_with_stderr(command, False)
     else:
-        result = run_command(command, False)
+        try:
+            result = run_kubectl(command, kubeconfig,
+                                 lambda c: run_command(c, False))
+        except KubectlError as e:
+            print(e.stderr)
+            result = None
     print("returns: \t{0}".format(result))
 
     if json_out:
@@ -596,33 +693,35 @@ def run_command_with_stderr(command, log_out=True):
 
 
 def wait_for_wl_to_active(client, workload, timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     start = time.time()
     timeout = start + timeout
-    workloads = client.list_workload(uuid=workload.uuid).data
+    workloads = cached_list(client, "workload", uuid=workload.uuid)
     assert len(workloads) == 1
     wl = workloads[0]
     while wl.state != "active":
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
-        workloads = client.list_workload(uuid=workload.uuid).data
+        pause(.5)
+        workloads = cached_list(client, "workload", uuid=workload.uuid)
         assert len(workloads) == 1
         wl = workloads[0]
     return wl
 
 
 def wait_for_ingress_to_active(client, ingress, timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     start = time.time()
-    ingresses = client.list_ingress(uuid=ingress.uuid).data
+    ingresses = cached_list(client, "ingress", uuid=ingress.uuid)
     assert len(ingresses) == 1
     wl = ingresses[0]
     while wl.state != "active":
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
-        ingresses = client.list_ingress(uuid=ingress.uuid).data
+        pause(.5)
+        ingresses = cached_list(client, "ingress", uuid=ingress.uuid)
         assert len(ingresses) == 1
         wl = ingresses[0]
     return wl
@@ -630,24 +729,26 @@ def wait_for_ingress_to_active(client, ingress, timeout=DEFAULT_TIMEOUT):
 
 def wait_for_wl_transitioning(client, workload, timeout=DEFAULT_TIMEOUT,
                               state="error"):
+    watch_client(client)
     start = time.time()
-    workloads = client.list_workload(uuid=workload.uuid).data
+    workloads = cached_list(client, "workload", uuid=workload.uuid)
     assert len(workloads) == 1
     wl = workloads[0]
     while wl.transitioning != state:
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
-        workloads = client.list_workload(uuid=workload.uuid).data
+        pause(.5)
+        workloads = cached_list(client, "workload", uuid=workload.uuid)
         assert len(workloads) == 1
         wl = workloads[0]
     return wl
 
 
 def wait_for_pod_to_running(client, pod, timeout=DEFAULT_TIMEOUT, job_type=False):
+    watch_client(client)
     start = time.time()
-    pods = client.list_pod(uuid=pod.uuid).data
+    pods = cached_list(client, "pod", uuid=pod.uuid)
     assert len(pods) == 1
     p = pods[0]
     if job_type:
@@ -658,8 +759,8 @@ def wait_for_pod_to_running(client, pod, timeout=DEFAULT_TIMEOUT, job_type=False
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
-        pods = client.list_pod(uuid=pod.uuid).data
+        pause(.5)
+        pods = cached_list(client, "pod", uuid=pod.uuid)
         assert len(pods) == 1
         p = pods[0]
     return p
@@ -731,22 +832,18 @@ def get_role_nodes(cluster, role, client=None):
 def validate_ingress(p_client, cluster, workloads, host, path,
                      insecure_redirect=False):
     time.sleep(10)
-    curl_args = " "
-    if (insecure_redirect):
-        curl_args = " -L --insecure "
-    if len(host) > 0:
-        curl_args += " --header 'Host: " + host + "'"
+    headers = {"Host": host} if len(host) > 0 else None
     nodes = get_schedulable_nodes(cluster, os_type="linux")
     target_name_list = get_target_names(p_client, workloads)
-    for node in nodes:
-        host_ip = resolve_node_ip(node)
-        url = "http://" + host_ip + path
-        if not insecure_redirect:
-            wait_until_ok(url, timeout=300, headers={
-                "Host": host
-            })
-        cmd = curl_args + " " + url
-        validate_http_response(cmd, target_name_list)
+    urls = ["http://" + resolve_node_ip(node) + path for node in nodes]
+    if not insecure_redirect:
+        wait_for_endpoints([Endpoint(url, method="HEAD",
+                                     headers={"Host": host})
+                            for url in urls], timeout=300)
+    for url in urls:
+        validate_http_response(url, target_name_list,
+                               insecure=insecure_redirect, headers=headers,
+                               allow_redirects=insecure_redirect)
 
 
 def validate_ingress_using_endpoint(p_client, ingress, workloads,
@@ -812,13 +909,7 @@ def get_endpoint_url_for_workload(p_client, workload, timeout=600):
 
 
 def wait_until_lb_is_active(url, timeout=300):
-    start = time.time()
-    while check_for_no_access(url):
-        time.sleep(.5)
-        print("No access yet")
-        if time.time() - start > timeout:
-            raise Exception('Timed out waiting for LB to become active')
-    return
+    wait_for_endpoints([Endpoint(url, expected_code=None)], timeout)
 
 
 def check_for_no_access(url, verify=False):
@@ -831,41 +922,25 @@ def check_for_no_access(url, verify=False):
 
 
 def wait_until_active(url, timeout=120):
-    start = time.time()
-    while check_for_no_access(url):
-        time.sleep(.5)
-        print("No access yet")
-        if time.time() - start > timeout:
-            raise Exception('Timed out waiting for url '
-                            'to become active')
-    return
+    wait_for_endpoints([Endpoint(url, expected_code=None)], timeout)
 
 
 def wait_until_ok(url, timeout=120, headers={}):
-    start = time.time()
-    while not check_if_ok(url, headers=headers):
-        time.sleep(.5)
-        if time.time() - start > timeout:
-            raise Exception(
-                'Timed out waiting for {0} to become ok'.format(url)
-            )
-    return
+    wait_for_endpoints([Endpoint(url, method="HEAD", headers=headers)],
+                       timeout)
 
 
 def wait_for_status_code(url, expected_code=200, timeout=DEFAULT_TIMEOUT):
-    start = time.time()
-    r = requests.get(url, verify=False)
-    while r.status_code != expected_code:
-        time.sleep(1)
-        r = requests.get(url, verify=False)
-        if time.time() - start > timeout:
-            raise Exception(
-                'Timed out waiting for status code {0}'
-                ', actual code {1}'.format(
-                    expected_code, r.status_code
-                )
-            )
-    return
+    wait_for_endpoints([Endpoint(url, expected_code=expected_code)], timeout)
+
+
+def wait_for_status_codes(expected_codes, timeout=DEFAULT_TIMEOUT):
+    """
+    Waits for several urls at once
+    @param expected_codes: dict of url to the status code to wait for
+    """
+    wait_for_endpoints([Endpoint(url, expected_code=code)
+                        for url, code in expected_codes.items()], timeout)
 
 
 def check_if_ok(url, verify=False, headers={}):
@@ -893,27 +968,40 @@ def retry_cmd_validate_expected(pod, cmd, expected, timeout=300):
         "Timed out waiting to get expected output")
 
 def validate_http_response(cmd, target_name_list, client_pod=None,
-                           insecure=False):
-    if client_pod is None and cmd.startswith("http://"):
-        wait_until_active(cmd, 60)
+                           insecure=False, headers=None,
+                           allow_redirects=False, reuse_connections=True):
+    """
+    Checks that every pod of target_name_list answers cmd, a url. Without
+    client_pod the requests are sent from here, concurrently, until all
+    targets were seen; reuse_connections=False opens a connection per
+    request for balancers that pick the backend per connection.
+    """
+    if client_pod is None:
+        url = cmd.strip()
+        if url.startswith("http://"):
+            wait_until_active(url, 60)
+        report = verify_backends(url, target_name_list, headers=headers,
+                                 verify=not insecure,
+                                 allow_redirects=allow_redirects,
+                                 reuse_connections=reuse_connections)
+        assert not report.unexpected, \
+            "Unexpected response from {}: {}".format(url, report.unexpected)
+        assert report.covered, \
+            "Targets not reached through {}: {}".format(url, report.missing)
+        return report
+    if PROBE_AGENT and not is_windows():
+        validate_http_response_with_agent(cmd, target_name_list, client_pod)
+        return
+    if is_windows():
+        wget_cmd = 'powershell -NoLogo -NonInteractive -Command ' \
+                   '"& {{ (Invoke-WebRequest -UseBasicParsing -Uri ' \
+                   '{0}).Content }}"'.format(cmd)
+    else:
+        wget_cmd = "wget -qO- " + cmd
     target_hit_list = target_name_list[:]
     while len(target_hit_list) != 0:
-        if len(target_hit_list) == 0:
-            break
-        if client_pod is None:
-            curl_cmd = "curl " + cmd
-            if insecure:
-                curl_cmd += "\t--insecure"
-            result = run_command(curl_cmd)
-        else:
-            if is_windows():
-                wget_cmd = 'powershell -NoLogo -NonInteractive -Command ' \
-                           '"& {{ (Invoke-WebRequest -UseBasicParsing -Uri ' \
-                           '{0}).Content }}"'.format(cmd)
-            else:
-                wget_cmd = "wget -qO- " + cmd
-            time.sleep(6)
-            result = retry_cmd_validate_expected(client_pod, wget_cmd, target_name_list)
+        time.sleep(6)
+        result = retry_cmd_validate_expected(client_pod, wget_cmd, target_name_list)
         if result is not None:
             result = result.rstrip()
             assert result in target_name_list
@@ -923,6 +1011,38 @@ def validate_http_response(cmd, target_name_list, client_pod=None,
     assert len(target_hit_list) == 0
 
 
+def validate_http_response_with_agent(cmd, target_name_list, client_pod,
+                                      timeout=300):
+    """
+    validate_http_response through the probe agent of the namespace of
+    client_pod: every round sends a batch of requests at once, until
+    every target answered.
+    """
+    agent = probe_agent(kube_fname, client_pod.namespaceId)
+    url = cmd.strip()
+    if "://" not in url:
+        url = "http://" + url
+    target_hit_list = target_name_list[:]
+    start = time.time()
+    while target_hit_list:
+        if time.time() - start > timeout:
+            raise AssertionError(
+                "Timed out waiting for responses from {}".format(
+                    target_hit_list))
+        for result in agent.http(url, count=2 * len(target_name_list)):
+            if not result["ok"]:
+                print("Probe of {} failed: {}".format(
+                    url, result.get("error") or result.get("status")))
+                continue
+            output = result["output"].rstrip()
+            assert output in target_name_list
+            if output in target_hit_list:
+                target_hit_list.remove(output)
+        if target_hit_list:
+            time.sleep(2)
+    print("After removing all, the rest is: ", target_hit_list)
+
+
 def validate_cluster(client, cluster, intermediate_state="provisioning",
                      check_intermediate_state=True, skipIngresscheck=True,
                      nodes_not_in_active_state=[], k8s_version="",
@@ -1021,12 +1141,15 @@ def validate_dns_record(pod, record, expected, port=TEST_IMAGE_PORT):
     validate_dns_entry(pod, host, expected, port=port)
 
 def retry_dig(host, pod, expected, timeout=300):
+    agent = probe_agent(kube_fname, pod.namespaceId) if PROBE_AGENT else None
     start = 0
     while start < timeout:
-        dig_cmd = 'dig {0} +short'.format(host)
-        dig_output = kubectl_pod_exec(pod, dig_cmd)
-        decode_dig = dig_output.decode('utf-8')
-        split_dig = decode_dig.splitlines()
+        if agent is not None:
+            dig_output = agent.dig(host)["output"]
+        else:
+            dig_cmd = 'dig {0} +short'.format(host)
+            dig_output = kubectl_pod_exec(pod, dig_cmd).decode('utf-8')
+        split_dig = dig_output.splitlines()
         dig_length = len(split_dig)
         expected_length = len(expected)
         if dig_length >= expected_length:
@@ -1041,6 +1164,10 @@ def validate_dns_entry(pod, host, expected, port=TEST_IMAGE_PORT, retry_count=3)
         validate_dns_entry_windows(pod, host, expected)
         return
 
+    if PROBE_AGENT:
+        validate_dns_entry_with_agent(pod, host, expected, port)
+        return
+
     # requires pod with `dig` available - TEST_IMAGE
     if HARDENED_CLUSTER:
         cmd = 'curl -vs {}:{} 2>&1'.format(host, port)
@@ -1067,6 +1194,37 @@ def validate_dns_entry(pod, host, expected, port=TEST_IMAGE_PORT, retry_count=3)
             "Error the dig command returned: {0}".format(dig_output)
 
 
+def validate_dns_entry_with_agent(pod, host, expected, port=TEST_IMAGE_PORT,
+                                  timeout=300):
+    """
+    validate_dns_entry through the probe agent of the namespace of pod,
+    the connectivity check and the lookup go out in one batch.
+    """
+    agent = probe_agent(kube_fname, pod.namespaceId)
+    if HARDENED_CLUSTER:
+        check = {"type": "http", "url": "http://{}:{}".format(host, port)}
+    else:
+        check = {"type": "ping", "host": host, "count": 2}
+    start = time.time()
+    while True:
+        connectivity, dig = agent.probe(
+            [check, {"type": "dns", "host": host}])
+        resolved = all(e in dig["output"] for e in expected)
+        if HARDENED_CLUSTER:
+            connected = connectivity.get("status") == 200
+        else:
+            connected = any(e in connectivity["output"]
+                            for e in expected) and \
+                " 0% packet loss" in connectivity["output"]
+        if connected and resolved:
+            return
+        if time.time() - start > timeout:
+            raise AssertionError(
+                "Error validating {}, connectivity: {} dig: {}".format(
+                    host, connectivity, dig))
+        time.sleep(5)
+
+
 def validate_dns_entry_windows(pod, host, expected):
     def ping_check():
         ping_cmd = 'ping -w 1 -n 1 {0}'.format(host)
@@ -1104,6 +1262,7 @@ def validate_dns_record_deleted(client, dns_record, timeout=DEFAULT_TIMEOUT):
     @param dns_record: record object subjected to be deleted
     @param timeout: Max time to keep checking whether record is deleted or not
     """
+    watch_client(client)
     time.sleep(2)
     start = time.time()
     records = client.list_dns_record(name=dns_record.name, ).data
@@ -1112,31 +1271,36 @@ def validate_dns_record_deleted(client, dns_record, timeout=DEFAULT_TIMEOUT):
             raise AssertionError(
                 "Timed out waiting for record {} to be deleted"
                 "".format(dns_record.name))
-        time.sleep(.5)
+        pause(.5)
         records = client.list_dns_record(name=dns_record.name, ).data
 
 
 def wait_for_nodes_to_become_active(client, cluster, exception_list=[],
                                     retry_count=0):
     nodes = client.list_node(clusterId=cluster.id).data
+    nodes = [node for node in nodes
+             if node.requestedHostname not in exception_list]
+    # Nodes that are part of nodepools may get auto deleted while waiting
+    results = wait_for_all(client, nodes, lambda n: n.state == "active",
+                           timeout=MACHINE_TIMEOUT, interval=5,
+                           missing_ok=True, clusterId=cluster.id)
     node_auto_deleted = False
-    for node in nodes:
-        if node.requestedHostname not in exception_list:
-            node = wait_for_node_status(client, node, "active")
-            if node is None:
-                print("Need to re-evalauate new node list")
-                node_auto_deleted = True
-                retry_count += 1
-                print("Retry Count:" + str(retry_count))
+    for node in results:
+        if node is None:
+            print("Need to re-evalauate new node list")
+            node_auto_deleted = True
+            retry_count += 1
+            print("Retry Count:" + str(retry_count))
     if node_auto_deleted and retry_count < 5:
         wait_for_nodes_to_become_active(client, cluster, exception_list,
                                         retry_count)
 
 
 def wait_for_node_status(client, node, state):
+    watch_client(client)
     uuid = node.uuid
     start = time.time()
-    nodes = client.list_node(uuid=uuid).data
+    nodes = cached_list(client, "node", uuid=uuid)
     node_count = len(nodes)
     # Handle the case of nodes getting auto deleted when they are part of
     # nodepools
@@ -1149,8 +1313,8 @@ def wait_for_node_status(client, node, state):
         if time.time() - start > MACHINE_TIMEOUT:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(5)
-        nodes = client.list_node(uuid=uuid).data
+        pause(5)
+        nodes = cached_list(client, "node", uuid=uuid)
         node_count = len(nodes)
         if node_count == 1:
             node_status = nodes[0].state
@@ -1161,30 +1325,32 @@ def wait_for_node_status(client, node, state):
 
 
 def wait_for_node_to_be_deleted(client, node, timeout=300):
+    watch_client(client)
     uuid = node.uuid
     start = time.time()
-    nodes = client.list_node(uuid=uuid).data
+    nodes = cached_list(client, "node", uuid=uuid)
     node_count = len(nodes)
     while node_count != 0:
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for node delete")
-        time.sleep(.5)
-        nodes = client.list_node(uuid=uuid).data
+        pause(.5)
+        nodes = cached_list(client, "node", uuid=uuid)
         node_count = len(nodes)
 
 
 def wait_for_cluster_node_count(client, cluster, expected_node_count,
                                 timeout=300):
+    watch_client(client)
     start = time.time()
-    nodes = client.list_node(clusterId=cluster.id).data
+    nodes = cached_list(client, "node", clusterId=cluster.id)
     node_count = len(nodes)
     while node_count != expected_node_count:
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
-        nodes = client.list_node(clusterId=cluster.id).data
+        pause(.5)
+        nodes = cached_list(client, "node", clusterId=cluster.id)
         node_count = len(nodes)
 
 
@@ -1282,49 +1448,175 @@ def delete_cluster(client, cluster):
     client.delete(cluster)
 
 
+class ConnectivityReport(object):
+    """
+    Outcome of a connectivity check between pods, one entry per
+    (source pod, target pod) pair with the expected and observed result
+    """
+
+    def __init__(self, allow_connectivity):
+        self.allow_connectivity = allow_connectivity
+        self.results = {}
+
+    def add(self, source, target, connected, output, duration):
+        self.results[(source.name, target.name)] = {
+            "source": source.name,
+            "target": target.name,
+            "target_ip": target.status.podIp,
+            "connected": connected,
+            "output": output,
+            "seconds": duration,
+        }
+
+    @property
+    def failures(self):
+        return [r for r in self.results.values()
+                if r["connected"] is not self.allow_connectivity]
+
+    @property
+    def matrix(self):
+        """{(source pod, target pod): connected} for every pair probed"""
+        return {k: r["connected"] for k, r in self.results.items()}
+
+    def summary(self):
+        lines = ["{} pairs, expected connectivity: {}, {} unexpected".format(
+            len(self.results), self.allow_connectivity, len(self.failures))]
+        for r in self.failures:
+            lines.append("  {source} -> {target} ({target_ip}): "
+                         "connected={connected}\n{output}".format(**r))
+        return "\n".join(lines)
+
+
+def _connectivity_probe(target_ip):
+    if is_windows():
+        return 'ping -w 1 -n 1 {0}'.format(target_ip)
+    if HARDENED_CLUSTER:
+        return 'curl -sI -m 5 {}:{}'.format(target_ip, TEST_IMAGE_PORT)
+    return 'ping -c 1 -W 1 {0}'.format(target_ip)
+
+
+def _connectivity_from_output(output):
+    """:return: True/False when the probe output is conclusive, else None"""
+    if is_windows():
+        if " (0% loss)" in output:
+            return True
+        if " (100% loss)" in output:
+            return False
+        return None
+    if HARDENED_CLUSTER:
+        return " 200 OK" in output
+    if " 0% packet loss" in output:
+        return True
+    if " 100% packet loss" in output:
+        return False
+    return None
+
+
+def _probe_targets(pod, targets):
+    """
+    Probe all target pods from pod. Linux pods run every probe in parallel
+    within a single exec, windows pods get one exec per target.
+    :return: {target ip: (connected or None, output)}
+    """
+    ips = sorted(set(t.status.podIp for t in targets))
+    if is_windows():
+        results = {}
+        for ip in ips:
+            output = kubectl_pod_exec(pod, _connectivity_probe(ip))
+            output = output.decode('utf-8') if output else ""
+            results[ip] = (_connectivity_from_output(output), output)
+        return results
+    probes = " ".join(
+        "(out=$({0} 2>&1); printf '== %s\\n%s\\n' {1} \"$out\") &".format(
+            _connectivity_probe(ip), ip) for ip in ips)
+    script = probes + " wait"
+    cmd = 'sh -c "{0}"'.format(
+        script.replace('"', '\\"').replace('$', '\\$'))
+    output = kubectl_pod_exec(pod, cmd)
+    output = output.decode('utf-8') if output else ""
+    chunks = {}
+    ip = None
+    for line in output.splitlines():
+        if line.startswith("== "):
+            ip = line[3:].strip()
+            chunks[ip] = []
+        elif ip is not None:
+            chunks[ip].append(line)
+    results = {}
+    for ip in ips:
+        chunk = "\n".join(chunks.get(ip, []))
+        connected = _connectivity_from_output(chunk) if ip in chunks \
+            else None
+        results[ip] = (connected, chunk or output)
+    return results
+
+
+def check_pods_connectivity(source_pods, target_pods,
+                            allow_connectivity=True, timeout=300,
+                            retries=3, interval=5):
+    """
+    Check connectivity from every source pod to every target pod. Source
+    pods are probed concurrently, each with all its pending targets in one
+    exec. Only pairs that were inconclusive or did not match
+    allow_connectivity are probed again: inconclusive ones until timeout,
+    mismatching ones at most `retries` times.
+    :return: ConnectivityReport
+    """
+    report = ConnectivityReport(allow_connectivity)
+    pending = {pod.name: list(target_pods) for pod in source_pods}
+    pods = {pod.name: pod for pod in source_pods}
+    attempts = {}
+    start = time.time()
+    while True:
+        def probe(name):
+            probe_start = time.time()
+            results = _probe_targets(pods[name], pending[name])
+            return name, results, time.time() - probe_start
+
+        workers = max(1, min(len(pending), 16))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            probed = list(executor.map(probe, list(pending)))
+        for name, results, duration in probed:
+            still_pending = []
+            for target in pending[name]:
+                connected, output = results[target.status.podIp]
+                report.add(pods[name], target, connected, output, duration)
+                key = (name, target.name)
+                if connected is None:
+                    still_pending.append(target)
+                elif connected is not allow_connectivity:
+                    attempts[key] = attempts.get(key, 0) + 1
+                    if attempts[key] < retries:
+                        still_pending.append(target)
+            pending[name] = still_pending
+        pending = {k: v for k, v in pending.items() if v}
+        if not pending or time.time() - start > timeout:
+            break
+        time.sleep(interval)
+    print(report.summary())
+    return report
+
+
 def check_connectivity_between_workloads(p_client1, workload1, p_client2,
                                          workload2, allow_connectivity=True):
     wl1_pods = p_client1.list_pod(workloadId=workload1.id).data
     wl2_pods = p_client2.list_pod(workloadId=workload2.id).data
-    for pod in wl1_pods:
-        for o_pod in wl2_pods:
-            check_connectivity_between_pods(pod, o_pod, allow_connectivity)
+    report = check_pods_connectivity(wl1_pods, wl2_pods, allow_connectivity)
+    assert not report.failures, report.summary()
+    return report
 
 
 def check_connectivity_between_workload_pods(p_client, workload):
     pods = p_client.list_pod(workloadId=workload.id).data
-    for pod in pods:
-        for o_pod in pods:
-            check_connectivity_between_pods(pod, o_pod)
+    report = check_pods_connectivity(pods, pods)
+    assert not report.failures, report.summary()
+    return report
 
 
 def check_connectivity_between_pods(pod1, pod2, allow_connectivity=True):
-    pod_ip = pod2.status.podIp
-
-    if is_windows():
-        cmd = 'ping -w 1 -n 1 {0}'.format(pod_ip)
-    elif HARDENED_CLUSTER:
-        cmd = 'curl -I {}:{}'.format(pod_ip, TEST_IMAGE_PORT)
-    else:
-        cmd = "ping -c 1 -W 1 " + pod_ip
-
-    response = retry_cmd_validate_expected(pod1, cmd, pod_ip)
-    if not HARDENED_CLUSTER:
-        assert pod_ip in str(response)
-    if allow_connectivity:
-        if is_windows():
-            assert " (0% loss)" in str(response)
-        elif HARDENED_CLUSTER:
-            assert " 200 OK" in str(response)
-        else:
-            assert " 0% packet loss" in str(response)
-    else:
-        if is_windows():
-            assert " (100% loss)" in str(response)
-        elif HARDENED_CLUSTER:
-            assert " 200 OK" not in str(response)
-        else:
-            assert " 100% packet loss" in str(response)
+    report = check_pods_connectivity([pod1], [pod2], allow_connectivity)
+    assert not report.failures, report.summary()
+    return report
 
 
 def kubectl_pod_exec(pod, cmd):
@@ -1346,17 +1638,18 @@ def exec_shell_command(ip, port, cmd, password, user="root", sshKey=None):
 
 
 def wait_for_ns_to_become_active(client, ns, timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     start = time.time()
     time.sleep(10)
-    nss = client.list_namespace(uuid=ns.uuid).data
+    nss = cached_list(client, "namespace", uuid=ns.uuid)
     assert len(nss) == 1
     ns = nss[0]
     while ns.state != "active":
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
-        nss = client.list_namespace(uuid=ns.uuid).data
+        pause(.5)
+        nss = cached_list(client, "namespace", uuid=ns.uuid)
         assert len(nss) == 1
         ns = nss[0]
     return ns
@@ -1386,15 +1679,16 @@ def wait_for_pod_images(p_client, workload, ns_name, expectedimage, numofpods,
 
 def wait_for_pods_in_workload(p_client, workload, pod_count,
                               timeout=DEFAULT_TIMEOUT):
+    watch_client(p_client)
     start = time.time()
-    pods = p_client.list_pod(workloadId=workload.id).data
+    pods = cached_list(p_client, "pod", workloadId=workload.id)
     while len(pods) != pod_count:
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for pods in workload {}. Expected {}. "
                 "Got {}".format(workload.name, pod_count, len(pods)))
-        time.sleep(.5)
-        pods = p_client.list_pod(workloadId=workload.id).data
+        pause(.5)
+        pods = cached_list(p_client, "pod", workloadId=workload.id)
     return pods
 
 
@@ -1460,10 +1754,11 @@ def validate_cluster_state(client, cluster,
 
 
 def wait_until_available(client, obj, timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     start = time.time()
     sleep = 0.01
     while True:
-        time.sleep(sleep)
+        pause(sleep)
         sleep *= 2
         if sleep > 2:
             sleep = 2
@@ -1527,7 +1822,8 @@ def validate_hostPort(p_client, workload, source_port, cluster):
             host_ip = resolve_node_ip(node)
             curl_cmd = " http://" + host_ip + ":" + \
                        str(source_port) + "/name.html"
-            validate_http_response(curl_cmd, target_name_list)
+            validate_http_response(curl_cmd, target_name_list,
+                                   reuse_connections=False)
 
 
 def validate_lb(p_client, workload, source_port):
@@ -1537,7 +1833,8 @@ def validate_lb(p_client, workload, source_port):
     assert source_port == source_port_wk, "Source ports do not match"
     target_name_list = get_target_names(p_client, [workload])
     wait_until_lb_is_active(url)
-    validate_http_response(url + "/name.html", target_name_list)
+    validate_http_response(url + "/name.html", target_name_list,
+                           reuse_connections=False)
 
 
 def validate_nodePort(p_client, workload, cluster, source_port):
@@ -1555,7 +1852,8 @@ def validate_nodePort(p_client, workload, cluster, source_port):
         host_ip = resolve_node_ip(node)
         curl_cmd = " http://" + host_ip + ":" + \
                    str(source_port_wk) + "/name.html"
-        validate_http_response(curl_cmd, target_name_list)
+        validate_http_response(curl_cmd, target_name_list,
+                               reuse_connections=False)
 
 
 def validate_clusterIp(p_client, workload, cluster_ip, test_pods, source_port):
@@ -1570,6 +1868,7 @@ def validate_clusterIp(p_client, workload, cluster_ip, test_pods, source_port):
 
 
 def wait_for_pv_to_be_available(c_client, pv_object, timeout=DEFAULT_TIMEOUT):
+    watch_client(c_client)
     start = time.time()
     time.sleep(2)
     list = c_client.list_persistent_volume(uuid=pv_object.uuid).data
@@ -1579,7 +1878,7 @@ def wait_for_pv_to_be_available(c_client, pv_object, timeout=DEFAULT_TIMEOUT):
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to available")
-        time.sleep(.5)
+        pause(.5)
         list = c_client.list_persistent_volume(uuid=pv_object.uuid).data
         assert len(list) == 1
         pv = list[0]
@@ -1587,6 +1886,7 @@ def wait_for_pv_to_be_available(c_client, pv_object, timeout=DEFAULT_TIMEOUT):
 
 
 def wait_for_pvc_to_be_bound(p_client, pvc_object, timeout=DEFAULT_TIMEOUT):
+    watch_client(p_client)
     start = time.time()
     time.sleep(2)
     list = p_client.list_persistent_volume_claim(uuid=pvc_object.uuid).data
@@ -1596,7 +1896,7 @@ def wait_for_pvc_to_be_bound(p_client, pvc_object, timeout=DEFAULT_TIMEOUT):
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to bound")
-        time.sleep(.5)
+        pause(.5)
         list = p_client.list_persistent_volume_claim(uuid=pvc_object.uuid).data
         assert len(list) == 1
         pvc = list[0]
@@ -1657,6 +1957,7 @@ def validate_file_content(pod, content, filename):
 
 def wait_for_mcapp_to_active(client, multiClusterApp,
                              timeout=DEFAULT_MULTI_CLUSTER_APP_TIMEOUT):
+    watch_client(client)
     time.sleep(5)
     # When the app is deployed it goes into Active state for a short
     # period of time and then into installing/deploying.
@@ -1669,7 +1970,7 @@ def wait_for_mcapp_to_active(client, multiClusterApp,
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
+        pause(.5)
         multiclusterapps = client.list_multiClusterApp(
             uuid=multiClusterApp.uuid, name=multiClusterApp.name).data
         assert len(multiclusterapps) == 1
@@ -1995,75 +2296,158 @@ def rbac_prepare():
     """this function creates one project, one namespace,
     and four users with different roles"""
     admin_client, cluster = get_global_admin_client_and_cluster()
-    create_kubeconfig(cluster)
-    # create a new project in the cluster
-    project, ns = create_project_and_ns(ADMIN_TOKEN,
-                                        cluster,
-                                        random_test_name("p-test-rbac"))
+    if RBAC_REUSE and rbac_load_fixtures(admin_client, cluster):
+        create_kubeconfig(cluster)
+        print("Reusing the RBAC fixtures of " + RBAC_FIXTURES_FILE)
+        return
     con = [{"name": "test1",
             "image": TEST_IMAGE}]
-    name = random_test_name("default")
-    p_client = get_project_client_for_token(project, ADMIN_TOKEN)
-    workload = p_client.create_workload(name=name,
-                                        containers=con,
-                                        namespaceId=ns.id)
-    validate_workload(p_client, workload, "deployment", ns.name)
-    rbac_data["workload"] = workload
-    rbac_data["project"] = project
-    rbac_data["namespace"] = ns
-    # create new users
-    for key in rbac_data["users"]:
-        user1, token1 = create_user(admin_client)
-        rbac_data["users"][key]["user"] = user1
-        rbac_data["users"][key]["token"] = token1
-
-    # assign different role to each user
-    assign_members_to_cluster(admin_client,
-                              rbac_data["users"][CLUSTER_OWNER]["user"],
-                              cluster,
-                              CLUSTER_OWNER)
-    assign_members_to_cluster(admin_client,
-                              rbac_data["users"][CLUSTER_MEMBER]["user"],
-                              cluster,
-                              CLUSTER_MEMBER)
-    assign_members_to_project(admin_client,
-                              rbac_data["users"][PROJECT_MEMBER]["user"],
-                              project,
-                              PROJECT_MEMBER)
-    assign_members_to_project(admin_client,
-                              rbac_data["users"][PROJECT_OWNER]["user"],
-                              project,
-                              PROJECT_OWNER)
-    assign_members_to_project(admin_client,
-                              rbac_data["users"][PROJECT_READ_ONLY]["user"],
-                              project,
-                              PROJECT_READ_ONLY)
-    # create kubeconfig files for each user
-    for key in rbac_data["users"]:
-        user_client = get_client_for_token(rbac_data["users"][key]["token"])
+
+    def create_project_with_workload(prefix):
+        project, ns = create_project_and_ns(ADMIN_TOKEN,
+                                            cluster,
+                                            random_test_name(prefix))
+        p_client = get_project_client_for_token(project, ADMIN_TOKEN)
+        workload = p_client.create_workload(name=random_test_name("default"),
+                                            containers=con,
+                                            namespaceId=ns.id)
+        validate_workload(p_client, workload, "deployment", ns.name)
+        return project, ns, workload
+
+    def assign_member(role, user, project):
+        if role in (CLUSTER_OWNER, CLUSTER_MEMBER):
+            assign_members_to_cluster(admin_client, user, cluster, role)
+        else:
+            assign_members_to_project(admin_client, user, project, role)
+
+    def create_user_kubeconfig(role, token):
+        user_client = get_client_for_token(token)
         _, user_cluster = get_user_client_and_cluster(user_client)
-        rbac_data["users"][key]["kubeconfig"] = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)),
-            key + "_kubeconfig")
-        create_kubeconfig(user_cluster, rbac_data["users"][key]["kubeconfig"])
-
-    # create another project that none of the above users are assigned to
-    p2, ns2 = create_project_and_ns(ADMIN_TOKEN,
-                                    cluster,
-                                    random_test_name("p-unshared"))
-    name = random_test_name("default")
-    p_client = get_project_client_for_token(p2, ADMIN_TOKEN)
-    workload = p_client.create_workload(name=name,
-                                        containers=con,
-                                        namespaceId=ns2.id)
-    validate_workload(p_client, workload, "deployment", ns2.name)
-    rbac_data["p_unshared"] = p2
-    rbac_data["ns_unshared"] = ns2
-    rbac_data["wl_unshared"] = workload
+        if RBAC_REUSE:
+            # kept for the next runs, next to the fixtures
+            kubeconfig = rbac_private_file(role + "_kubeconfig")
+        else:
+            kubeconfig = os.path.join(
+                os.path.dirname(os.path.realpath(__file__)),
+                role + "_kubeconfig")
+        create_kubeconfig(user_cluster, kubeconfig)
+        return kubeconfig
+
+    # steps start as soon as the steps they depend on are done: the users,
+    # both projects and the admin kubeconfig are independent, a binding
+    # needs its user and the project, a user kubeconfig needs the binding
+    graph = TaskGraph()
+    # validate_workload reads the pods with the admin kubeconfig
+    graph.add("kubeconfig", lambda: create_kubeconfig(cluster))
+    graph.add("project", lambda _: create_project_with_workload(
+        "p-test-rbac"), "kubeconfig")
+    # another project that none of the users are assigned to
+    graph.add("p_unshared", lambda _: create_project_with_workload(
+        "p-unshared"), "kubeconfig")
+    for role in rbac_data["users"]:
+        graph.add("user " + role, lambda: create_user(admin_client))
+        graph.add("member " + role,
+                  lambda user, project, role=role: assign_member(
+                      role, user[0], project[0]),
+                  "user " + role, "project")
+        graph.add("kubeconfig " + role,
+                  lambda user, _, role=role: create_user_kubeconfig(
+                      role, user[1]),
+                  "user " + role, "member " + role)
+    results = graph.run()
+
+    rbac_data["project"], rbac_data["namespace"], rbac_data["workload"] = \
+        results["project"]
+    rbac_data["p_unshared"], rbac_data["ns_unshared"], \
+        rbac_data["wl_unshared"] = results["p_unshared"]
+    for role in rbac_data["users"]:
+        user, token = results["user " + role]
+        rbac_data["users"][role]["user"] = user
+        rbac_data["users"][role]["token"] = token
+        rbac_data["users"][role]["kubeconfig"] = \
+            results["kubeconfig " + role]
+    if RBAC_REUSE:
+        rbac_save_fixtures(cluster)
+
+
+def rbac_save_fixtures(cluster):
+    """Write the ids of the RBAC fixtures for the next run"""
+    state = {"server": CATTLE_TEST_URL, "cluster": cluster.id, "users": {}}
+    for key in ("project", "namespace", "workload", "p_unshared",
+                "ns_unshared", "wl_unshared"):
+        state[key] = rbac_data[key].id
+    for role, value in rbac_data["users"].items():
+        state["users"][role] = {"user": value["user"].id,
+                                "token": value["token"],
+                                "kubeconfig": value["kubeconfig"]}
+    with open(rbac_private_file(os.path.basename(RBAC_FIXTURES_FILE)),
+              "w") as f:
+        json.dump(state, f)
+
+
+def rbac_private_file(name):
+    """Create a file of RBAC_FIXTURES_DIR only the owner can read"""
+    os.makedirs(RBAC_FIXTURES_DIR, mode=0o700, exist_ok=True)
+    path = os.path.join(RBAC_FIXTURES_DIR, name)
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    # O_CREAT does not change the mode of an existing file
+    os.chmod(path, 0o600)
+    return path
+
+
+def rbac_load_fixtures(admin_client, cluster):
+    """
+    Fill rbac_data from the fixtures a previous run left on this server
+    @return: False if there are none or any of them is gone
+    """
+    try:
+        with open(RBAC_FIXTURES_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if state.get("server") != CATTLE_TEST_URL or \
+            state.get("cluster") != cluster.id:
+        return False
+    try:
+        c_client = get_cluster_client_for_token(cluster, ADMIN_TOKEN)
+        loaded = {}
+        for p, ns, wl in (("project", "namespace", "workload"),
+                          ("p_unshared", "ns_unshared", "wl_unshared")):
+            loaded[p] = admin_client.by_id_project(state[p])
+            loaded[ns] = c_client.by_id_namespace(state[ns])
+            p_client = get_project_client_for_token(loaded[p], ADMIN_TOKEN)
+            loaded[wl] = p_client.by_id_workload(state[wl])
+        users = {}
+        for role in rbac_data["users"]:
+            value = state["users"][role]
+            user = admin_client.by_id_user(value["user"])
+            # fails if the token expired or was removed
+            get_client_for_token(value["token"]).list_cluster()
+            if user is None or not os.path.isfile(value["kubeconfig"]):
+                return False
+            users[role] = {"user": user, "token": value["token"],
+                           "kubeconfig": value["kubeconfig"]}
+    except Exception as e:
+        print("Unable to reuse the RBAC fixtures: {}".format(e))
+        return False
+    if any(v is None for v in loaded.values()):
+        return False
+    rbac_data.update(loaded)
+    for role, value in users.items():
+        rbac_data["users"][role].update(value)
+    return True
 
 
 def rbac_cleanup():
     """ remove the project, namespace and users created for the RBAC tests"""
+    if RBAC_REUSE and not RBAC_REUSE_CLEANUP:
+        print("Keeping the RBAC fixtures for the next run")
+        return
+    if RBAC_REUSE:
+        for path in [RBAC_FIXTURES_FILE] + \
+                [v.get("kubeconfig") for v in rbac_data["users"].values()]:
+            if path is not None and os.path.isfile(path):
+                os.remove(path)
     try:
         client = get_admin_client()
     except Exception:
@@ -2107,6 +2491,7 @@ def create_catalog_external_id(catalog_name, template, version,
 
 
 def wait_for_catalog_active(client, catalog, timeout=DEFAULT_CATALOG_TIMEOUT):
+    watch_client(client)
     time.sleep(2)
     catalog_data = client.list_catalog(name=catalog.name)
     print(catalog_data)
@@ -2117,7 +2502,7 @@ def wait_for_catalog_active(client, catalog, timeout=DEFAULT_CATALOG_TIMEOUT):
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
+        pause(.5)
         catalog_data = client.list_catalog(name=catalog.name)
         assert len(catalog_data["data"]) >= 1
         catalog = catalog_data["data"][0]
@@ -2575,12 +2960,12 @@ def auth_resource_cleanup():
 class WebsocketLogParse:
     """
     the class is used for receiving and parsing the message
-    received from the websocket
+    received from the websocket, the output is kept in a StreamBuffer
+    so callers can wait for a text instead of polling last_message
     """
 
-    def __init__(self):
-        self.lock = Lock()
-        self._last_message = ''
+    def __init__(self, max_lines=MAX_LINES):
+        self.buffer = StreamBuffer(max_lines)
 
     def receiver(self, socket, skip, b64=True):
         """
@@ -2588,45 +2973,55 @@ class WebsocketLogParse:
         :param socket: the socket connection
         :param skip: if True skip the first char of the received message
         """
+        # a multi-byte character can be split across two messages
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
         while True and socket.connected:
             try:
                 data = socket.recv()
                 # the message from the kubectl contains an extra char
                 if skip:
                     data = data[1:]
-                if len(data) < 5:
-                    pass
                 if b64:
-                    data = base64.b64decode(data).decode()
-                self.lock.acquire()
-                self._last_message += data
-                self.lock.release()
+                    data = decoder.decode(base64.b64decode(data))
+                elif isinstance(data, bytes):
+                    data = decoder.decode(data)
+                self.buffer.feed(data)
             except websocket.WebSocketConnectionClosedException:
                 print("Connection closed")
                 break
             except websocket.WebSocketProtocolException as wpe:
                 print("Error: {}".format(wpe))
                 break
+        self.buffer.close()
 
     @staticmethod
     def start_thread(target, args):
         thread = Thread(target=target, args=args)
         thread.daemon = True
         thread.start()
-        time.sleep(1)
+
+    def wait_for(self, patterns, timeout=DEFAULT_TIMEOUT, require_all=True):
+        """
+        wait until the patterns were received, returns the missing ones
+        :param patterns: the strings to wait for
+        :param require_all: if False any one of the patterns is enough
+        """
+        watch = self.buffer.wait_for(patterns, timeout, require_all)
+        return watch.missing if require_all or not watch.found else []
 
     @property
     def last_message(self):
-        return self._last_message
+        return self.buffer.text
 
     @last_message.setter
     def last_message(self, value):
-        self.lock.acquire()
-        self._last_message = value
-        self.lock.release()
+        self.buffer.clear()
+        if value:
+            self.buffer.feed(value)
 
 
 def wait_for_cluster_delete(client, cluster_name, timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     start = time.time()
     cluster = client.list_cluster(name=cluster_name).data
     cluster_count = len(cluster)
@@ -2634,7 +3029,7 @@ def wait_for_cluster_delete(client, cluster_name, timeout=DEFAULT_TIMEOUT):
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for cluster to get deleted")
-        time.sleep(.5)
+        pause(.5)
         cluster = client.list_cluster(name=cluster_name).data
         cluster_count = len(cluster)
 
@@ -2657,17 +3052,59 @@ def create_connection(url, subprotocols):
     return ws
 
 
+def create_websocket_session(url, subprotocols):
+    """
+    create an asyncio websocket session authenticated like
+    create_connection, connect it with await session.connect()
+    :param url: the url to connect to
+    :param subprotocols: the list of subprotocols
+    :return:
+    """
+    return WebsocketSession(url, subprotocols,
+                            cookie="R_SESS=" + USER_TOKEN)
+
+
+def get_pod_websocket_url(cluster, ns_name, pod, action, params):
+    """
+    the websocket url of the exec or log endpoint of the first
+    container of a pod, proxied by rancher
+    :param action: exec or log
+    :param params: the query parameters of the endpoint
+    """
+    url_base = 'wss://' + CATTLE_TEST_URL[8:] + \
+               '/k8s/clusters/' + cluster.id + \
+               '/api/v1/namespaces/' + ns_name + \
+               '/pods/' + pod.name + \
+               '/' + action + '?container=' + pod.containers[0].name
+    return url_base + "&" + urlencode(params, doseq=True, quote_via=quote,
+                                      safe='()')
+
+
+def get_pod_exec_url(cluster, ns_name, pod, command=POD_SHELL_COMMAND,
+                     tty=True):
+    params = {"stdout": 1, "stdin": 1, "stderr": 1, "tty": int(tty),
+              "command": command}
+    return get_pod_websocket_url(cluster, ns_name, pod, 'exec', params)
+
+
+def get_pod_log_url(cluster, ns_name, pod, tail_lines=500):
+    params = {"tailLines": tail_lines, "follow": True,
+              "timestamps": True, "previous": False}
+    return get_pod_websocket_url(cluster, ns_name, pod, 'log', params)
+
+
 def wait_for_hpa_to_active(client, hpa, timeout=DEFAULT_TIMEOUT):
+    watch_client(client)
     start = time.time()
-    hpalist = client.list_horizontalPodAutoscaler(uuid=hpa.uuid).data
+    hpalist = cached_list(client, "horizontalPodAutoscaler", uuid=hpa.uuid)
     assert len(hpalist) == 1
     hpa = hpalist[0]
     while hpa.state != "active":
         if time.time() - start > timeout:
             raise AssertionError(
                 "Timed out waiting for state to get to active")
-        time.sleep(.5)
-        hpas = client.list_horizontalPodAutoscaler(uuid=hpa.uuid).data
+        pause(.5)
+        hpas = cached_list(client, "horizontalPodAutoscaler", uuid=hpa.uuid)
         assert len(hpas) == 1
         hpa = hpas[0]
     return hpa
@@ -2790,9 +3227,10 @@ def get_node_details(cluster, client):
     return client, node
 
 
-def create_service_account_configfile():
-    client, cluster = get_user_client_and_cluster()
-    create_kubeconfig(cluster)
+def create_service_account_configfile(client=None, cluster=None):
+    if cluster is None:
+        client, cluster = get_user_client_and_cluster()
+        create_kubeconfig(cluster)
     name = random_name()
     # create a service account
     execute_kubectl_cmd(cmd="create sa {}".format(name), json_out=False)
@@ -2861,48 +3299,76 @@ def rbac_test_file_reader(file_path=None):
     with open(file_path) as reader:
         test_cases = json.loads(reader.read().replace("{resource_root}",
                                                       DATA_SUBDIR))
-    output = []
-    for cluster_role, checks in test_cases.items():
+    client, cluster = get_user_client_and_cluster()
+    create_kubeconfig(cluster)
+
+    def create_role_service_account(cluster_role):
         # create a service account for each role
-        name = create_service_account_configfile()
+        name = create_service_account_configfile(client, cluster)
         # create the cluster role binding
         cmd = "create clusterrolebinding {} " \
               "--clusterrole {} " \
               "--serviceaccount {}".format(name, cluster_role,
                                            "default:" + name)
         execute_kubectl_cmd(cmd, json_out=False)
+        return name
+
+    with ThreadPoolExecutor(max_workers=len(test_cases) or 1) as executor:
+        names = list(executor.map(create_role_service_account, test_cases))
+    output = []
+    matrix = get_rbac_matrix()
+    for (cluster_role, checks), name in zip(test_cases.items(), names):
         for command in checks["should_pass"]:
             output.append((cluster_role, command, True, name))
+            matrix.add(cluster_role, name, command, True)
         for command in checks["should_fail"]:
             output.append((cluster_role, command, False, name))
+            matrix.add(cluster_role, name, command, False)
 
     return output
 
 
+def kubectl_check_rbac(name, command):
+    """Run command with the kubeconfig of service account name
+    @return: False if it was forbidden"""
+    config_file = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                               name + ".yaml")
+    result = execute_kubectl_cmd(command,
+                                 json_out=False,
+                                 kubeconfig=config_file,
+                                 stderr=True).decode('utf_8')
+    return "Error from server (Forbidden)" not in result
+
+
+def get_rbac_matrix():
+    global rbac_matrix
+    if rbac_matrix is None:
+        rbac_matrix = RBACMatrix(kube_fname, kubectl_check_rbac)
+    return rbac_matrix
+
+
 def validate_cluster_role_rbac(cluster_role, command, authorization, name):
     """
-     This methods creates a new service account to validate the permissions
-     both before and after creating the cluster role binding between the
-     service account and the cluster role
+     This methods checks the permissions of the service account bound to
+     the cluster role. All the checks of the role are evaluated together the
+     first time, see RBACMatrix, which prints one pass/fail table per role
     :param cluster_role:  the cluster role
     :param command: the kubectl command to run
     :param authorization: if the service account has the permission: True/False
     :param name: the name of the service account, cluster role binding, and the
     kubeconfig file
     """
-
-    config_file = os.path.join(os.path.dirname(os.path.realpath(__file__)),
-                               name + ".yaml")
-    result = execute_kubectl_cmd(command,
-                                 json_out=False,
-                                 kubeconfig=config_file,
-                                 stderr=True).decode('utf_8')
+    check = get_rbac_matrix().result(cluster_role, name, command,
+                                     authorization)
+    assert check.error is None, \
+        "Unable to check {} for {}: {}".format(command, cluster_role,
+                                               check.error)
     if authorization:
-        assert "Error from server (Forbidden)" not in result, \
+        assert check.allowed, \
             "{} should have the authorization to run {}".format(cluster_role,
                                                                 command)
     else:
-        assert "Error from server (Forbidden)" in result, \
+        assert not check.allowed, \
             "{} should NOT have the authorization to run {}".format(
                 cluster_role, command)
 
@@ -2994,47 +3460,27 @@ def update_and_validate_kdm(kdm_url, admin_token=ADMIN_TOKEN,
 
 def prepare_hardened_nodes(aws_nodes, profile, node_roles,
                            client=None, cluster=None, custom_cluster=False):
-    i = 0
     conf_file = DATA_SUBDIR + "/sysctl-config"
+    with open(conf_file, 'r') as f:
+        sysctl_commands = [line.strip() for line in f if line.strip()]
     if profile == 'rke-cis-1.4':
-        for aws_node in aws_nodes:
-            file1 = open(conf_file, 'r')
-            while True:
-                line = file1.readline()
-                if not line:
-                    break
-                aws_node.execute_command(line.strip())
-            if "etcd" in node_roles[i]:
-                aws_node.execute_command("sudo useradd etcd")
-            if custom_cluster:
-                docker_run_cmd = \
-                    get_custom_host_registration_cmd(client,
-                                                     cluster,
-                                                     node_roles[i],
-                                                     aws_node)
-                aws_node.execute_command(docker_run_cmd)
-            i += 1
+        etcd_commands = ["sudo useradd etcd"]
     elif profile == 'rke-cis-1.5':
-        for aws_node in aws_nodes:
-            file1 = open(conf_file, 'r')
-            while True:
-                line = file1.readline()
-                if not line:
-                    break
-                aws_node.execute_command(line.strip())
-            if "etcd" in node_roles[i]:
-                aws_node.execute_command("sudo groupadd -g 52034 etcd")
-                aws_node.execute_command("sudo useradd -u 52034 -g 52034 etcd")
-            if custom_cluster:
-                docker_run_cmd = \
-                    get_custom_host_registration_cmd(client,
-                                                     cluster,
-                                                     node_roles[i],
-                                                     aws_node)
-                aws_node.execute_command(docker_run_cmd)
-            i += 1
+        etcd_commands = ["sudo groupadd -g 52034 etcd",
+                         "sudo useradd -u 52034 -g 52034 etcd"]
+    else:
+        return aws_nodes
+    tasks = []
+    for i, aws_node in enumerate(aws_nodes):
+        commands = list(sysctl_commands)
+        if "etcd" in node_roles[i]:
+            commands += etcd_commands
+        if custom_cluster:
+            commands.append(get_custom_host_registration_cmd(
+                client, cluster, node_roles[i], aws_node))
+        tasks.append((aws_node, commands))
+    ClusterShell().run_tasks(tasks).raise_on_failure()
     time.sleep(5)
-    file1.close()
     return aws_nodes
 
 
@@ -4,8 +4,9 @@ import pytest
 import re
 import time
 from lib.aws import AWS_USER
+from lib.cluster_shell import ClusterShell
 from .common import (
-    ADMIN_PASSWORD, AmazonWebServices, run_command, wait_for_status_code,
+    ADMIN_PASSWORD, AmazonWebServices, run_command, wait_for_status_codes,
     TEST_IMAGE, TEST_IMAGE_NGINX, TEST_IMAGE_OS_BASE, readDataFile,
     DEFAULT_CLUSTER_STATE_TIMEOUT, compare_versions
 )
@@ -139,9 +140,8 @@ def test_deploy_private_registry_without_image_push():
 
 def setup_rancher_server():
     base_url = "https://" + RANCHER_AG_HOSTNAME
-    wait_for_status_code(url=base_url + "/v3", expected_code=401)
     auth_url = base_url + "/v3-public/localproviders/local?action=login"
-    wait_for_status_code(url=auth_url, expected_code=200)
+    wait_for_status_codes({base_url + "/v3": 401, auth_url: 200})
     set_url_and_password(base_url, "https://" + RANCHER_AG_INTERNAL_HOSTNAME, version=RANCHER_SERVER_VERSION)
 
 
@@ -342,6 +342,8 @@ def prepare_airgap_node(bastion_node, number_of_nodes):
     ag_nodes = AmazonWebServices().create_multiple_nodes(
         number_of_nodes, node_name, public_ip=False)
 
+    # every airgap node is prepared over its own channel on the bastion
+    tasks = []
     for num, ag_node in enumerate(ag_nodes):
         # Update docker for the user in node
         ag_node_update_docker = \
@@ -349,7 +351,6 @@ def prepare_airgap_node(bastion_node, number_of_nodes):
             '"sudo usermod -aG docker {}"'.format(
                 bastion_node.ssh_key_name, AWS_USER,
                 ag_node.private_ip_address, AWS_USER)
-        bastion_node.execute_command(ag_node_update_docker)
 
         # Update docker in node with bastion cert details
         ag_node_create_dir = \
@@ -359,7 +360,6 @@ def prepare_airgap_node(bastion_node, number_of_nodes):
                 bastion_node.ssh_key_name, AWS_USER,
                 ag_node.private_ip_address, bastion_node.host_name,
                 AWS_USER, bastion_node.host_name)
-        bastion_node.execute_command(ag_node_create_dir)
 
         ag_node_write_cert = \
             'scp -i "{}.pem" -o StrictHostKeyChecking=no ' \
@@ -367,14 +367,12 @@ def prepare_airgap_node(bastion_node, number_of_nodes):
             '{}@{}:/etc/docker/certs.d/{}/ca.crt'.format(
                 bastion_node.ssh_key_name, bastion_node.host_name,
                 AWS_USER, ag_node.private_ip_address, bastion_node.host_name)
-        bastion_node.execute_command(ag_node_write_cert)
 
         ag_node_restart_docker = \
             'ssh -i "{}.pem" -o StrictHostKeyChecking=no {}@{} ' \
             '"sudo service docker restart"'.format(
                 bastion_node.ssh_key_name, AWS_USER,
                 ag_node.private_ip_address)
-        bastion_node.execute_command(ag_node_restart_docker)
 
         ag_node_user_own_docker = \
             'ssh -i "{0}.pem" -o StrictHostKeyChecking=no {1}@{2} ' \
@@ -382,8 +380,13 @@ def prepare_airgap_node(bastion_node, number_of_nodes):
             'sudo chmod g+rwx "/home/{1}/.docker" -R"'.format(
                 bastion_node.ssh_key_name, AWS_USER,
                 ag_node.private_ip_address)
-        bastion_node.execute_command(ag_node_user_own_docker)
 
+        tasks.append((bastion_node, [
+            ag_node_update_docker, ag_node_create_dir, ag_node_write_cert,
+            ag_node_restart_docker, ag_node_user_own_docker]))
+
+    ClusterShell().run_tasks(tasks).raise_on_failure()
+    for num, ag_node in enumerate(ag_nodes):
         print("Airgapped Instance Details:\nNAME: {}-{}\nPRIVATE IP: {}\n"
               "".format(node_name, num, ag_node.private_ip_address))
     return ag_nodes
@@ -6,7 +6,7 @@ import time
 from .common import (
     ADMIN_PASSWORD,
     AmazonWebServices,
-    run_command, wait_for_status_code
+    run_command, wait_for_status_codes
 )
 from .test_custom_host_reg import RANCHER_SERVER_VERSION
 
@@ -18,6 +18,7 @@ from .test_create_ha import (
     KUBERNETES_VERSION
 )
 from lib.aws import AWS_USER
+from lib.cluster_shell import ClusterShell
 
 AWS_AMI = os.environ.get("AWS_AMI", "ami-012fd49f6b0c404c7")
 DOCKER_COMPOSE_VERSION = os.environ.get("DOCKER_COMPOSE_VERSION", "1.24.1")
@@ -120,9 +121,8 @@ def test_deploy_airgap_ha_rancher(check_hostname_length):
 
 def setup_rancher_server(bastion_node):
     base_url = "https://" + RANCHER_AG_HOSTNAME
-    wait_for_status_code(url=base_url + "/v3", expected_code=401)
     auth_url = base_url + "/v3-public/localproviders/local?action=login"
-    wait_for_status_code(url=auth_url, expected_code=200)
+    wait_for_status_codes({base_url + "/v3": 401, auth_url: 200})
     get_bootstrap_passwd = "export KUBECONFIG=~/kube_config_config.yaml && " \
     "/snap/bin/kubectl get secret --namespace cattle-system bootstrap-secret -o " \
     """go-template='{{.data.bootstrapPassword|base64decode}}{{"\\n"}}'"""
@@ -264,14 +264,17 @@ def prepare_airgap_node(bastion_node, number_of_nodes):
     ag_nodes = AmazonWebServices().create_multiple_nodes(
         number_of_nodes, node_name, ami=AWS_AMI, public_ip=False)
 
+    # every airgap node is prepared over its own channel on the bastion
+    tasks = []
     for num, ag_node in enumerate(ag_nodes):
+        commands = []
         # Update docker for the user in node
         ag_node_update_docker = \
             'ssh -i "{}.pem" -o StrictHostKeyChecking=no {}@{} ' \
             '"sudo usermod -aG docker {}"'.format(
                 bastion_node.ssh_key_name, AWS_USER,
                 ag_node.private_ip_address, AWS_USER)
-        bastion_node.execute_command(ag_node_update_docker)
+        commands.append(ag_node_update_docker)
         if PRIVATE_REGISTRY_USERNAME is not None:
             # assuming that we setup the auth-enabled registry from the other
             # airgap job, which uses self signed certs on the registry. We 
@@ -287,7 +290,9 @@ def prepare_airgap_node(bastion_node, number_of_nodes):
                 bastion_node.ssh_key_name, AWS_USER,
                 ag_node.private_ip_address, bastion_node.host_name, 
                 bastion_node.host_name)
-            bastion_node.execute_command(ss_certs_command)
+            commands.append(ss_certs_command)
+        tasks.append((bastion_node, commands))
+    ClusterShell().run_tasks(tasks).raise_on_failure()
     return ag_nodes
 
 
@@ -155,10 +155,9 @@ def test_install_rancher_ha(precheck_certificate_options):
     # Here we use helm to install the Rancher chart
     install_rancher(extra_settings=extra_settings)
     set_route53_with_ingress()
-    wait_for_status_code(url=RANCHER_SERVER_URL + "/v3", expected_code=401)
     auth_url = \
         RANCHER_SERVER_URL + "/v3-public/localproviders/local?action=login"
-    wait_for_status_code(url=auth_url, expected_code=200)
+    wait_for_status_codes({RANCHER_SERVER_URL + "/v3": 401, auth_url: 200})
     admin_client = set_url_and_password(RANCHER_SERVER_URL)
     cluster = get_cluster_by_name(admin_client, "local")
     validate_cluster_state(admin_client, cluster, False)
@@ -145,24 +145,17 @@ def validate_websocket_view_logs():
 
 
 def wait_for_match(wslog, url, timeout=DEFAULT_TIMEOUT):
-    start = time.time()
-    found = False
-
     ws = create_connection(url, ["base64.binary.k8s.io"])
     assert ws.connected, "failed to build the websocket"
     wslog.start_thread(target=wslog.receiver, args=(ws, False))
-    while not found:
-        if time.time() - start > timeout:
-            raise AssertionError(
-                "Timed out waiting for string to match in logs")
-        time.sleep(1)
-        print('shell command and output:\n' + wslog.last_message + '\n')
-        if 'log_type' in wslog.last_message or '{"log"' in wslog.last_message:
-            found = True
-            wslog.last_message = ''
-            break
+    missing = wslog.wait_for(['log_type', '{"log"'], timeout,
+                             require_all=False)
+    print('shell command and output:\n' + wslog.last_message + '\n')
     ws.close()
-    assert found == True
+    if missing:
+        raise AssertionError(
+            "Timed out waiting for string to match in logs")
+    wslog.last_message = ''
 
 
 @pytest.fixture(autouse="True")
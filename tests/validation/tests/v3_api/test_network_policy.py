@@ -64,9 +64,16 @@ def test_connectivity_between_pods():
     allow_connectivity = True
     if PROJECT_ISOLATION == "enabled":
         allow_connectivity = False
-    check_connectivity_between_workloads(
+    report = check_connectivity_between_workloads(
         p_client, workload, p2_client, workload2,
         allow_connectivity=allow_connectivity)
+    # every pair of pods was probed and allowed, or denied with project
+    # isolation, not just some of them
+    sources = p_client.list_pod(workloadId=workload.id).data
+    targets = p2_client.list_pod(workloadId=workload2.id).data
+    expected = {(source.name, target.name): allow_connectivity
+                for source in sources for target in targets}
+    assert report.matrix == expected, report.summary()
 
 
 @pytest.fixture(scope='module', autouse="True")
@@ -514,13 +514,14 @@ def test_rke_custom_host_stress():
                                     driver="rancherKubernetesEngine",
                                     rancherKubernetesEngineConfig=rke_config)
     assert cluster.state == "provisioning"
-    i = 0
-    for aws_node in aws_nodes:
+    # register all hosts at once
+    tasks = []
+    for i, aws_node in enumerate(aws_nodes):
         docker_run_cmd = \
             get_custom_host_registration_cmd(client, cluster, node_roles[i],
                                              aws_node)
-        aws_node.execute_command(docker_run_cmd)
-        i += 1
+        tasks.append((aws_node, docker_run_cmd))
+    ClusterShell().run_tasks(tasks).raise_on_failure()
     cluster = validate_cluster(client, cluster,
                                check_intermediate_state=False)
     cluster_cleanup(client, cluster, aws_nodes)
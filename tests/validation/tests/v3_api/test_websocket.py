@@ -1,12 +1,16 @@
 import base64
+import os
 import pytest
-import time
-import urllib
-from .common import CATTLE_TEST_URL
+from lib.async_websocket import BINARY_PROTOCOL
+from lib.async_websocket import CHANNEL_PROTOCOL
+from lib.async_websocket import WebsocketLoop
 from .common import USER_TOKEN
 from .common import TEST_IMAGE
 from .common import create_kubeconfig
 from .common import create_connection
+from .common import create_websocket_session
+from .common import get_pod_exec_url
+from .common import get_pod_log_url
 from .common import create_project_and_ns
 from .common import get_user_client_and_cluster
 from .common import get_project_client_for_token
@@ -14,6 +18,10 @@ from .common import random_test_name
 from .common import validate_workload
 from .common import WebsocketLogParse
 
+# how long to wait for the expected output of a command or of the logs
+WEBSOCKET_TIMEOUT = 30
+# sessions of each kind opened at once by test_websocket_concurrent_sessions
+WEBSOCKET_SESSIONS = int(os.environ.get('RANCHER_WEBSOCKET_SESSIONS', "5"))
 namespace = {"cluster": None, "shell_url": None, "pod": None, "ns": ""}
 
 
@@ -36,27 +44,8 @@ def test_websocket_launch_kubectl():
 
 
 def test_websocket_exec_shell():
-    url_base = 'wss://' + CATTLE_TEST_URL[8:] + \
-               '/k8s/clusters/' + namespace["cluster"].id + \
-               '/api/v1/namespaces/' + namespace["ns"] + \
-               '/pods/' + namespace["pod"].name + \
-               '/exec?container=' + namespace["pod"].containers[0].name
-    params_dict = {
-        "stdout": 1,
-        "stdin": 1,
-        "stderr": 1,
-        "tty": 1,
-        "command": [
-            '/bin/sh',
-            '-c',
-            'TERM=xterm-256color; export TERM; [ -x /bin/bash ] && ([ -x '
-            '/usr/bin/script ] && /usr/bin/script -q -c "/bin/bash" '
-            '/dev/null || exec /bin/bash) || exec /bin/sh '
-        ]
-    }
-    params = urllib.parse.urlencode(params_dict, doseq=True,
-                                    quote_via=urllib.parse.quote, safe='()')
-    url = url_base + "&" + params
+    url = get_pod_exec_url(namespace["cluster"], namespace["ns"],
+                           namespace["pod"])
     ws = create_connection(url, ["base64.channel.k8s.io"])
     logparse = WebsocketLogParse()
     logparse.start_thread(target=logparse.receiver, args=(ws, True))
@@ -70,32 +59,66 @@ def test_websocket_exec_shell():
 
 
 def test_websocket_view_logs():
-    url_base = 'wss://' + CATTLE_TEST_URL[8:] + \
-               '/k8s/clusters/' + namespace["cluster"].id + \
-               '/api/v1/namespaces/' + namespace["ns"] + \
-               '/pods/' + namespace["pod"].name + \
-               '/log?container=' + namespace["pod"].containers[0].name
-    params_dict = {
-        "tailLines": 500,
-        "follow": True,
-        "timestamps": True,
-        "previous": False,
-    }
-    params = urllib.parse.urlencode(params_dict, doseq=True,
-                                    quote_via=urllib.parse.quote, safe='()')
-    url = url_base + "&" + params
+    url = get_pod_log_url(namespace["cluster"], namespace["ns"],
+                          namespace["pod"])
     ws = create_connection(url, ["base64.binary.k8s.io"])
     logparse = WebsocketLogParse()
     logparse.start_thread(target=logparse.receiver, args=(ws, False))
 
+    missing = logparse.wait_for(['websocket'], timeout=WEBSOCKET_TIMEOUT)
     print('\noutput:\n' + logparse.last_message + '\n')
-    assert 'websocket' in logparse.last_message, \
-        "failed to view logs"
+    assert not missing, "failed to view logs"
     logparse.last_message = ''
 
     ws.close()
 
 
+def test_websocket_concurrent_sessions():
+    """
+    run kubectl shell, exec and log sessions at the same time
+    on one event loop
+    """
+    cluster, ns, pod = namespace["cluster"], namespace["ns"], namespace["pod"]
+    sessions = []
+    for _ in range(WEBSOCKET_SESSIONS):
+        sessions.append(check_session(
+            namespace["shell_url"], CHANNEL_PROTOCOL,
+            "kubectl get ns -o name", ["namespace/kube-system"]))
+        sessions.append(check_session(
+            get_pod_exec_url(cluster, ns, pod), CHANNEL_PROTOCOL,
+            "ls", ["bin", "boot", "dev"]))
+        sessions.append(check_session(
+            get_pod_log_url(cluster, ns, pod), BINARY_PROTOCOL,
+            None, ["websocket"]))
+    loop = WebsocketLoop()
+    try:
+        results = loop.gather(*sessions, return_exceptions=True)
+    finally:
+        loop.close()
+    failures = [r for r in results if r]
+    assert not failures, "{} of {} sessions failed: {}".format(
+        len(failures), len(results), failures)
+
+
+async def check_session(url, protocol, command, checks):
+    """
+    open a session, run the command if any and wait for the checks
+    :return: None if the session passed, or what went wrong
+    """
+    session = create_websocket_session(url, [protocol])
+    await session.connect()
+    try:
+        if command is None:
+            missing = await session.wait_for(checks, WEBSOCKET_TIMEOUT)
+        else:
+            missing = await session.run_command(command, checks,
+                                                WEBSOCKET_TIMEOUT)
+    finally:
+        await session.close()
+    if missing:
+        return "{} is missing {}".format(url, missing)
+
+
 @pytest.fixture(scope='module', autouse="True")
 def create_project_client(request):
     client, cluster = get_user_client_and_cluster()
@@ -132,7 +155,6 @@ def send_a_command(ws_connection, command):
     ws_connection.send('0' + cmd_enc)
     # sends the command to the webSocket
     ws_connection.send('0DQ==')
-    time.sleep(5)
 
 
 def validate_command_execution(websocket, command, log_obj, checking):
@@ -146,7 +168,9 @@ def validate_command_execution(websocket, command, log_obj, checking):
     :return:
     """
 
+    watch = log_obj.buffer.watch(checking)
     send_a_command(websocket, command)
+    watch.event.wait(WEBSOCKET_TIMEOUT)
     print('\nshell command and output:\n' + log_obj.last_message + '\n')
-    for i in checking:
-        assert i in log_obj.last_message, "failed to run the command"
+    assert not watch.missing, \
+        "failed to run the command, missing {}".format(watch.missing)
@@ -0,0 +1,105 @@
+import os
+import pytest
+from lib.async_websocket import CHANNEL_PROTOCOL
+from lib.websocket_load import MockExecServer
+from lib.websocket_load import WebsocketLoadTest
+from .common import USER_TOKEN
+from .common import TEST_IMAGE
+from .common import create_project_and_ns
+from .common import create_websocket_session
+from .common import get_pod_exec_url
+from .common import get_project_client_for_token
+from .common import get_user_client_and_cluster
+from .common import random_test_name
+from .common import validate_workload
+
+# mock runs the load against a local websocket server, rancher against
+# the exec endpoint of a pod proxied by the rancher server
+WEBSOCKET_LOAD_TARGET = os.environ.get('RANCHER_WEBSOCKET_LOAD_TARGET',
+                                       "mock")
+WEBSOCKET_LOAD_SESSIONS = int(
+    os.environ.get('RANCHER_WEBSOCKET_LOAD_SESSIONS', "20"))
+# commands per second typed in each session
+WEBSOCKET_LOAD_RATE = float(os.environ.get('RANCHER_WEBSOCKET_LOAD_RATE',
+                                           "1"))
+WEBSOCKET_LOAD_DURATION = int(
+    os.environ.get('RANCHER_WEBSOCKET_LOAD_DURATION', "30"))
+WEBSOCKET_LOAD_RAMP_UP = int(
+    os.environ.get('RANCHER_WEBSOCKET_LOAD_RAMP_UP', "0"))
+WEBSOCKET_LOAD_MAX_DROP_RATE = float(
+    os.environ.get('RANCHER_WEBSOCKET_LOAD_MAX_DROP_RATE', "0"))
+WEBSOCKET_LOAD_MAX_LOSS_RATE = float(
+    os.environ.get('RANCHER_WEBSOCKET_LOAD_MAX_LOSS_RATE', "0"))
+if_mock_target = pytest.mark.skipif(
+    WEBSOCKET_LOAD_TARGET != "mock",
+    reason='only runs against the mock websocket server')
+
+namespace = {"url": None, "create_session": None}
+
+
+def test_websocket_load_exec():
+    load = WebsocketLoadTest(namespace["url"],
+                             create_session=namespace["create_session"],
+                             sessions=WEBSOCKET_LOAD_SESSIONS,
+                             rate=WEBSOCKET_LOAD_RATE,
+                             duration=WEBSOCKET_LOAD_DURATION,
+                             ramp_up=WEBSOCKET_LOAD_RAMP_UP)
+    report = load.run()
+    assert not report.connect_errors, \
+        "{} sessions failed to connect".format(len(report.connect_errors))
+    assert report.drop_rate <= WEBSOCKET_LOAD_MAX_DROP_RATE, \
+        "{:.1%} of the sessions dropped".format(report.drop_rate)
+    assert report.loss_rate <= WEBSOCKET_LOAD_MAX_LOSS_RATE, \
+        "{:.1%} of the commands got no answer".format(report.loss_rate)
+
+
+@if_mock_target
+def test_websocket_load_reports_drops():
+    """
+    the load test has to see refused and dropped sessions, check it
+    against a mock server refusing half the sessions and closing the
+    others after a few commands
+    """
+    server = MockExecServer(max_sessions=5, drop_after=3)
+    server.start()
+    try:
+        report = WebsocketLoadTest(server.url + "/exec", sessions=10,
+                                   rate=5, duration=5).run()
+    finally:
+        server.shutdown_server()
+    assert len(report.connect_errors) == 5
+    assert report.connected == 5
+    assert report.dropped == 5
+    assert len(report.round_trips) == 15
+
+
+@pytest.fixture(scope='module', autouse="True")
+def create_exec_target(request):
+    if WEBSOCKET_LOAD_TARGET == "mock":
+        server = MockExecServer()
+        server.start()
+        namespace["url"] = server.url + \
+            "/api/v1/namespaces/default/pods/mock/exec"
+        request.addfinalizer(server.shutdown_server)
+        return
+    client, cluster = get_user_client_and_cluster()
+    project, ns = create_project_and_ns(USER_TOKEN,
+                                        cluster,
+                                        random_test_name("websocket-load"))
+    p_client = get_project_client_for_token(project, USER_TOKEN)
+    con = [{"name": random_test_name(),
+            "image": TEST_IMAGE}]
+    wl = p_client.create_workload(name=random_test_name(),
+                                  containers=con,
+                                  namespaceId=ns.id)
+    validate_workload(p_client, wl, "deployment", ns.name)
+    pod = p_client.list_pod(workloadId=wl.id).data[0]
+    namespace["url"] = get_pod_exec_url(cluster, ns.name, pod,
+                                        command=["/bin/sh"], tty=False)
+    namespace["create_session"] = \
+        lambda url: create_websocket_session(url, [CHANNEL_PROTOCOL])
+
+    def fin():
+        client.delete(project)
+
+    request.addfinalizer(fin)